@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, List, Set, Union
+
+from quark import QuarkPanFileManager, QuarkApiError, CAPACITY_CODE, NOT_OWNER_MESSAGE
+from quark_login import QuarkLogin, CONFIG_DIR
+from utils import custom_print
+
+ACCOUNTS_CONFIG = f'{CONFIG_DIR}/accounts.json'
+
+
+class NoAccountAvailable(QuarkApiError):
+    def __init__(self, message: str) -> None:
+        super().__init__(CAPACITY_CODE, message)
+
+
+class Account:
+    # 单个账号的状态：是否可用、容量是否已满、限流冷却到何时、在途任务数
+    def __init__(self, name: str, manager: QuarkPanFileManager, folder_id: str = '0', concurrency: int = 3) -> None:
+        self.name: str = name
+        self.manager: QuarkPanFileManager = manager
+        self.folder_id: str = folder_id
+        self.concurrency: int = concurrency
+        self.inflight: int = 0
+        self.healthy: bool = True
+        self.full: bool = False
+        self.throttled_until: float = 0.0
+        self.throttle_count: int = 0
+        self.free_bytes: Union[int, None] = None
+        self.succeeded: int = 0
+        self.failed: int = 0
+        self.last_error: str = ''
+
+    def usable(self) -> bool:
+        return self.healthy and not self.full
+
+    def available(self, now: float) -> bool:
+        return self.usable() and self.throttled_until <= now and self.inflight < self.concurrency
+
+    def on_throttle(self) -> None:
+        self.throttle_count += 1
+        self.throttled_until = time.monotonic() + min(2 ** self.throttle_count, 120)
+
+    def on_success(self) -> None:
+        self.throttle_count = 0
+        self.succeeded += 1
+
+    def on_failure(self, message: str) -> None:
+        # 链接本身的问题（失效、部分批次失败等）换账号也无济于事，只记录，不影响限流退避
+        self.failed += 1
+        self.last_error = message
+
+
+class AccountPool:
+    # 多账号池：转存任务分配给负载最低的可用账号，容量不足、被限流或出错时切换到其他账号重试；
+    # 下载只能由文件所在的账号完成，非所属账号会返回 NOT_OWNER_MESSAGE，此时同样切换账号
+    def __init__(self, accounts: List[Account], max_failover: int = 3) -> None:
+        if not accounts:
+            raise ValueError('账号池为空')
+        self.accounts: List[Account] = accounts
+        self.max_failover: int = max_failover
+        self._changed: Union[asyncio.Condition, None] = None
+
+    @classmethod
+    def from_config(cls, path: str = ACCOUNTS_CONFIG, **manager_kwargs: Any) -> 'AccountPool':
+        # 配置文件为账号列表，每项包含 name，可选 cookies（Cookie 字符串）、folder_id、concurrency；
+        # 未提供 cookies 时读取 config/accounts/账号名.txt（python quark_login.py 账号名 登录后生成）
+        with open(path, 'r', encoding='utf-8') as f:
+            profiles = json.load(f)
+        accounts = []
+        for profile in profiles:
+            name = profile['name']
+            cookies = profile.get('cookies')
+            if not cookies:
+                cookie = QuarkLogin.for_account(name).check_cookies()
+                cookies = QuarkLogin.dict_to_cookie_str(cookie) if isinstance(cookie, dict) else cookie
+            if not cookies:
+                custom_print(f'账号 {name} 没有可用的 Cookie，已跳过', error_msg=True)
+                continue
+            # 任务日志只由第一个账号记录，其余账号共用同一份缓存与已完成记录
+            kwargs = dict(manager_kwargs, use_journal=manager_kwargs.get('use_journal', True) and not accounts)
+            manager = QuarkPanFileManager(headless=True, cookies=cookies, **kwargs)
+            accounts.append(Account(name, manager, folder_id=str(profile.get('folder_id', '0')),
+                                    concurrency=int(profile.get('concurrency', 3))))
+        return cls(accounts)
+
+    @property
+    def primary(self) -> QuarkPanFileManager:
+        return self.accounts[0].manager
+
+    @property
+    def changed(self) -> asyncio.Condition:
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        return self._changed
+
+    async def __aenter__(self) -> 'AccountPool':
+        await self.check_health()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await asyncio.gather(*(account.manager.close() for account in self.accounts))
+
+    async def check_health(self) -> None:
+        async def check(account: Account) -> None:
+            account.healthy = await account.manager.validate_session()
+            if not account.healthy:
+                account.last_error = 'Cookie 无效或已过期'
+                custom_print(f'账号 {account.name} 登录失效，已停用', error_msg=True)
+                return
+            try:
+                used, total = await account.manager.get_capacity()
+            except Exception:
+                return
+            if total:
+                account.free_bytes = total - used
+                account.full = account.free_bytes <= 0
+
+        await asyncio.gather(*(check(account) for account in self.accounts))
+
+    def pick(self, exclude: Set[str]) -> Union[Account, None]:
+        now = time.monotonic()
+        candidates = [a for a in self.accounts if a.name not in exclude and a.available(now)]
+        if not candidates:
+            return None
+        # 负载低的优先，负载相同时剩余容量大的优先
+        return min(candidates, key=lambda a: (a.inflight / a.concurrency, -(a.free_bytes or 0)))
+
+    async def acquire(self, exclude: Set[str]) -> Account:
+        async with self.changed:
+            while True:
+                account = self.pick(exclude)
+                if account is not None:
+                    account.inflight += 1
+                    return account
+                waiting = [a for a in self.accounts if a.name not in exclude and a.usable()]
+                if not waiting:
+                    raise NoAccountAvailable('没有可用的账号（登录失效或网盘容量不足）')
+                # 所有可用账号都在忙或处于限流冷却中，等到有账号释放或冷却结束
+                cooldown = min(a.throttled_until for a in waiting) - time.monotonic()
+                timeout = cooldown if cooldown > 0 else None
+                try:
+                    await asyncio.wait_for(self.changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def release(self, account: Account) -> None:
+        async with self.changed:
+            account.inflight -= 1
+            self.changed.notify_all()
+
+    async def run(self, url: str, folder_id: Union[str, None] = None, download: bool = False) -> Dict[str, str]:
+        # 与 QuarkPanFileManager.run 参数一致，可作为 batch_run 的 runner；folder_id 被各账号自己的保存目录取代
+        tried: Set[str] = set()
+        throttled = 0
+        result: Union[Dict[str, str], None] = None
+        while True:
+            try:
+                account = await self.acquire(tried)
+            except NoAccountAvailable:
+                if result is not None:
+                    return result
+                raise
+            try:
+                result = await account.manager.run(url, account.folder_id, download=download)
+            except QuarkApiError as e:
+                account.last_error = e.message
+                if e.code == CAPACITY_CODE:
+                    account.full = True
+                    custom_print(f'账号 {account.name} 网盘容量不足，切换其他账号', error_msg=True)
+                elif e.throttled and throttled < 8:
+                    throttled += 1
+                    account.on_throttle()
+                    custom_print(f'账号 {account.name} 请求过于频繁，切换其他账号', error_msg=True)
+                    # 被限流的账号冷却后仍可重试同一链接
+                    continue
+                else:
+                    account.failed += 1
+                    tried.add(account.name)
+                result = QuarkPanFileManager.make_result(url, 'failed', f'{account.name}：{e.message}')
+            except Exception as e:
+                account.failed += 1
+                account.last_error = repr(e)
+                tried.add(account.name)
+                result = QuarkPanFileManager.make_result(url, 'failed', f'{account.name}：{e!r}')
+            else:
+                if result['status'] == 'failed' and result['message'] == NOT_OWNER_MESSAGE:
+                    tried.add(account.name)
+                else:
+                    if result['status'] == 'failed':
+                        account.on_failure(result['message'])
+                    else:
+                        account.on_success()
+                    result['account'] = account.name
+                    return result
+            finally:
+                await self.release(account)
+            if len(tried) > self.max_failover:
+                return result
+
+    async def batch_run(self, urls: List[str], download: bool = False,
+                        concurrency: Union[int, None] = None, **kwargs: Any) -> List[Dict[str, str]]:
+        # 复用第一个账号的批量流程（任务日志、已完成记录、结果汇总），每条链接交给账号池执行
+        concurrency = concurrency or sum(account.concurrency for account in self.accounts)
+        results = await self.primary.batch_run(urls, folder_id='pool', download=download, concurrency=concurrency,
+                                               runner=self.run, **kwargs)
+        self.print_summary()
+        return results
+
+    def print_summary(self) -> None:
+        from prettytable import PrettyTable
+
+        table = PrettyTable(['账号', '状态', '成功', '失败', '剩余容量(GB)', '最近错误'])
+        for account in self.accounts:
+            if not account.healthy:
+                state = '登录失效'
+            elif account.full:
+                state = '容量不足'
+            elif account.throttled_until > time.monotonic():
+                state = '限流冷却'
+            else:
+                state = '正常'
+            free = f'{account.free_bytes / 1024 ** 3:.1f}' if account.free_bytes is not None else '-'
+            table.add_row([account.name, state, account.succeeded, account.failed, free, account.last_error])
+        print(table)
+
+
+if __name__ == '__main__':
+    # 用法：python accounts.py url.txt [download]，按 config/accounts.json 中的账号批量转存或下载
+    import sys
+    from quark import load_url_file
+
+    async def main() -> None:
+        async with AccountPool.from_config() as pool:
+            await pool.batch_run(load_url_file(sys.argv[1] if len(sys.argv) > 1 else 'url.txt'),
+                                 download=len(sys.argv) > 2 and sys.argv[2] == 'download')
+
+    if not os.path.exists(ACCOUNTS_CONFIG):
+        print(f'请先在 {ACCOUNTS_CONFIG} 中配置账号列表')
+        sys.exit(1)
+    asyncio.run(main())
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# 统计一批分享链接转存过程中建立的 TCP 连接数：每次请求新建客户端 vs 共享连接池
+# 用法：python benchmarks/bench_connections.py [链接数量]
+
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+from typing import List
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from quark import QuarkPanFileManager  # noqa: E402
+from mock_server import MockQuarkServer  # noqa: E402
+
+
+class PerCallClientManager(QuarkPanFileManager):
+    # 模拟旧实现：每次调用都创建新的 AsyncClient
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.opened: List[httpx.AsyncClient] = []
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        client = httpx.AsyncClient(timeout=self.timeout)
+        self.opened.append(client)
+        return client
+
+    async def close(self) -> None:
+        for client in self.opened:
+            await client.aclose()
+        self.opened.clear()
+
+
+def build_manager(cls: type, server: MockQuarkServer) -> QuarkPanFileManager:
+    manager = cls(cookies='mock=1', rate_limit=0, listing_cache_ttl=0, use_ledger=False, use_journal=False)
+    manager.api_host = manager.save_host = manager.account_host = server.base_url
+    return manager
+
+
+async def run_batch(manager: QuarkPanFileManager, urls: List[str]) -> float:
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        async with manager:
+            await asyncio.gather(*(manager.run(url, folder_id='0') for url in urls))
+    return time.perf_counter() - start
+
+
+async def main(count: int) -> None:
+    urls = [f'https://pan.quark.cn/s/mock{n:06d}' for n in range(count)]
+    async with MockQuarkServer() as server:
+        print(f'{"模式":<12}{"链接数":>8}{"请求数":>8}{"连接数":>8}{"耗时(s)":>10}')
+        for name, cls in (('per-call', PerCallClientManager), ('pooled', QuarkPanFileManager)):
+            server.reset_counters()
+            elapsed = await run_batch(build_manager(cls, server), urls)
+            print(f'{name:<12}{count:>8}{server.requests:>8}{server.connections:>8}{elapsed:>10.2f}')
+
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
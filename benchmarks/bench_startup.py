@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# 启动耗时基准：用 python -X importtime 统计导入各入口模块的耗时，按顶层包汇总
+# 用法：python benchmarks/bench_startup.py [重复次数] [--report benchmarks/startup_report.md]
+
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ('quark', 'cli')
+HEAVY = ('playwright', 'retrying', 'prettytable', 'tqdm')
+
+
+def import_times(module: str) -> Tuple[int, Dict[str, int]]:
+    # 返回 (模块累计耗时, 各顶层包自身耗时之和)，单位微秒
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=ROOT,
+                          capture_output=True, text=True, check=True)
+    total = 0
+    packages: Dict[str, int] = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0) + int(self_us)
+        if name == module:
+            total = int(cumulative_us)
+    return total, packages
+
+
+def measure(module: str, repeat: int) -> Tuple[float, Dict[str, float]]:
+    totals: List[int] = []
+    packages: Dict[str, List[int]] = {}
+    for _ in range(repeat):
+        total, sample = import_times(module)
+        totals.append(total)
+        for package, us in sample.items():
+            packages.setdefault(package, []).append(us)
+    return statistics.median(totals) / 1000, {k: statistics.median(v) / 1000 for k, v in packages.items()}
+
+
+def render(repeat: int) -> str:
+    lines = [f'导入耗时（{repeat} 次取中位数，单位 ms，Python {sys.version.split()[0]}）', '']
+    for module in MODULES:
+        total, packages = measure(module, repeat)
+        loaded = [name for name in HEAVY if name in packages]
+        lines.append(f"import {module}: {total:.1f} ms，加载的重型依赖：{', '.join(loaded) or '无'}")
+        for package, ms in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:8]:
+            lines.append(f'    {package:<20} {ms:8.1f}')
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def main() -> None:
+    args = sys.argv[1:]
+    report = None
+    if '--report' in args:
+        index = args.index('--report')
+        report = args[index + 1]
+        del args[index:index + 2]
+    repeat = int(args[0]) if args else 5
+    text = render(repeat)
+    print(text)
+    if report:
+        with open(report, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+# 端到端基准：在本地模拟服务上测量批量转存、目录树遍历、批量分享与下载吞吐，结果可保存为 JSON 并与上次结果对比
+# 用法：python benchmarks/bench_suite.py [save list share download] [--latency 0.02] [--json out.json]
+#      [--compare baseline.json]，其余参数见 --help；同样的场景也可以用 pytest benchmarks 运行（需要 pytest-benchmark）
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Tuple, Union
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from quark import QuarkPanFileManager  # noqa: E402
+from walker import walk_tree  # noqa: E402
+from limiter import BandwidthLimiter, parse_rate  # noqa: E402
+from mock_server import MockQuarkServer, FileBody  # noqa: E402
+
+SCENARIOS = ('save', 'list', 'share', 'download')
+
+
+def build_manager(server: MockQuarkServer, **kwargs: Any) -> QuarkPanFileManager:
+    manager = QuarkPanFileManager(cookies='mock=1', rate_limit=0, listing_cache_ttl=0, use_ledger=False,
+                                  use_journal=False, **kwargs)
+    manager.api_host = manager.save_host = manager.account_host = server.base_url
+    return manager
+
+
+def server_options(args: argparse.Namespace) -> Dict[str, Any]:
+    return {'latency': args.latency, 'jitter': args.jitter, 'page_limit': args.page_limit,
+            'task_delay': args.task_delay, 'failure_rate': args.failure_rate, 'throttle_rate': args.throttle_rate,
+            'truncate_rate': args.truncate_rate, 'corrupt_rate': args.corrupt_rate, 'seed': args.seed}
+
+
+async def bench_save(args: argparse.Namespace) -> Tuple[int, int, MockQuarkServer]:
+    urls = [f'https://pan.quark.cn/s/mock{n:06d}' for n in range(args.links)]
+    async with MockQuarkServer(**server_options(args)) as server:
+        async with build_manager(server) as manager:
+            results = await manager.batch_run(urls, folder_id='0', concurrency=args.concurrency, skip_known=False)
+    failed = sum(1 for result in results if result['status'] == 'failed')
+    return len(urls), failed, server
+
+
+async def bench_list(args: argparse.Namespace) -> Tuple[int, int, MockQuarkServer]:
+    tree = (args.depth, args.dirs, args.files)
+    async with MockQuarkServer(tree=tree, **server_options(args)) as server:
+        async with build_manager(server) as manager:
+            async def list_dir(fid: str, updated_at: Any) -> List[Dict[str, Any]]:
+                return await manager.get_all_sorted_file_list(fid)
+
+            count = 0
+            try:
+                async for _, _ in walk_tree(list_dir, [('0', '', None)], workers=manager.list_concurrency):
+                    count += 1
+            except Exception as e:
+                # 列表接口不重试，任何一页失败都会中止遍历，未遍历到的条目计为失败
+                print(f'遍历中止：{e!r}', file=sys.stderr)
+    return len(server.nodes), len(server.nodes) - count, server
+
+
+async def bench_share(args: argparse.Namespace) -> Tuple[int, int, MockQuarkServer]:
+    # 与 share_run 相同的两级目录结构：根目录下的每个一级目录中的二级目录各生成一个分享链接
+    async with MockQuarkServer(tree=(3, args.dirs, 0), **server_options(args)) as server:
+        units = []
+        for first in server.children['0']:
+            for second in server.children[first]:
+                units.append((len(units) + 1, server.nodes[first]['file_name'], server.nodes[second]['file_name'],
+                              second))
+        async with build_manager(server) as manager:
+            results = await manager.share_folders(units, lambda result: None, concurrency=args.concurrency, rate=0)
+    return len(units), sum(1 for result in results if not result['share_url']), server
+
+
+async def bench_download(args: argparse.Namespace) -> Tuple[int, int, MockQuarkServer]:
+    async with MockQuarkServer(tree=(1, 0, args.download_files), file_size=args.file_size * 1024 * 1024,
+                               share_is_owner=True, **server_options(args)) as server:
+        with tempfile.TemporaryDirectory() as folder:
+            bandwidth = BandwidthLimiter(args.limit_rate, args.per_file_rate) \
+                if args.limit_rate or args.per_file_rate else None
+            async with build_manager(server, download_folder=folder, bandwidth=bandwidth) as manager:
+                await manager.run('https://pan.quark.cn/s/mockdownload', folder_id='0', download=True)
+            # 逐个校验下载内容，截断或错位的分片都会计为失败
+            failed = 0
+            for node in server.files():
+                path = os.path.join(folder, node['file_name'])
+                if not os.path.exists(path):
+                    failed += 1
+                    continue
+                with open(path, 'rb') as f:
+                    if f.read() != FileBody.content(node['fid'], node['size']):
+                        failed += 1
+    return args.download_files, failed, server
+
+
+BENCHES: Dict[str, Tuple[Callable, str]] = {
+    'save': (bench_save, '链接/s'),
+    'list': (bench_list, '条目/s'),
+    'share': (bench_share, '分享/s'),
+    'download': (bench_download, 'MB/s'),
+}
+
+
+async def measure(name: str, args: argparse.Namespace) -> Dict[str, Any]:
+    bench, unit = BENCHES[name]
+    samples = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            units, failed, server = await bench(args)
+        samples.append((time.perf_counter() - start, units, failed, server))
+    # 取耗时居中的一次作为结果
+    elapsed, units, failed, server = sorted(samples, key=lambda sample: sample[0])[len(samples) // 2]
+    amount = args.download_files * args.file_size if name == 'download' else units
+    return {'name': name, 'units': units, 'failed': failed, 'elapsed': elapsed, 'rate': amount / elapsed,
+            'unit': unit, 'requests': server.requests, 'connections': server.connections,
+            'bytes_sent': server.bytes_sent}
+
+
+def print_results(results: List[Dict[str, Any]], baseline: Dict[str, Dict[str, Any]]) -> None:
+    print(f'{"场景":<10}{"单元数":>8}{"失败":>6}{"请求数":>8}{"连接数":>8}{"耗时(s)":>10}{"吞吐":>12}  {"对比":>8}')
+    for result in results:
+        previous = baseline.get(result['name'])
+        delta = f"{(result['rate'] / previous['rate'] - 1) * 100:+.1f}%" if previous and previous['rate'] else '-'
+        print(f"{result['name']:<10}{result['units']:>8}{result['failed']:>6}{result['requests']:>8}"
+              f"{result['connections']:>8}{result['elapsed']:>10.2f}{result['rate']:>12.1f}  {delta:>8} "
+              f"{result['unit']}")
+
+
+def parse_args(argv: Union[List[str], None] = None) -> argparse.Namespace:
+    # argv 为 None 时读取命令行参数，test_bench.py 传入各场景的参数
+    parser = argparse.ArgumentParser(description='夸克网盘工具端到端基准')
+    parser.add_argument('scenarios', nargs='*', help=f"要运行的场景（{' '.join(SCENARIOS)}），默认全部")
+    parser.add_argument('--repeat', type=int, default=3, help='每个场景重复次数，取耗时中位数')
+    parser.add_argument('--concurrency', type=int, default=5, help='批量转存与分享的并发数')
+    parser.add_argument('--links', type=int, default=200, help='批量转存的链接数')
+    parser.add_argument('--depth', type=int, default=4, help='目录树层数')
+    parser.add_argument('--dirs', type=int, default=4, help='每个文件夹下的子文件夹数')
+    parser.add_argument('--files', type=int, default=20, help='每个文件夹下的文件数')
+    parser.add_argument('--download-files', type=int, default=8, help='下载的文件数')
+    parser.add_argument('--file-size', type=int, default=16, help='下载的单个文件大小（MB）')
+    parser.add_argument('--limit-rate', type=parse_rate, default=0.0, help='下载合计限速，如 20M')
+    parser.add_argument('--per-file-rate', type=parse_rate, default=0.0, help='单个文件限速，如 4M')
+    parser.add_argument('--latency', type=float, default=0.0, help='每个请求的附加延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='附加延迟的随机抖动上限（秒）')
+    parser.add_argument('--page-limit', type=int, default=None, help='列表接口每页最多返回的条数')
+    parser.add_argument('--task-delay', type=float, default=0.0, help='转存/分享任务完成所需时间（秒）')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='请求返回 500 的概率')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='请求返回 429 的概率')
+    parser.add_argument('--truncate-rate', type=float, default=0.0, help='文件传输中途断开的概率')
+    parser.add_argument('--corrupt-rate', type=float, default=0.0, help='文件内容传输出错的概率')
+    parser.add_argument('--seed', type=int, default=None, help='故障注入的随机种子')
+    parser.add_argument('--json', help='将结果保存为 JSON 文件')
+    parser.add_argument('--compare', help='与之前保存的 JSON 结果对比吞吐')
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知场景：{' '.join(unknown)}")
+    args.scenarios = args.scenarios or list(SCENARIOS)
+    return args
+
+
+async def main(args: argparse.Namespace) -> None:
+    baseline = {}
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = {result['name']: result for result in json.load(f)['results']}
+    results = [await measure(name, args) for name in args.scenarios]
+    print_results(results, baseline)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'timestamp': time.time(), 'python': sys.version.split()[0], 'options': vars(args),
+                       'results': results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
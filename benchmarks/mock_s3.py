@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+# 本地 S3 兼容对象存储模拟（代替 MinIO），支持 PUT/GET 对象与分段上传，并按 SigV4 校验每个请求的签名
+
+import asyncio
+import datetime
+import hashlib
+import os
+import re
+import sys
+import uuid
+from typing import Any, Dict, Tuple, Union
+from urllib.parse import urlsplit, parse_qs, unquote
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import sign_v4  # noqa: E402
+from mock_server import MockQuarkServer  # noqa: E402
+
+MIN_PART_SIZE = 5 * 1024 * 1024
+AUTH_PATTERN = re.compile(r'Credential=([^/]+)/([^,]+), SignedHeaders=([^,]+), Signature=(\w+)')
+
+
+class MockS3Server(MockQuarkServer):
+    # 复用 MockQuarkServer 的 HTTP 处理，地址为 /bucket/key；part_delay 为每个分段上传的附加延迟（秒），
+    # 用于观察下载在缓冲区用完时是否等待上传
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, access_key: str = 'minioadmin',
+                 secret_key: str = 'minioadmin', region: str = 'us-east-1', part_delay: float = 0.0,
+                 seed: Union[int, None] = None, **kwargs: Any) -> None:
+        super().__init__(host, port, tree=(0, 0, 0), seed=seed, **kwargs)
+        self.access_key: str = access_key
+        self.secret_key: str = secret_key
+        self.region: str = region
+        self.part_delay: float = part_delay
+        self.objects: Dict[str, bytes] = {}
+        self.uploads: Dict[str, Dict[str, Any]] = {}
+        self.completed: int = 0
+        self.aborted: int = 0
+        self.parts_received: int = 0
+        self.active_parts: int = 0
+        self.peak_active_parts: int = 0
+
+    def verify_signature(self, method: str, target: str, headers: Dict[str, str], body: bytes) -> bool:
+        match = AUTH_PATTERN.search(headers.get('authorization', ''))
+        if not match or match.group(1) != self.access_key:
+            return False
+        payload_hash = headers.get('x-amz-content-sha256', '')
+        if payload_hash != 'UNSIGNED-PAYLOAD' and payload_hash != hashlib.sha256(body).hexdigest():
+            return False
+        now = datetime.datetime.strptime(headers.get('x-amz-date', ''), '%Y%m%dT%H%M%SZ').replace(
+            tzinfo=datetime.timezone.utc)
+        signed = [name for name in match.group(3).split(';')
+                  if name not in ('host', 'x-amz-date', 'x-amz-content-sha256')]
+        expected = sign_v4(method, f"http://{headers.get('host', '')}{target}",
+                           {name: headers.get(name, '') for name in signed}, payload_hash, self.access_key,
+                           self.secret_key, self.region, now=now)
+        return expected['Authorization'].rsplit('Signature=', 1)[1] == match.group(4)
+
+    @staticmethod
+    def xml(status: int, body: str, headers: Union[Dict[str, str], None] = None) -> Tuple[int, bytes, Dict[str, str]]:
+        return status, f'<?xml version="1.0" encoding="UTF-8"?>{body}'.encode('utf-8'), headers or {}
+
+    def s3_error(self, status: int, code: str) -> Tuple[int, bytes, Dict[str, str]]:
+        return self.xml(status, f'<Error><Code>{code}</Code></Error>')
+
+    async def respond(self, method: str, target: str, headers: Dict[str, str], body: bytes):
+        url = urlsplit(target)
+        query = {k: v[0] for k, v in parse_qs(url.query, keep_blank_values=True).items()}
+        self.hits[method] = self.hits.get(method, 0) + 1
+        await self.delay()
+        failure = self.injected_failure()
+        if failure:
+            return self.s3_error(failure[0], 'InternalError' if failure[0] == 500 else 'SlowDown')
+        if not self.verify_signature(method, target, headers, body):
+            return self.s3_error(403, 'SignatureDoesNotMatch')
+        key = unquote(url.path.lstrip('/'))
+
+        if method == 'POST' and 'uploads' in query:
+            upload_id = uuid.uuid4().hex
+            self.uploads[upload_id] = {'key': key, 'parts': {}}
+            return self.xml(200, f'<InitiateMultipartUploadResult><UploadId>{upload_id}</UploadId>'
+                                 f'</InitiateMultipartUploadResult>')
+        if 'uploadId' in query:
+            upload = self.uploads.get(query['uploadId'])
+            if upload is None or upload['key'] != key:
+                return self.s3_error(404, 'NoSuchUpload')
+            if method == 'PUT':
+                self.active_parts += 1
+                self.peak_active_parts = max(self.peak_active_parts, self.active_parts)
+                try:
+                    if self.part_delay:
+                        await asyncio.sleep(self.part_delay)
+                finally:
+                    self.active_parts -= 1
+                upload['parts'][int(query['partNumber'])] = body
+                self.parts_received += 1
+                return 200, b'', {'ETag': f'"{hashlib.md5(body).hexdigest()}"'}
+            if method == 'DELETE':
+                del self.uploads[query['uploadId']]
+                self.aborted += 1
+                return 204, b'', {}
+            if method == 'POST':
+                requested = re.findall(r'<PartNumber>(\d+)</PartNumber><ETag>"?(\w+)"?</ETag>', body.decode())
+                parts = upload['parts']
+                for index, (number, etag) in enumerate(requested):
+                    part = parts.get(int(number))
+                    if part is None or hashlib.md5(part).hexdigest() != etag:
+                        return self.s3_error(400, 'InvalidPart')
+                    if index < len(requested) - 1 and len(part) < MIN_PART_SIZE:
+                        return self.s3_error(400, 'EntityTooSmall')
+                self.objects[key] = b''.join(parts[int(number)] for number, _ in requested)
+                del self.uploads[query['uploadId']]
+                self.completed += 1
+                return self.xml(200, f'<CompleteMultipartUploadResult><Key>{key}</Key>'
+                                     f'</CompleteMultipartUploadResult>')
+        if method == 'PUT':
+            self.objects[key] = body
+            self.completed += 1
+            return 200, b'', {'ETag': f'"{hashlib.md5(body).hexdigest()}"'}
+        if method == 'GET':
+            if key not in self.objects:
+                return self.s3_error(404, 'NoSuchKey')
+            return 200, self.objects[key], {}
+        return self.s3_error(405, 'MethodNotAllowed')
@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import hashlib
+import json
+import random
+import time
+import uuid
+from typing import Callable, Dict, List, Tuple, Any, Union
+from urllib.parse import urlsplit, parse_qs
+
+Handler = Callable[[str, Dict[str, str], bytes], Tuple[int, Union[Dict[str, Any], bytes, 'FileBody'], Dict[str, str]]]
+
+BODY_CHUNK = 256 * 1024
+
+
+class FileBody:
+    # 按需生成的文件内容，内容由 fid 与偏移量决定，可校验下载结果且不必在内存中保存大文件
+    def __init__(self, fid: str, start: int, end: int) -> None:
+        self.fid: str = fid
+        self.start: int = start
+        self.end: int = end
+
+    def __len__(self) -> int:
+        return self.end - self.start + 1
+
+    @staticmethod
+    def pattern(fid: str) -> bytes:
+        seed = fid.encode('utf-8')
+        return bytes((seed[i % len(seed)] + i) % 256 for i in range(4096))
+
+    @classmethod
+    def content(cls, fid: str, size: int) -> bytes:
+        pattern = cls.pattern(fid)
+        return (pattern * (size // len(pattern) + 1))[:size]
+
+    def chunks(self) -> List[bytes]:
+        pattern = self.pattern(self.fid)
+        result = []
+        position = self.start
+        while position <= self.end:
+            length = min(BODY_CHUNK, self.end + 1 - position)
+            offset = position % len(pattern)
+            repeated = pattern * ((offset + length) // len(pattern) + 1)
+            result.append(repeated[offset:offset + length])
+            position += length
+        return result
+
+
+class MockQuarkServer:
+    # 本地 HTTP/1.1 夸克接口模拟服务，统计 TCP 连接数（即握手次数）与请求数
+    # tree 为 (层数, 每个文件夹下的子文件夹数, 每个文件夹下的文件数)，网盘与分享内容共用这棵目录树；
+    # latency/jitter 为每个请求的附加延迟（秒），page_limit 限制每页条数，task_delay 为转存/分享任务完成所需时间，
+    # failure_rate、throttle_rate、truncate_rate、corrupt_rate 分别为返回 500、返回 429、文件传输中途断开、
+    # 传输内容中有一个字节出错的概率；url_ttl 大于 0 时下载地址带有 Expires 参数，过期后请求返回 403
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, tree: Tuple[int, int, int] = (1, 0, 3),
+                 file_size: int = 1024, latency: float = 0.0, jitter: float = 0.0,
+                 page_limit: Union[int, None] = None, task_delay: float = 0.0, share_is_owner: bool = False,
+                 failure_rate: float = 0.0, throttle_rate: float = 0.0, truncate_rate: float = 0.0,
+                 corrupt_rate: float = 0.0, url_ttl: float = 0.0, seed: Union[int, None] = None) -> None:
+        self.host: str = host
+        self.port: int = port
+        self.file_size: int = file_size
+        self.latency: float = latency
+        self.jitter: float = jitter
+        self.page_limit: Union[int, None] = page_limit
+        self.task_delay: float = task_delay
+        self.share_is_owner: bool = share_is_owner
+        self.failure_rate: float = failure_rate
+        self.throttle_rate: float = throttle_rate
+        self.truncate_rate: float = truncate_rate
+        self.corrupt_rate: float = corrupt_rate
+        self.url_ttl: float = url_ttl
+        self.expired_hits: int = 0
+        self.md5s: Dict[str, str] = {}
+        self.random: random.Random = random.Random(seed)
+        self.connections: int = 0
+        self.requests: int = 0
+        self.bytes_sent: int = 0
+        self.hits: Dict[str, int] = {}
+        self.nodes: Dict[str, Dict[str, Any]] = {}
+        self.children: Dict[str, List[str]] = {'0': []}
+        self.tasks: Dict[str, Dict[str, Any]] = {}
+        self.shares: Dict[str, Dict[str, Any]] = {}
+        self._server: Union[asyncio.AbstractServer, None] = None
+        self.build_tree(*tree)
+        self.routes: Dict[str, Handler] = {
+            '/1/clouddrive/share/sharepage/token': self.handle_token,
+            '/1/clouddrive/share/sharepage/detail': self.handle_detail,
+            '/1/clouddrive/share/sharepage/save': self.handle_save,
+            '/1/clouddrive/file/sort': self.handle_sort,
+            '/1/clouddrive/file/download': self.handle_download,
+            '/1/clouddrive/file': self.handle_create_dir,
+            '/1/clouddrive/task': self.handle_task,
+            '/1/clouddrive/share': self.handle_share,
+            '/1/clouddrive/share/password': self.handle_share_password,
+            '/1/clouddrive/member': self.handle_member,
+            '/account/info': self.handle_account_info,
+        }
+
+    @property
+    def base_url(self) -> str:
+        return f'http://{self.host}:{self.port}'
+
+    def reset_counters(self) -> None:
+        self.connections = 0
+        self.requests = 0
+        self.bytes_sent = 0
+        self.hits.clear()
+
+    def add_node(self, pdir_fid: str, file_name: str, is_dir: bool, size: int = 0) -> str:
+        fid = f"{'d' if is_dir else 'f'}{len(self.nodes):06d}"
+        self.nodes[fid] = {
+            'fid': fid,
+            'file_name': file_name,
+            'file_type': 0 if is_dir else 1,
+            'dir': is_dir,
+            'pdir_fid': pdir_fid,
+            'size': size,
+            'status': 1,
+            'include_items': 0,
+            'updated_at': 1700000000000,
+        }
+        self.children.setdefault(pdir_fid, []).append(fid)
+        if is_dir:
+            self.children[fid] = []
+        if pdir_fid in self.nodes:
+            self.nodes[pdir_fid]['include_items'] = len(self.children[pdir_fid])
+        return fid
+
+    def build_tree(self, levels: int, dirs: int, files: int) -> None:
+        current = ['0']
+        for level in range(levels):
+            next_level = []
+            for pdir_fid in current:
+                for n in range(files):
+                    self.add_node(pdir_fid, f'file_{level}_{n}.bin', False, self.file_size)
+                if level < levels - 1:
+                    for n in range(dirs):
+                        next_level.append(self.add_node(pdir_fid, f'dir_{level}_{n}', True))
+            current = next_level
+
+    def files(self) -> List[Dict[str, Any]]:
+        return [node for node in self.nodes.values() if not node['dir']]
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self) -> 'MockQuarkServer':
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.stop()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers: Dict[str, str] = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, value = line.decode('latin-1').split(':', 1)
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                self.requests += 1
+
+                status, payload, extra_headers = await self.respond(method, target, headers, body)
+                if not await self._write_response(writer, status, payload, extra_headers):
+                    break
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, method: str, target: str, headers: Dict[str, str], body: bytes):
+        url = urlsplit(target)
+        query = {k: v[0] for k, v in parse_qs(url.query, keep_blank_values=True).items()}
+        path = '/dl' if url.path.startswith('/dl/') else url.path
+        self.hits[path] = self.hits.get(path, 0) + 1
+        handler = self.routes.get(url.path)
+        if path == '/dl':
+            return await self.dispatch_file(url.path[4:], headers, query)
+        if handler is None:
+            return 404, {'status': 404, 'code': 404, 'message': 'not found'}, {}
+        return await self.dispatch(handler, method, query, body, headers)
+
+    async def delay(self) -> None:
+        wait = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def injected_failure(self) -> Union[Tuple[int, Dict[str, Any], Dict[str, str]], None]:
+        if self.throttle_rate and self.random.random() < self.throttle_rate:
+            return 429, {'status': 429, 'code': 429, 'message': 'too many requests'}, {}
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            return 500, {'status': 500, 'code': 500, 'message': 'internal error'}, {}
+        return None
+
+    async def dispatch(self, handler: Handler, method: str, query: Dict[str, str], body: bytes,
+                       headers: Dict[str, str]) -> Tuple[int, Union[Dict[str, Any], bytes, FileBody], Dict[str, str]]:
+        await self.delay()
+        return self.injected_failure() or handler(method, query, body)
+
+    async def dispatch_file(self, fid: str, headers: Dict[str, str], query: Dict[str, str]):
+        await self.delay()
+        failure = self.injected_failure()
+        if failure:
+            return failure
+        if 'Expires' in query and int(query['Expires']) < time.time():
+            self.expired_hits += 1
+            return 403, {'status': 403, 'code': 403, 'message': 'url expired'}, {}
+        node = self.nodes.get(fid)
+        if node is None or node['dir']:
+            return 404, {'status': 404, 'code': 404, 'message': 'not found'}, {}
+        size = node['size']
+        range_header = headers.get('range', '')
+        if not range_header:
+            return 200, FileBody(fid, 0, size - 1), {'Accept-Ranges': 'bytes'}
+        start_text, end_text = range_header.replace('bytes=', '').split('-')
+        start = int(start_text)
+        end = min(int(end_text), size - 1) if end_text else size - 1
+        if start >= size:
+            return 416, b'', {'Content-Range': f'bytes */{size}'}
+        return 206, FileBody(fid, start, end), {'Content-Range': f'bytes {start}-{end}/{size}',
+                                                'Accept-Ranges': 'bytes'}
+
+    async def _write_response(self, writer: asyncio.StreamWriter, status: int,
+                              payload: Union[Dict[str, Any], bytes, FileBody], extra_headers: Dict[str, str]) -> bool:
+        # 返回 False 表示模拟了传输中断，连接需要关闭
+        if isinstance(payload, FileBody):
+            length = len(payload)
+            content_type = 'application/octet-stream'
+        elif isinstance(payload, bytes):
+            length = len(payload)
+            content_type = 'application/octet-stream'
+        else:
+            payload = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            length = len(payload)
+            content_type = 'application/json;charset=UTF-8'
+        head = [f'HTTP/1.1 {status} OK', f'Content-Type: {content_type}', f'Content-Length: {length}',
+                'Connection: keep-alive']
+        head.extend(f'{k}: {v}' for k, v in extra_headers.items())
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+        if not isinstance(payload, FileBody):
+            writer.write(payload)
+            self.bytes_sent += length
+            await writer.drain()
+            return True
+        chunks = payload.chunks()
+        cut = self.random.randrange(len(chunks)) if self.truncate_rate and \
+            self.random.random() < self.truncate_rate else None
+        if self.corrupt_rate and self.random.random() < self.corrupt_rate:
+            index = self.random.randrange(len(chunks))
+            chunk = bytearray(chunks[index])
+            chunk[self.random.randrange(len(chunk))] ^= 0xff
+            chunks[index] = bytes(chunk)
+        for index, chunk in enumerate(chunks):
+            if index == cut:
+                writer.write(chunk[:len(chunk) // 2])
+                await writer.drain()
+                return False
+            writer.write(chunk)
+            self.bytes_sent += len(chunk)
+            await writer.drain()
+        return True
+
+    @staticmethod
+    def ok(data: Any, metadata: Union[Dict[str, Any], None] = None) -> Tuple[int, Dict[str, Any], Dict[str, str]]:
+        return 200, {'status': 200, 'code': 0, 'message': 'ok', 'data': data, 'metadata': metadata or {}}, {}
+
+    @staticmethod
+    def error(code: int, message: str) -> Tuple[int, Dict[str, Any], Dict[str, str]]:
+        return 200, {'status': 400, 'code': code, 'message': message, 'data': None}, {}
+
+    def page(self, pdir_fid: str, query: Dict[str, str], share_token: str = '') -> Tuple[List[Dict[str, Any]],
+                                                                                           Dict[str, Any]]:
+        fids = self.children.get(pdir_fid, [])
+        size = int(query.get('_size', 50) or 50)
+        if self.page_limit:
+            size = min(size, self.page_limit)
+        page = int(query.get('_page', 1) or 1)
+        items = []
+        for fid in fids[(page - 1) * size:page * size]:
+            item = dict(self.nodes[fid])
+            if share_token:
+                item['share_fid_token'] = f'{share_token}-{fid}'
+            items.append(item)
+        return items, {'_total': len(fids), '_size': size, '_count': len(items), '_page': page}
+
+    def new_task(self, **data: Any) -> str:
+        task_id = uuid.uuid4().hex
+        self.tasks[task_id] = dict(data, created_at=time.monotonic())
+        return task_id
+
+    def handle_token(self, method: str, query: Dict[str, str], body: bytes):
+        pwd_id = json.loads(body)['pwd_id']
+        return self.ok({'stoken': f'stoken-{pwd_id}'})
+
+    def handle_detail(self, method: str, query: Dict[str, str], body: bytes):
+        pwd_id = query.get('pwd_id', '')
+        items, metadata = self.page(query.get('pdir_fid', '0'), query, share_token=f'token-{pwd_id}')
+        return self.ok({'is_owner': 1 if self.share_is_owner else 0, 'list': items}, metadata)
+
+    def handle_sort(self, method: str, query: Dict[str, str], body: bytes):
+        items, metadata = self.page(query.get('pdir_fid', '0'), query)
+        return self.ok({'list': items}, metadata)
+
+    def handle_save(self, method: str, query: Dict[str, str], body: bytes):
+        return self.ok({'task_id': self.new_task(task_title='分享-转存', save_as={'to_pdir_name': 'mock'})})
+
+    def handle_share(self, method: str, query: Dict[str, str], body: bytes):
+        data = json.loads(body)
+        share_id = uuid.uuid4().hex[:12]
+        self.shares[share_id] = {'fid_list': data.get('fid_list', []), 'passcode': data.get('passcode', '')}
+        return self.ok({'task_id': self.new_task(task_title='分享', share_id=share_id)})
+
+    def handle_share_password(self, method: str, query: Dict[str, str], body: bytes):
+        share_id = json.loads(body)['share_id']
+        share = self.shares.get(share_id)
+        if share is None:
+            return self.error(41004, 'share not found')
+        data = {'share_id': share_id, 'share_url': f'https://pan.quark.cn/s/{share_id}'}
+        if share['passcode']:
+            data['passcode'] = share['passcode']
+        return self.ok(data)
+
+    def handle_task(self, method: str, query: Dict[str, str], body: bytes):
+        task_id = query.get('task_id', '')
+        task = self.tasks.get(task_id)
+        if task is None:
+            return self.error(32001, 'task not found')
+        done = time.monotonic() - task['created_at'] >= self.task_delay
+        data = {key: value for key, value in task.items() if key != 'created_at'}
+        return self.ok(dict(data, task_id=task_id, status=2 if done else 1))
+
+    def md5_of(self, fid: str) -> str:
+        # 按 (fid, 大小) 缓存，修改节点大小后重新计算
+        key = f"{fid}:{self.nodes[fid]['size']}"
+        if key not in self.md5s:
+            self.md5s[key] = hashlib.md5(FileBody.content(fid, self.nodes[fid]['size'])).hexdigest()
+        return self.md5s[key]
+
+    def download_url(self, fid: str) -> str:
+        if self.url_ttl > 0:
+            return f'{self.base_url}/dl/{fid}?Expires={int(time.time() + self.url_ttl)}'
+        return f'{self.base_url}/dl/{fid}'
+
+    def handle_download(self, method: str, query: Dict[str, str], body: bytes):
+        items = []
+        for fid in json.loads(body).get('fids', []):
+            node = self.nodes.get(fid)
+            if node is not None and not node['dir']:
+                items.append({'fid': fid, 'file_name': node['file_name'], 'size': node['size'],
+                              'md5': self.md5_of(fid), 'download_url': self.download_url(fid)})
+        return self.ok(items)
+
+    def handle_create_dir(self, method: str, query: Dict[str, str], body: bytes):
+        data = json.loads(body)
+        pdir_fid = data.get('pdir_fid', '0')
+        names = {self.nodes[fid]['file_name'] for fid in self.children.get(pdir_fid, [])}
+        if data['file_name'] in names:
+            return self.error(23008, 'file is doloading[同名冲突]')
+        return self.ok({'fid': self.add_node(pdir_fid, data['file_name'], True)})
+
+    def handle_member(self, method: str, query: Dict[str, str], body: bytes):
+        used = sum(node['size'] for node in self.nodes.values())
+        return self.ok({'use_capacity': used, 'total_capacity': 1024 ** 4})
+
+    def handle_account_info(self, method: str, query: Dict[str, str], body: bytes):
+        return self.ok({'nickname': 'mock-user'})
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# pytest-benchmark 版本的端到端基准：python -m pytest benchmarks [--benchmark-autosave] [--benchmark-compare]
+# 场景与 bench_suite.py 相同，规模较小，每个场景运行 3 轮；各轮都不能有失败的单元
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_suite import BENCHES, SCENARIOS, parse_args  # noqa: E402
+
+OPTIONS = {
+    'save': ['--links', '100'],
+    'list': ['--depth', '4', '--dirs', '4', '--files', '10'],
+    'share': ['--dirs', '4'],
+    'download': ['--download-files', '4', '--file-size', '8'],
+}
+
+
+@pytest.mark.parametrize('scenario', SCENARIOS)
+def test_scenario(benchmark, scenario):
+    args = parse_args([scenario, *OPTIONS[scenario]])
+    bench, unit = BENCHES[scenario]
+    units, failed, server = benchmark.pedantic(lambda: asyncio.run(bench(args)), rounds=3, iterations=1)
+    benchmark.extra_info.update(units=units, unit=unit, requests=server.requests, connections=server.connections)
+    assert units > 0 and failed == 0
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+# 非交互命令行：python cli.py {save,download,share,mkdir,ls,sync} ...
+# 结果以 JSON Lines 输出到 stdout，日志与进度条输出到 stderr；只在显式传入 -i - 时读取 stdin，
+# 不会启动浏览器登录，Cookie 依次取自 --cookies、环境变量 QUARK_COOKIES、config/cookies.txt
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import posixpath
+import sys
+from typing import Any, Dict, List, TextIO, Union
+
+import httpx
+
+from quark import (QuarkPanFileManager, QuarkApiError, BATCH_CONCURRENCY, SHARE_CONCURRENCY, SHARE_RATE, SHARE_DEPTH,
+                   contains_files)
+from quark_login import QuarkLogin, CONFIG_DIR
+from accounts import AccountPool
+from sync import sync, SyncError
+from utils import read_config
+from metrics import METRICS
+from walker import walk_tree
+from result_writer import FORMATS
+from storage import open_sink, StorageError
+from limiter import BandwidthLimiter, parse_rate, parse_schedule
+from entries import FileEntry
+
+EXPIRED_TYPES = {'1': 2, '7': 3, '30': 4, '0': 1}
+LIST_FIELDS = ('fid', 'file_name', 'dir', 'size', 'pdir_fid', 'updated_at')
+
+
+class CliError(Exception):
+    pass
+
+
+class JsonLinesWriter:
+    def __init__(self, stream: TextIO) -> None:
+        self.stream: TextIO = stream
+        self.failed: int = 0
+
+    def emit(self, record: Dict[str, Any], failed: bool = False) -> None:
+        if failed:
+            self.failed += 1
+        self.stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.stream.flush()
+
+
+def resolve_cookies(args: argparse.Namespace) -> str:
+    cookies = args.cookies or os.environ.get('QUARK_COOKIES')
+    if cookies:
+        return cookies.strip()
+    cookie = QuarkLogin(headless=True).check_cookies()
+    if isinstance(cookie, dict):
+        return QuarkLogin.dict_to_cookie_str(cookie)
+    if cookie:
+        return cookie
+    raise CliError('未找到可用的 Cookie，请先运行 python quark_login.py 登录，或通过 --cookies / QUARK_COOKIES 传入')
+
+
+def read_urls(args: argparse.Namespace) -> List[str]:
+    urls = list(args.urls)
+    for path in args.input or []:
+        if path == '-':
+            lines = sys.stdin.read().splitlines()
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                lines = f.read().splitlines()
+        urls.extend(line.strip() for line in lines if 'http' in line)
+    if not urls:
+        raise CliError('没有需要处理的分享地址，请通过参数或 -i 文件（- 表示 stdin）传入')
+    return urls
+
+
+def default_folder_id() -> str:
+    try:
+        return read_config(f'{CONFIG_DIR}/config.json', 'json').get('pdir_id', '0') or '0'
+    except (json.decoder.JSONDecodeError, FileNotFoundError):
+        return '0'
+
+
+def manager_options(args: argparse.Namespace) -> Dict[str, Any]:
+    options = {
+        'rate_limit': args.rate_limit,
+        'listing_cache_ttl': 0 if args.no_cache else 3600,
+        'use_ledger': not args.no_ledger,
+        'use_journal': not args.no_journal,
+        'download_folder': getattr(args, 'output', None) or 'downloads',
+    }
+    if args.command == 'download' and (args.output == '-' or args.output.startswith('s3://')):
+        # 不落盘的目标：保存路径仍以 downloads 为根，S3 的对象键为相对于它的路径
+        options.update(download_folder='downloads', sink=open_sink(args.output, root='downloads'))
+    if getattr(args, 'limit_rate', None) or getattr(args, 'per_file_rate', None) or getattr(args, 'schedule', None):
+        # 同一个限速器传给所有账号的 manager，全局速率对整个进程生效
+        options['bandwidth'] = BandwidthLimiter(args.limit_rate, args.per_file_rate, args.schedule)
+    return options
+
+
+def build_manager(args: argparse.Namespace) -> QuarkPanFileManager:
+    return QuarkPanFileManager(headless=True, cookies=resolve_cookies(args), **manager_options(args))
+
+
+async def cmd_transfer(manager: QuarkPanFileManager, args: argparse.Namespace, writer: JsonLinesWriter) -> None:
+    await manager.batch_run(read_urls(args), args.folder_id or default_folder_id(),
+                            download=args.command == 'download', concurrency=args.concurrency or BATCH_CONCURRENCY,
+                            skip_known=not args.force,
+                            on_result=lambda result: writer.emit(result, failed=result['status'] == 'failed'))
+
+
+async def run_pool(args: argparse.Namespace, writer: JsonLinesWriter) -> None:
+    # 使用 config/accounts.json 中的多个账号分担转存/下载
+    async with AccountPool.from_config(**manager_options(args)) as pool:
+        await pool.batch_run(read_urls(args), download=args.command == 'download',
+                             concurrency=args.concurrency,
+                             skip_known=not args.force,
+                             on_result=lambda result: writer.emit(result, failed=result['status'] == 'failed'))
+
+
+async def cmd_share(manager: QuarkPanFileManager, args: argparse.Namespace, writer: JsonLinesWriter) -> None:
+    def on_result(result: Dict[str, Any]) -> None:
+        writer.emit(result, failed=not result['share_url'])
+
+    await manager.share_run(args.url, url_type=2 if args.password else 1,
+                            expired_type=EXPIRED_TYPES[args.expire], password=args.password or '',
+                            on_result=on_result, depth=args.depth, max_depth=args.max_depth,
+                            predicate=contains_files(args.min_files) if args.min_files is not None else None,
+                            result_format=args.format)
+
+
+async def cmd_mkdir(manager: QuarkPanFileManager, args: argparse.Namespace, writer: JsonLinesWriter) -> None:
+    fid = await manager.create_dir(args.name, pdir_fid=args.parent, switch=args.switch)
+    writer.emit({'file_name': args.name, 'pdir_fid': args.parent, 'fid': fid or ''}, failed=not fid)
+
+
+async def cmd_ls(manager: QuarkPanFileManager, args: argparse.Namespace, writer: JsonLinesWriter) -> None:
+    def record(path: str, entry: Union[FileEntry, Dict[str, Any]]) -> Dict[str, Any]:
+        item = {key: entry.get(key) for key in LIST_FIELDS}
+        item['path'] = posixpath.join(path, entry['file_name'])
+        return item
+
+    if not args.recursive:
+        async for entry in manager.iter_sorted_file_list(args.fid):
+            writer.emit(record('', entry))
+        return
+
+    async def list_dir(fid: str, updated_at: Union[int, None]) -> List[Dict[str, Any]]:
+        return await manager.get_all_sorted_file_list(fid, updated_at=updated_at)
+
+    async for path, entry in walk_tree(list_dir, [(args.fid, '', None)], workers=manager.list_concurrency,
+                                       max_depth=args.max_depth):
+        writer.emit(record(path, entry))
+
+
+async def cmd_sync(manager: QuarkPanFileManager, args: argparse.Namespace, writer: JsonLinesWriter) -> None:
+    counts = await sync(manager, args.source, args.output, delete=args.delete, dry_run=args.dry_run,
+                        on_event=lambda event: writer.emit(event, failed=event['action'] == 'failed'))
+    writer.emit(dict(counts, source=args.source, output=args.output))
+
+
+COMMANDS = {
+    'save': cmd_transfer,
+    'download': cmd_transfer,
+    'share': cmd_share,
+    'mkdir': cmd_mkdir,
+    'ls': cmd_ls,
+    'sync': cmd_sync,
+}
+
+
+def add_bandwidth_arguments(sub: argparse.ArgumentParser) -> None:
+    sub.add_argument('--limit-rate', type=parse_rate, default=0.0,
+                     help='所有下载合计的最大速率，如 10M、512K（字节/秒），0 表示不限制')
+    sub.add_argument('--per-file-rate', type=parse_rate, default=0.0, help='单个文件的最大下载速率，0 表示不限制')
+    sub.add_argument('--schedule', type=parse_schedule,
+                     help='按时段设置合计速率，如 09:00-18:00=2M,23:00-07:00=0，时段外使用 --limit-rate')
+
+
+def build_parser() -> argparse.ArgumentParser:
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--cookies', help='Cookie 字符串，默认读取环境变量 QUARK_COOKIES 或 config/cookies.txt')
+    common.add_argument('--rate-limit', type=float, default=10.0, help='每个域名每秒最多请求数，0 表示不限制')
+    common.add_argument('--no-cache', action='store_true', help='不使用目录列表缓存')
+    common.add_argument('--no-ledger', action='store_true', help='不读写已完成记录')
+    common.add_argument('--no-journal', action='store_true', help='不记录任务断点')
+    common.add_argument('--metrics', help='结束时写入指标，.prom 为 Prometheus 文本，其余为 JSON 快照')
+    common.add_argument('--trace', help='记录调用链并在结束时写入该 JSON Lines 文件')
+
+    parser = argparse.ArgumentParser(prog='cli.py', description='QuarkPanTool 非交互命令行')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    for name, help_text in (('save', '转存分享链接到网盘'), ('download', '下载分享链接中的文件到本地')):
+        sub = subparsers.add_parser(name, parents=[common], help=help_text)
+        sub.add_argument('urls', nargs='*', help='分享地址')
+        sub.add_argument('-i', '--input', action='append', help='分享地址文件（一行一个），- 表示从 stdin 读取')
+        sub.add_argument('--folder-id', help='网盘保存目录ID，默认使用 config/config.json 中的保存目录')
+        sub.add_argument('-c', '--concurrency', type=int,
+                         help=f'同时处理的链接数，默认 {BATCH_CONCURRENCY}，多账号时默认为各账号并发数之和')
+        sub.add_argument('--force', action='store_true', help='不跳过已处理过的链接')
+        sub.add_argument('--accounts', action='store_true', help='使用 config/accounts.json 中的多个账号')
+        if name == 'download':
+            sub.add_argument('-o', '--output', default='downloads',
+                             help='本地保存目录；- 输出到 stdout（结果改为输出到 stderr），s3://bucket/prefix 直接上传到对象存储')
+            add_bandwidth_arguments(sub)
+
+    sub = subparsers.add_parser('share', parents=[common], help='为文件夹下的二级文件夹批量生成分享链接')
+    sub.add_argument('url', help='文件夹网页端页面地址')
+    sub.add_argument('--expire', choices=sorted(EXPIRED_TYPES), default='0', help='分享时长（天），0 表示永久')
+    sub.add_argument('--password', help='提取码，设置后生成加密分享')
+    sub.add_argument('-c', '--concurrency', type=int, default=SHARE_CONCURRENCY, help='同时分享的文件夹数')
+    sub.add_argument('--rate', type=float, default=SHARE_RATE, help='每秒最多发起的分享数')
+    sub.add_argument('--depth', type=int, default=SHARE_DEPTH, help='分享第几层的文件夹，1 为页面内的文件夹')
+    sub.add_argument('--min-files', type=int, help='改为分享直接包含的文件数超过该值的文件夹（不再分享其子文件夹）')
+    sub.add_argument('--max-depth', type=int, help='配合 --min-files 使用，最多遍历的层数')
+    sub.add_argument('--format', choices=FORMATS, default='text',
+                     help='share 目录下分享链接文件的格式：text 为 share_url.txt，csv、jsonl 为同名的 .csv、.jsonl 文件')
+
+    sub = subparsers.add_parser('mkdir', parents=[common], help='创建网盘文件夹')
+    sub.add_argument('name', help='文件夹名称')
+    sub.add_argument('--parent', default='0', help='父文件夹ID，默认根目录')
+    sub.add_argument('--switch', action='store_true', help='创建后将保存目录切换至该文件夹')
+
+    sub = subparsers.add_parser('ls', parents=[common], help='列出网盘文件夹内容')
+    sub.add_argument('fid', nargs='?', default='0', help='文件夹ID，默认根目录')
+    sub.add_argument('-r', '--recursive', action='store_true', help='递归列出子文件夹')
+    sub.add_argument('--max-depth', type=int, help='递归的最大层数')
+
+    sub = subparsers.add_parser('sync', parents=[common], help='把分享链接或网盘文件夹增量同步到本地目录')
+    sub.add_argument('source', help='分享地址、网盘文件夹ID或网页端文件夹地址')
+    sub.add_argument('-o', '--output', required=True, help='本地镜像目录')
+    sub.add_argument('--delete', action='store_true', help='删除远端已不存在的本地文件')
+    sub.add_argument('--dry-run', action='store_true', help='只列出需要处理的文件，不下载也不删除')
+    add_bandwidth_arguments(sub)
+    return parser
+
+
+async def run_command(args: argparse.Namespace, writer: JsonLinesWriter) -> None:
+    if getattr(args, 'accounts', False):
+        await run_pool(args, writer)
+        return
+    manager = build_manager(args)
+    if args.command == 'share':
+        manager.share_concurrency, manager.share_rate = args.concurrency, args.rate
+    async with manager:
+        # 会话校验与命令并发执行，Cookie 失效时尽早中止
+        check = asyncio.create_task(manager.validate_session())
+        work = asyncio.create_task(COMMANDS[args.command](manager, args, writer))
+        await asyncio.wait({check, work}, return_when=asyncio.FIRST_COMPLETED)
+        valid = False
+        try:
+            valid = await check
+        finally:
+            # 校验失败或校验请求本身出错（网络错误等）时都要先停止命令
+            if not valid:
+                work.cancel()
+                await asyncio.gather(work, return_exceptions=True)
+        if not valid:
+            raise CliError('Cookie 无效或已过期，请先运行 python quark_login.py 重新登录')
+        await work
+
+
+def main(argv: Union[List[str], None] = None) -> int:
+    args = build_parser().parse_args(argv)
+    # 文件内容输出到 stdout 时，JSON Lines 改为输出到 stderr
+    writer = JsonLinesWriter(sys.stderr if getattr(args, 'output', None) == '-' else sys.stdout)
+    if args.trace:
+        METRICS.enable_tracing()
+    # 日志输出到 stderr，保证 stdout 只有 JSON Lines
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            asyncio.run(run_command(args, writer))
+        except (CliError, QuarkApiError, SyncError, StorageError, OSError, httpx.HTTPError) as e:
+            # 部分 httpx 异常（如超时）没有错误信息，此时输出异常类型
+            writer.emit({'command': args.command, 'error': str(e) or type(e).__name__})
+            return 2
+        except KeyboardInterrupt:
+            return 130
+        finally:
+            if args.metrics:
+                METRICS.write(args.metrics)
+            if args.trace:
+                METRICS.write(args.trace if args.trace.endswith('.jsonl') else args.trace + '.jsonl')
+    return 1 if writer.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
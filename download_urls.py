@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Tuple, Union
+from urllib.parse import parse_qs, urlsplit
+
+from downloader import DownloadError, DownloadLink
+from metrics import METRICS
+
+# 每次请求下载地址的文件数：当前要下载的文件加上排在它后面的几个文件
+URL_BATCH_SIZE = 10
+# 在地址到期前 EXPIRY_MARGIN 秒即视为过期，留出建立连接的时间
+EXPIRY_MARGIN = 120
+# 地址中没有过期时间时假定的有效期（秒）
+DEFAULT_LIFETIME = 1800
+EXPIRY_PARAMS = ('expires', 'x-oss-expires')
+
+UrlFetcher = Callable[[List[str]], Awaitable[Union[List[Dict[str, Any]], None]]]
+
+
+def url_expires(url: str, now: float, lifetime: float = DEFAULT_LIFETIME) -> float:
+    # 下载地址的签名参数中带有到期时间（Unix 时间戳），没有时按 lifetime 估算
+    for name, values in parse_qs(urlsplit(url).query).items():
+        if name.lower() in EXPIRY_PARAMS:
+            try:
+                return float(int(values[0]))
+            except ValueError:
+                continue
+    return now + lifetime
+
+
+class DownloadUrlManager:
+    # 按需获取下载地址：文件开始下载时才请求地址，同一次请求顺带获取排队中优先级最靠前的几个文件的地址，
+    # 避免一次性获取的地址在慢速下载中途过期；fetch 为 QuarkPanFileManager.get_download_urls
+    # 地址缓存到临近过期为止，过期或被拒绝后由 DownloadLink 重新获取
+    def __init__(self, fetch: UrlFetcher, batch_size: int = URL_BATCH_SIZE, margin: float = EXPIRY_MARGIN,
+                 lifetime: float = DEFAULT_LIFETIME) -> None:
+        self.fetch: UrlFetcher = fetch
+        self.batch_size: int = batch_size
+        self.margin: float = margin
+        self.lifetime: float = lifetime
+        self.requests: int = 0
+        # 尚未获取过地址的文件：fid -> 优先级，与 DownloadScheduler 的排队顺序一致
+        self.pending: Dict[str, float] = {}
+        self.cache: Dict[str, Dict[str, Any]] = {}
+        self._heap: List[Tuple[float, int, str]] = []
+        self._seq = itertools.count()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def link(self, fid: str, priority: float = 0.0) -> DownloadLink:
+        # priority 应与任务加入 DownloadScheduler 时的优先级相同，提前获取的地址正好是接下来要下载的文件
+        if fid not in self.cache:
+            self.pending[fid] = priority
+            heapq.heappush(self._heap, (priority, next(self._seq), fid))
+        return DownloadLink(lambda: self.resolve(fid))
+
+    def fresh(self, fid: str, now: float) -> bool:
+        item = self.cache.get(fid)
+        return item is not None and item['expires'] > now
+
+    async def resolve(self, fid: str) -> Tuple[str, float, Dict[str, Any]]:
+        if not self.fresh(fid, time.time()):
+            future = self._inflight.get(fid) or self._start(fid)
+            await asyncio.shield(future)
+        # 取出后不再缓存，被拒绝后再次获取时会重新请求
+        item = self.cache.pop(fid, None)
+        self.pending.pop(fid, None)
+        if item is None:
+            raise DownloadError(f'获取下载地址失败：{fid}')
+        info = {key: value for key, value in item.items() if key != 'expires'}
+        return item['download_url'], item['expires'], info
+
+    def _start(self, fid: str) -> asyncio.Future:
+        now = time.time()
+        batch = [fid]
+        while self._heap and len(batch) < self.batch_size:
+            _, _, other = heapq.heappop(self._heap)
+            # 已获取、正在获取或已有未过期地址的文件直接丢弃
+            if other != fid and other in self.pending and other not in self._inflight and not self.fresh(other, now):
+                batch.append(other)
+        future = asyncio.ensure_future(self._fetch(batch))
+        # 发起请求的下载被取消时，异常仍视为已处理
+        future.add_done_callback(lambda task: task.cancelled() or task.exception())
+        for item in batch:
+            self._inflight[item] = future
+        return future
+
+    async def _fetch(self, fids: List[str]) -> List[Dict[str, Any]]:
+        self.requests += 1
+        METRICS.inc('quark_download_url_requests_total')
+        try:
+            items = await self.fetch(fids) or []
+        finally:
+            for fid in fids:
+                self._inflight.pop(fid, None)
+        now = time.time()
+        for item in items:
+            expires = url_expires(item['download_url'], now, self.lifetime)
+            # 有效期短于两倍 margin 的地址只提前一半有效期作废，避免每次请求都重新获取
+            expires -= min(self.margin, max(expires - now, 0) / 2)
+            self.cache[item['fid']] = dict(item, expires=expires)
+            self.pending.pop(item['fid'], None)
+        return items
@@ -0,0 +1,509 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import contextlib
+import itertools
+import json
+import math
+import os
+import re
+import time
+from typing import (Any, AsyncContextManager, AsyncIterator, Awaitable, Callable, ContextManager, Dict, List, Set,
+                    Tuple, Union)
+
+import httpx
+
+from metrics import METRICS
+from integrity import StreamHasher, normalize_md5
+from limiter import BandwidthLimiter, TokenBucket
+
+StreamOpener = Callable[..., AsyncContextManager[httpx.Response]]
+ProgressCallback = Callable[[int], None]
+
+MB = 1024 * 1024
+# 一次请求中下载地址被拒绝（403/410）后重新获取地址的次数
+URL_REFRESHES = 3
+
+
+class DownloadError(Exception):
+    pass
+
+
+class IntegrityError(DownloadError):
+    # 下载完成的文件大小或 md5 与服务端不符，文件已移入隔离目录
+    def __init__(self, message: str, quarantine_path: str = '') -> None:
+        super().__init__(message)
+        self.quarantine_path: str = quarantine_path
+
+
+class DownloadLink:
+    # 有有效期的下载地址，由 download_urls.DownloadUrlManager 创建，同一文件的所有连接共用；
+    # 临近过期或被服务端拒绝后，下一次 get 重新获取地址，已下载的数据与分片进度不受影响
+    def __init__(self, resolve: Callable[[], Awaitable[Tuple[str, float, Dict[str, Any]]]]) -> None:
+        self.resolve: Callable[[], Awaitable[Tuple[str, float, Dict[str, Any]]]] = resolve
+        self.url: Union[str, None] = None
+        self.expires: float = 0.0
+        # 获取地址时服务端返回的文件信息（file_name、size、md5 等）
+        self.info: Dict[str, Any] = {}
+        self._lock: asyncio.Lock = asyncio.Lock()
+
+    async def get(self) -> str:
+        async with self._lock:
+            if self.url is None or time.time() >= self.expires:
+                if self.url is not None:
+                    METRICS.inc('quark_download_url_refreshes_total', reason='expired')
+                self.url, self.expires, self.info = await self.resolve()
+        return self.url
+
+    def invalidate(self, url: str) -> None:
+        # 只作废仍在使用的地址，多个分片同时被拒绝时只重新获取一次
+        if url == self.url:
+            self.url = None
+            METRICS.inc('quark_download_url_refreshes_total', reason='rejected')
+
+
+DownloadUrl = Union[str, DownloadLink]
+
+
+def write_at(f, offset: int, data: bytes) -> None:
+    if hasattr(os, 'pwrite'):
+        os.pwrite(f.fileno(), data, offset)
+    else:
+        # Windows 没有 pwrite，协程之间不会在 seek 与 write 之间切换，可以安全使用
+        f.seek(offset)
+        f.write(data)
+
+
+def parse_content_range(value: str) -> Union[int, None]:
+    match = re.match(r'bytes\s+(\d+)-(\d+)/(\d+|\*)', value or '')
+    if not match or match.group(3) == '*':
+        return None
+    return int(match.group(3))
+
+
+class SegmentedDownloader:
+    def __init__(self, stream: StreamOpener, connections: int = 4, chunk_size: int = 8 * MB,
+                 min_split_size: int = 16 * MB, retries: int = 5,
+                 bandwidth: Union[BandwidthLimiter, None] = None) -> None:
+        self.stream: StreamOpener = stream
+        self.connections: int = connections
+        self.chunk_size: int = chunk_size
+        self.min_split_size: int = min_split_size
+        self.retries: int = retries
+        self.bandwidth: Union[BandwidthLimiter, None] = bandwidth
+
+    def transfer(self) -> ContextManager[Union[TokenBucket, None]]:
+        # 每个文件一个单文件限速桶，由该文件的所有分片共享
+        return self.bandwidth.transfer() if self.bandwidth is not None else contextlib.nullcontext()
+
+    async def throttle(self, size: int, transfer: Union[TokenBucket, None]) -> None:
+        if self.bandwidth is not None:
+            await self.bandwidth.consume(size, transfer)
+
+    @staticmethod
+    def part_path(save_path: str) -> str:
+        return save_path + '.part'
+
+    @staticmethod
+    def state_path(save_path: str) -> str:
+        return save_path + '.part.json'
+
+    @staticmethod
+    def quarantine_path(save_path: str) -> str:
+        folder, name = os.path.split(save_path)
+        return os.path.join(folder, '.quarantine', f'{name}.{int(time.time() * 1000)}')
+
+    def load_state(self, save_path: str) -> Union[Dict[str, Union[int, List[int]]], None]:
+        if not os.path.exists(self.part_path(save_path)):
+            return None
+        try:
+            with open(self.state_path(save_path), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            return None
+
+    def save_state(self, save_path: str, size: int, chunk_size: int, done: Set[int]) -> None:
+        state = {'size': size, 'chunk_size': chunk_size, 'done': sorted(done)}
+        tmp_path = self.state_path(save_path) + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path(save_path))
+
+    def finish(self, save_path: str) -> None:
+        os.replace(self.part_path(save_path), save_path)
+        if os.path.exists(self.state_path(save_path)):
+            os.remove(self.state_path(save_path))
+
+    def quarantine(self, save_path: str, reason: str, message: str) -> None:
+        # 校验失败的文件移入同目录下的 .quarantine，分片进度一并清除，重新下载时从头开始
+        target = self.quarantine_path(save_path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(self.part_path(save_path), target)
+        if os.path.exists(self.state_path(save_path)):
+            os.remove(self.state_path(save_path))
+        METRICS.inc('quark_integrity_failures_total', reason=reason)
+        raise IntegrityError(message, target)
+
+    async def verify(self, save_path: str, expected_size: Union[int, None], md5: Union[str, None],
+                     hasher: StreamHasher) -> None:
+        # expected_size 与 md5 为服务端返回的值，没有时跳过对应检查
+        actual = os.path.getsize(self.part_path(save_path))
+        if expected_size is not None and actual != expected_size:
+            self.quarantine(save_path, 'size', f'文件大小不符：{actual}/{expected_size} 字节')
+        if md5:
+            digest = await hasher.hexdigest(self.part_path(save_path))
+            if digest != md5:
+                self.quarantine(save_path, 'md5', f'md5 不符：{digest}/{md5}')
+
+    @contextlib.asynccontextmanager
+    async def open_stream(self, url: DownloadUrl, headers: Dict[str, str]) -> AsyncIterator[httpx.Response]:
+        # url 为 DownloadLink 时，地址过期被拒绝（403/410）后重新获取地址再请求，不计入重试次数
+        for attempt in range(URL_REFRESHES + 1):
+            current = await url.get() if isinstance(url, DownloadLink) else url
+            async with self.stream('GET', current, headers=headers) as response:
+                if response.status_code in (403, 410) and isinstance(url, DownloadLink) and attempt < URL_REFRESHES:
+                    url.invalidate(current)
+                    continue
+                yield response
+                return
+
+    async def probe(self, url: DownloadUrl, headers: Dict[str, str]) -> Union[int, None]:
+        # 返回文件总大小；服务端不支持 Range 时返回 None
+        async with self.open_stream(url, {**headers, 'Range': 'bytes=0-0'}) as response:
+            if response.status_code == 206:
+                return parse_content_range(response.headers.get('content-range', ''))
+            response.raise_for_status()
+            return None
+
+    async def download(self, url: DownloadUrl, save_path: str, headers: Dict[str, str], size: Union[int, None] = None,
+                       progress: Union[ProgressCallback, None] = None, on_size: Union[ProgressCallback, None] = None,
+                       md5: Union[str, None] = None) -> int:
+        # size 与 md5 为服务端返回的文件大小与摘要，下载完成后据此校验，不符时抛出 IntegrityError
+        progress = progress or (lambda n: None)
+        expected_size = size
+        md5 = normalize_md5(md5)
+        hasher = StreamHasher()
+        state = self.load_state(save_path)
+        if state:
+            size = state['size']
+        elif size is None or size >= self.min_split_size:
+            size = await self.probe(url, headers)
+
+        if size is not None and on_size:
+            on_size(size)
+        with self.transfer() as transfer:
+            if size is None or size < self.min_split_size:
+                size = await self.download_single(url, save_path, headers, size, progress, hasher, transfer)
+            else:
+                size = await self.download_segmented(url, save_path, headers, size, state, progress, hasher,
+                                                     transfer)
+        await self.verify(save_path, expected_size, md5, hasher)
+        self.finish(save_path)
+        return size
+
+    async def download_single(self, url: DownloadUrl, save_path: str, headers: Dict[str, str], size: Union[int, None],
+                              progress: ProgressCallback, hasher: StreamHasher,
+                              transfer: Union[TokenBucket, None] = None) -> int:
+        part_path = self.part_path(save_path)
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if offset:
+            progress(offset)
+            hasher.give_up()
+        attempt = 0
+        while True:
+            request_headers = {**headers, 'Range': f'bytes={offset}-'} if offset else headers
+            try:
+                async with self.open_stream(url, request_headers) as response:
+                    if response.status_code == 416 and size is not None and offset >= size:
+                        break
+                    response.raise_for_status()
+                    if offset and response.status_code != 206:
+                        # 服务端忽略了 Range，只能从头开始
+                        progress(-offset)
+                        offset = 0
+                        await hasher.reset()
+                    with open(part_path, 'r+b' if offset else 'wb') as f:
+                        f.seek(offset)
+                        f.truncate()
+                        async for chunk in response.aiter_bytes():
+                            f.write(chunk)
+                            await hasher.feed(offset, chunk)
+                            offset += len(chunk)
+                            progress(len(chunk))
+                            await self.throttle(len(chunk), transfer)
+                if size is None or offset >= size:
+                    break
+                raise DownloadError(f'连接提前关闭，已下载 {offset}/{size} 字节')
+            except (httpx.TransportError, DownloadError):
+                attempt += 1
+                if attempt > self.retries:
+                    raise
+                METRICS.inc('quark_retries_total', operation='download')
+                await asyncio.sleep(min(2 ** attempt, 30))
+        return offset
+
+    async def iter_content(self, url: DownloadUrl, headers: Dict[str, str], size: Union[int, None] = None,
+                           progress: Union[ProgressCallback, None] = None) -> AsyncIterator[bytes]:
+        # 不落盘的存储目标使用：按顺序产出文件内容，连接中断时从已产出的位置续传，已产出的数据不会重复
+        progress = progress or (lambda n: None)
+        with self.transfer() as transfer:
+            async for chunk in self._iter_content(url, headers, size, progress, transfer):
+                yield chunk
+
+    async def _iter_content(self, url: DownloadUrl, headers: Dict[str, str], size: Union[int, None],
+                            progress: ProgressCallback, transfer: Union[TokenBucket, None]) -> AsyncIterator[bytes]:
+        offset = 0
+        attempt = 0
+        while True:
+            request_headers = {**headers, 'Range': f'bytes={offset}-'} if offset else headers
+            resumable = True
+            try:
+                async with self.open_stream(url, request_headers) as response:
+                    if response.status_code == 416 and size is not None and offset >= size:
+                        break
+                    response.raise_for_status()
+                    if offset and response.status_code != 206:
+                        resumable = False
+                        raise DownloadError(f'服务端不支持断点续传，已输出 {offset} 字节')
+                    async for chunk in response.aiter_bytes():
+                        await self.throttle(len(chunk), transfer)
+                        yield chunk
+                        offset += len(chunk)
+                        progress(len(chunk))
+                if size is None or offset >= size:
+                    break
+                raise DownloadError(f'连接提前关闭，已下载 {offset}/{size} 字节')
+            except (httpx.TransportError, DownloadError):
+                attempt += 1
+                if attempt > self.retries or not resumable:
+                    raise
+                METRICS.inc('quark_retries_total', operation='download')
+                await asyncio.sleep(min(2 ** attempt, 30))
+
+    async def download_segmented(self, url: DownloadUrl, save_path: str, headers: Dict[str, str], size: int,
+                                 state: Union[Dict[str, Union[int, List[int]]], None],
+                                 progress: ProgressCallback, hasher: StreamHasher,
+                                 transfer: Union[TokenBucket, None] = None) -> int:
+        part_path = self.part_path(save_path)
+        chunk_size = state['chunk_size'] if state else self.chunk_size
+        chunk_count = (size + chunk_size - 1) // chunk_size
+        done: Set[int] = set(state['done']) if state else set()
+        if done:
+            progress(sum(min(chunk_size, size - index * chunk_size) for index in done))
+            hasher.give_up()
+
+        with open(part_path, 'r+b' if state else 'wb', buffering=0) as f:
+            if not state:
+                f.truncate(size)
+                self.save_state(save_path, size, chunk_size, done)
+
+            queue: asyncio.Queue = asyncio.Queue()
+            for index in range(chunk_count):
+                if index not in done:
+                    queue.put_nowait(index)
+
+            async def fetch_chunk(index: int) -> None:
+                start = index * chunk_size
+                end = min(start + chunk_size, size) - 1
+                position = start
+                attempt = 0
+                while position <= end:
+                    try:
+                        request_headers = {**headers, 'Range': f'bytes={position}-{end}'}
+                        async with self.open_stream(url, request_headers) as response:
+                            if response.status_code != 206:
+                                raise DownloadError(f'分片请求返回状态码 {response.status_code}')
+                            async for chunk in response.aiter_bytes():
+                                chunk = chunk[:end + 1 - position]
+                                write_at(f, position, chunk)
+                                await hasher.feed(position, chunk)
+                                position += len(chunk)
+                                progress(len(chunk))
+                                await self.throttle(len(chunk), transfer)
+                        if position <= end:
+                            raise DownloadError(f'分片 {index} 连接提前关闭')
+                    except (httpx.TransportError, DownloadError):
+                        attempt += 1
+                        if attempt > self.retries:
+                            raise
+                        METRICS.inc('quark_retries_total', operation='download_chunk')
+                        await asyncio.sleep(min(2 ** attempt, 30))
+                done.add(index)
+                self.save_state(save_path, size, chunk_size, done)
+
+            async def worker() -> None:
+                while not queue.empty():
+                    await fetch_chunk(queue.get_nowait())
+
+            workers = [asyncio.create_task(worker()) for _ in range(min(self.connections, queue.qsize()))]
+            try:
+                await asyncio.gather(*workers)
+            except BaseException:
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+                raise
+
+        return size
+
+
+class DownloadScheduler:
+    # 全局并发上限内按优先级（默认文件越小越先）下载，小文件整体请求、大文件自动分片
+    def __init__(self, downloader: SegmentedDownloader, headers: Dict[str, str], concurrency: int = 8,
+                 priority: Union[Callable[[Dict[str, Any]], float], None] = None,
+                 on_complete: Union[Callable[[Dict[str, Any]], None], None] = None,
+                 verify_retries: int = 2, sink: Any = None) -> None:
+        self.downloader: SegmentedDownloader = downloader
+        # sink 为 storage 中的存储目标，未指定时保存到 save_path 所在的本地目录
+        self.sink: Any = sink
+        self.headers: Dict[str, str] = headers
+        self.concurrency: int = concurrency
+        self.priority: Callable[[Dict[str, Any]], float] = priority or self.size_priority
+        self.on_complete: Union[Callable[[Dict[str, Any]], None], None] = on_complete
+        # 校验失败（文件已隔离）后重新排队下载的次数
+        self.verify_retries: int = verify_retries
+        self.queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        # 只保留计数与失败记录，成功的文件不逐个保存，内存占用与文件数无关
+        self.succeeded: int = 0
+        self.failures: List[Dict[str, Any]] = []
+        self.total_bytes: int = 0
+        self.transferred: int = 0
+        self.pbar: Any = None
+        self._seq = itertools.count()
+        self._dequeued: asyncio.Condition = asyncio.Condition()
+
+    @staticmethod
+    def size_priority(job: Dict[str, Any]) -> float:
+        return job['size'] if job['size'] is not None else math.inf
+
+    def add(self, url: DownloadUrl, save_path: str, size: Union[int, None] = None,
+            priority: Union[float, None] = None, key: Union[str, None] = None, md5: Union[str, None] = None) -> None:
+        # 大小为 0 或缺失都视为未知，下载完成后不校验大小
+        size = size or None
+        job = {'url': url, 'save_path': save_path, 'size': size, 'key': key, 'md5': normalize_md5(md5), 'attempts': 0}
+        self.queue.put_nowait((self.priority(job) if priority is None else priority, next(self._seq), job))
+        METRICS.set_gauge('quark_download_queue_depth', self.queue.qsize())
+        if size:
+            self.add_total(size)
+
+    async def wait_room(self, depth: int) -> None:
+        # 等到排队中的文件少于 depth 个，供边获取下载地址边添加任务的调用方控制提前量
+        async with self._dequeued:
+            await self._dequeued.wait_for(lambda: self.queue.qsize() < depth)
+
+    def close(self) -> None:
+        # 每个 worker 收到一个结束标记后退出
+        for _ in range(self.concurrency):
+            self.queue.put_nowait((math.inf, next(self._seq), None))
+
+    def add_total(self, size: int) -> None:
+        self.total_bytes += size
+        if self.pbar is not None:
+            self.pbar.total = self.total_bytes
+            self.pbar.refresh()
+
+    def update(self, n: int) -> None:
+        self.transferred += n
+        if self.pbar is not None:
+            self.pbar.update(n)
+
+    async def download(self, job: Dict[str, Any]) -> None:
+        save_path = job['save_path']
+        name = os.path.basename(save_path)
+        received = 0
+
+        def progress(n: int) -> None:
+            nonlocal received
+            received += n
+            self.update(n)
+
+        def on_size(size: int) -> None:
+            # 记下探测到的大小，重新排队时不会重复计入总量
+            job['size'] = size
+            self.add_total(size)
+
+        start = time.monotonic()
+        try:
+            if isinstance(job['url'], DownloadLink):
+                # 开始下载时才获取地址，md5 以获取地址时服务端返回的为准
+                await job['url'].get()
+                job['md5'] = job['md5'] or normalize_md5(job['url'].info.get('md5'))
+            if self.sink is not None:
+                size = await self.sink.store(self.downloader, job['url'], save_path, self.headers, size=job['size'],
+                                             progress=progress, on_size=None if job['size'] else on_size,
+                                             md5=job['md5'])
+            else:
+                os.makedirs(os.path.dirname(save_path) or '.', exist_ok=True)
+                size = await self.downloader.download(job['url'], save_path, self.headers, size=job['size'],
+                                                      progress=progress, on_size=None if job['size'] else on_size,
+                                                      md5=job['md5'])
+            result = {'name': name, 'path': save_path, 'key': job['key'], 'status': 'ok', 'size': size,
+                      'elapsed': time.monotonic() - start, 'message': ''}
+            self.succeeded += 1
+            METRICS.inc('quark_downloads_total', status='ok')
+            METRICS.inc('quark_download_bytes_total', size or 0)
+            METRICS.observe('quark_download_seconds', result['elapsed'])
+            if self.on_complete:
+                self.on_complete(result)
+        except IntegrityError as e:
+            self.update(-received)
+            if job['attempts'] < self.verify_retries:
+                # 排在队首立即重下；结束标记的优先级为 inf，放在它们之前才不会被遗漏
+                job['attempts'] += 1
+                self.queue.put_nowait((-math.inf, next(self._seq), job))
+                where = f'，已隔离至 {e.quarantine_path}' if e.quarantine_path else ''
+                self.log(f'校验失败{where}，重新下载（第 {job["attempts"]} 次）：{name}，{e}')
+            else:
+                self.fail(job, name, start, e)
+        except Exception as e:
+            self.update(-received)
+            self.fail(job, name, start, e)
+        if self.pbar is not None:
+            self.pbar.set_postfix(files=self.succeeded + len(self.failures), failed=len(self.failures))
+
+    def log(self, message: str) -> None:
+        if self.pbar is not None:
+            self.pbar.write(message)
+        else:
+            print(message)
+
+    def fail(self, job: Dict[str, Any], name: str, start: float, e: Exception) -> None:
+        if job['size']:
+            self.add_total(-job['size'])
+        self.failures.append({'name': name, 'path': job['save_path'], 'key': job['key'], 'status': 'failed',
+                              'size': job['size'], 'elapsed': time.monotonic() - start, 'message': repr(e)})
+        METRICS.inc('quark_downloads_total', status='failed')
+        self.log(f'下载失败：{name}，{e!r}')
+
+    async def worker(self) -> None:
+        while True:
+            _, _, job = await self.queue.get()
+            METRICS.set_gauge('quark_download_queue_depth', self.queue.qsize())
+            async with self._dequeued:
+                self._dequeued.notify_all()
+            if job is None:
+                break
+            await self.download(job)
+
+    async def run(self) -> Dict[str, Any]:
+        from tqdm import tqdm
+
+        start = time.monotonic()
+        with tqdm(total=self.total_bytes or None, unit='B', unit_scale=True, desc='下载进度', ncols=100) as pbar:
+            self.pbar = pbar
+            try:
+                await asyncio.gather(*(self.worker() for _ in range(self.concurrency)))
+            finally:
+                self.pbar = None
+        return self.summary(time.monotonic() - start)
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        return {
+            'files': self.succeeded + len(self.failures),
+            'succeeded': self.succeeded,
+            'failed': len(self.failures),
+            'bytes': self.transferred,
+            'elapsed': elapsed,
+            'speed': self.transferred / elapsed if elapsed > 0 else 0.0,
+            'failures': self.failures,
+        }
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+from typing import Any, Dict, Union
+
+
+class FileEntry:
+    # 分享详情与网盘列表中的一个条目，只保留用到的字段；支持 entry['fid'] / entry.get('size') 的字典式读取，
+    # 可直接交给按字典处理条目的 walk_tree、下载调度等代码；接口没有返回大小（或为 0）时 size 为 None，表示未知
+    __slots__ = ('fid', 'file_name', 'file_type', 'dir', 'pdir_fid', 'include_items', 'share_fid_token', 'status',
+                 'updated_at', 'size')
+
+    def __init__(self, fid: str, file_name: str, file_type: int = 0, dir: bool = False, pdir_fid: str = '',
+                 include_items: Union[int, str] = '', share_fid_token: str = '', status: int = 0,
+                 updated_at: int = 0, size: Union[int, None] = None) -> None:
+        self.fid: str = fid
+        self.file_name: str = file_name
+        self.file_type: int = file_type
+        self.dir: bool = dir
+        self.pdir_fid: str = pdir_fid
+        self.include_items: Union[int, str] = include_items
+        self.share_fid_token: str = share_fid_token
+        self.status: int = status
+        self.updated_at: int = updated_at
+        self.size: Union[int, None] = size
+
+    @classmethod
+    def from_api(cls, file: Dict[str, Any]) -> 'FileEntry':
+        return cls(file['fid'], file['file_name'], file.get('file_type', 0), file['dir'], file.get('pdir_fid', ''),
+                   file.get('include_items', ''), file.get('share_fid_token', ''), file.get('status', 0),
+                   file.get('updated_at', 0), file.get('size') or None)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'FileEntry':
+        return cls(**{key: data[key] for key in cls.__slots__ if key in data})
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: getattr(self, key) for key in self.__slots__}
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default)
+
+    def __repr__(self) -> str:
+        return f"FileEntry({self.fid!r}, {self.file_name!r}, dir={self.dir})"
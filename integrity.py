@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import base64
+import binascii
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, Dict, Union
+
+MB = 1024 * 1024
+# 乱序到达、等待前面数据的暂存上限，超过后改为下载完成后整体计算
+HOLD_LIMIT = 64 * MB
+# 已送入但线程池尚未处理的数据上限，超过后下载协程等待，避免哈希跟不上时占用过多内存
+QUEUE_LIMIT = 16 * MB
+HASH_WORKERS = 2
+
+_executor: Union[ThreadPoolExecutor, None] = None
+
+
+def hash_executor() -> ThreadPoolExecutor:
+    # md5 在处理较大的数据块时会释放 GIL，放在线程池中计算不会阻塞事件循环
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix='quark-hash')
+    return _executor
+
+
+def normalize_md5(value: Union[str, None]) -> Union[str, None]:
+    # 接口返回的 md5 可能是十六进制字符串，也可能是 base64 编码的摘要，统一为小写十六进制
+    if not value:
+        return None
+    value = value.strip()
+    if len(value) == 32:
+        try:
+            int(value, 16)
+            return value.lower()
+        except ValueError:
+            pass
+    try:
+        digest = base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    return digest.hex() if len(digest) == 16 else None
+
+
+def hash_file(path: str, block_size: int = 4 * MB) -> str:
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+class StreamHasher:
+    # 边下载边计算 md5：数据以 (偏移, 内容) 按任意顺序送入，按偏移顺序交给线程池依次计算，不需要再读一遍文件；
+    # 断点续传（已有数据不经过本对象）或乱序暂存超过 HOLD_LIMIT 时放弃增量计算，完成后改为读取整个文件
+    def __init__(self) -> None:
+        self.offset: int = 0
+        self.held: Dict[int, bytes] = {}
+        self.held_bytes: int = 0
+        self.fallback: bool = False
+        self._md5 = hashlib.md5()
+        self._queue: Deque[bytes] = deque()
+        self._queued_bytes: int = 0
+        self._lock: threading.Lock = threading.Lock()
+        self._draining: bool = False
+        self._running: Union[asyncio.Future, None] = None
+
+    def give_up(self) -> None:
+        self.fallback = True
+        self.held.clear()
+        self.held_bytes = 0
+
+    async def feed(self, offset: int, data: bytes) -> None:
+        if self.fallback or not data:
+            return
+        if offset != self.offset:
+            self.held[offset] = data
+            self.held_bytes += len(data)
+            if self.held_bytes > HOLD_LIMIT:
+                self.give_up()
+            return
+        self._submit(data)
+        while self.offset in self.held:
+            data = self.held.pop(self.offset)
+            self.held_bytes -= len(data)
+            self._submit(data)
+        if self._queued_bytes > QUEUE_LIMIT:
+            await self.wait()
+
+    def _submit(self, data: bytes) -> None:
+        self.offset += len(data)
+        with self._lock:
+            self._queue.append(data)
+            self._queued_bytes += len(data)
+            if self._draining:
+                return
+            self._draining = True
+        self._running = asyncio.get_running_loop().run_in_executor(hash_executor(), self._drain)
+
+    def _drain(self) -> None:
+        # 在线程池中运行，同一时刻每个文件只有一个 _drain，保证按顺序计算
+        while True:
+            with self._lock:
+                if not self._queue:
+                    self._draining = False
+                    return
+                data = self._queue.popleft()
+                self._queued_bytes -= len(data)
+            self._md5.update(data)
+
+    async def wait(self) -> None:
+        while self._draining and self._running is not None:
+            await asyncio.shield(self._running)
+
+    async def reset(self) -> None:
+        # 服务端忽略 Range 从头重新下载时调用
+        await self.wait()
+        self.offset = 0
+        self.held.clear()
+        self.held_bytes = 0
+        self.fallback = False
+        self._md5 = hashlib.md5()
+
+    async def hexdigest(self, path: str) -> str:
+        # path 为已写完的文件，无法增量计算时在线程池中读取整个文件
+        await self.wait()
+        if self.fallback or self.held:
+            return await asyncio.get_running_loop().run_in_executor(hash_executor(), hash_file, path)
+        return self._md5.hexdigest()
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+import json
+import sqlite3
+import time
+from typing import Any, Dict, List, Tuple, Union
+
+PENDING = 'pending'
+IN_FLIGHT = 'in-flight'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class JobJournal:
+    # 批量任务日志：每个工作单元的状态在开始与结束时落盘，进程崩溃或中断后重新打开同一任务即可从断点继续，
+    # 已完成的单元不会重做，失败的单元会被重新执行
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+        self.conn: sqlite3.Connection = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )''')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS units (
+                job_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                unit_key TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT NOT NULL DEFAULT '',
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (job_id, unit_key)
+            )''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_units_state ON units (job_id, state)')
+        self.conn.commit()
+
+    def open_job(self, job_id: str, kind: str) -> str:
+        # 未完成的任务继续执行：中断时处于执行中的单元与失败的单元重新置为待执行；
+        # 已全部完成的任务再次打开时视为新任务，清空旧的单元记录
+        now = time.time()
+        row = self.conn.execute('SELECT status FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        if row is None:
+            self.conn.execute('INSERT INTO jobs (job_id, kind, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+                              (job_id, kind, 'running', now, now))
+        elif row['status'] == DONE:
+            self.conn.execute('DELETE FROM units WHERE job_id = ?', (job_id,))
+            self.conn.execute('UPDATE jobs SET status = ?, created_at = ?, updated_at = ? WHERE job_id = ?',
+                              ('running', now, now, job_id))
+        else:
+            self.conn.execute('UPDATE units SET state = ?, updated_at = ? WHERE job_id = ? AND state IN (?, ?)',
+                              (PENDING, now, job_id, IN_FLIGHT, FAILED))
+            self.conn.execute('UPDATE jobs SET status = ?, updated_at = ? WHERE job_id = ?', ('running', now, job_id))
+        self.conn.commit()
+        return job_id
+
+    def add_units(self, job_id: str, units: List[Tuple[str, Dict[str, Any]]]) -> None:
+        # 已存在的单元保持原状态，只追加新的单元
+        now = time.time()
+        start = self.conn.execute('SELECT COALESCE(MAX(seq), -1) + 1 FROM units WHERE job_id = ?',
+                                  (job_id,)).fetchone()[0]
+        existing = {row[0] for row in self.conn.execute('SELECT unit_key FROM units WHERE job_id = ?', (job_id,))}
+        rows = []
+        for unit_key, payload in units:
+            if unit_key in existing:
+                continue
+            existing.add(unit_key)
+            rows.append((job_id, start + len(rows), unit_key, json.dumps(payload, ensure_ascii=False), PENDING, now))
+        self.conn.executemany('INSERT INTO units (job_id, seq, unit_key, payload, state, updated_at) '
+                              'VALUES (?, ?, ?, ?, ?, ?)', rows)
+        self.conn.commit()
+
+    def units(self, job_id: str, states: Union[Tuple[str, ...], None] = None) -> List[Dict[str, Any]]:
+        sql = 'SELECT * FROM units WHERE job_id = ?'
+        args: List[Any] = [job_id]
+        if states:
+            sql += f" AND state IN ({', '.join('?' * len(states))})"
+            args.extend(states)
+        rows = self.conn.execute(sql + ' ORDER BY seq', args).fetchall()
+        return [{
+            'seq': row['seq'],
+            'key': row['unit_key'],
+            'payload': json.loads(row['payload']),
+            'state': row['state'],
+            'attempts': row['attempts'],
+            'result': json.loads(row['result']) if row['result'] else None,
+            'error': row['error'],
+        } for row in rows]
+
+    def _set_state(self, job_id: str, unit_key: str, state: str, result: Any = None, error: str = '',
+                   attempt: bool = False) -> None:
+        self.conn.execute('UPDATE units SET state = ?, result = COALESCE(?, result), error = ?, '
+                          'attempts = attempts + ?, updated_at = ? WHERE job_id = ? AND unit_key = ?',
+                          (state, json.dumps(result, ensure_ascii=False) if result is not None else None, error,
+                           1 if attempt else 0, time.time(), job_id, unit_key))
+        self.conn.commit()
+
+    def start(self, job_id: str, unit_key: str) -> None:
+        self._set_state(job_id, unit_key, IN_FLIGHT, attempt=True)
+
+    def finish(self, job_id: str, unit_key: str, result: Any = None) -> None:
+        self._set_state(job_id, unit_key, DONE, result=result)
+
+    def fail(self, job_id: str, unit_key: str, error: str, result: Any = None) -> None:
+        self._set_state(job_id, unit_key, FAILED, result=result, error=error)
+
+    def release(self, job_id: str, unit_key: str) -> None:
+        # 单元未执行（例如任务被中止），恢复为待执行
+        self._set_state(job_id, unit_key, PENDING)
+
+    def progress(self, job_id: str) -> Dict[str, int]:
+        rows = self.conn.execute('SELECT state, COUNT(*) FROM units WHERE job_id = ? GROUP BY state', (job_id,))
+        counts = {PENDING: 0, IN_FLIGHT: 0, DONE: 0, FAILED: 0}
+        counts.update({row[0]: row[1] for row in rows})
+        return counts
+
+    def close_job(self, job_id: str) -> str:
+        counts = self.progress(job_id)
+        if counts[PENDING] or counts[IN_FLIGHT]:
+            status = 'running'
+        else:
+            status = FAILED if counts[FAILED] else DONE
+        self.conn.execute('UPDATE jobs SET status = ?, updated_at = ? WHERE job_id = ?', (status, time.time(), job_id))
+        self.conn.commit()
+        return status
+
+    def close(self) -> None:
+        self.conn.close()
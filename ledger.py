@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+import csv
+import json
+import os
+import sqlite3
+import sys
+import time
+from typing import Any, Dict, List, Tuple, Union
+
+TABLES = ('transfers', 'downloads')
+
+
+class TransferLedger:
+    # 已完成的转存（按 pwd_id）与下载（按 fid + size）记录，批量任务据此在发起请求前跳过已完成的条目
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+        self.conn: sqlite3.Connection = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS transfers (
+                pwd_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                url TEXT NOT NULL,
+                to_pdir_fid TEXT NOT NULL DEFAULT '',
+                task_id TEXT NOT NULL DEFAULT '',
+                status TEXT NOT NULL,
+                done_at REAL NOT NULL,
+                PRIMARY KEY (pwd_id, kind)
+            )''')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS downloads (
+                fid TEXT PRIMARY KEY,
+                size INTEGER,
+                path TEXT NOT NULL,
+                done_at REAL NOT NULL
+            )''')
+        # 一条链接分批转存时已提交的条目：status 为 submitted（已提交、结果未知）或 saved，
+        # 链接整体转存完成后删除；部分批次失败时，重试只提交不在这里的条目
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS saved_items (
+                pwd_id TEXT NOT NULL,
+                to_pdir_fid TEXT NOT NULL,
+                fid TEXT NOT NULL,
+                task_id TEXT NOT NULL,
+                status TEXT NOT NULL,
+                done_at REAL NOT NULL,
+                PRIMARY KEY (pwd_id, to_pdir_fid, fid)
+            )''')
+        self.conn.commit()
+
+    def has_transfer(self, pwd_id: str, kind: str = 'save') -> bool:
+        row = self.conn.execute('SELECT 1 FROM transfers WHERE pwd_id = ? AND kind = ?', (pwd_id, kind)).fetchone()
+        return row is not None
+
+    def record_transfer(self, pwd_id: str, url: str, kind: str = 'save', status: str = 'saved',
+                        to_pdir_fid: str = '', task_id: str = '') -> None:
+        self.conn.execute('INSERT OR REPLACE INTO transfers (pwd_id, kind, url, to_pdir_fid, task_id, status, done_at) '
+                          'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                          (pwd_id, kind, url, to_pdir_fid or '', task_id or '', status, time.time()))
+        self.conn.commit()
+
+    def saved_items(self, pwd_id: str, to_pdir_fid: str) -> Dict[str, Tuple[str, str]]:
+        # fid -> (status, task_id)
+        rows = self.conn.execute('SELECT fid, status, task_id FROM saved_items WHERE pwd_id = ? AND to_pdir_fid = ?',
+                                 (pwd_id, to_pdir_fid))
+        return {row['fid']: (row['status'], row['task_id']) for row in rows}
+
+    def record_saved_items(self, pwd_id: str, to_pdir_fid: str, fids: List[str], task_id: str,
+                           status: str = 'saved') -> None:
+        now = time.time()
+        self.conn.executemany('INSERT OR REPLACE INTO saved_items (pwd_id, to_pdir_fid, fid, task_id, status, done_at) '
+                              'VALUES (?, ?, ?, ?, ?, ?)',
+                              [(pwd_id, to_pdir_fid, fid, task_id, status, now) for fid in fids])
+        self.conn.commit()
+
+    def forget_saved_items(self, pwd_id: str, to_pdir_fid: Union[str, None] = None,
+                           task_id: Union[str, None] = None) -> None:
+        sql, args = 'DELETE FROM saved_items WHERE pwd_id = ?', [pwd_id]
+        if to_pdir_fid is not None:
+            sql += ' AND to_pdir_fid = ?'
+            args.append(to_pdir_fid)
+        if task_id is not None:
+            sql += ' AND task_id = ?'
+            args.append(task_id)
+        self.conn.execute(sql, args)
+        self.conn.commit()
+
+    def has_download(self, fid: str, size: Union[int, None] = None, check_file: bool = True) -> bool:
+        row = self.conn.execute('SELECT size, path FROM downloads WHERE fid = ?', (fid,)).fetchone()
+        if row is None:
+            return False
+        if size and row['size'] and size != row['size']:
+            return False
+        return not check_file or os.path.exists(row['path'])
+
+    def record_download(self, fid: str, size: Union[int, None], path: str) -> None:
+        self.conn.execute('INSERT OR REPLACE INTO downloads (fid, size, path, done_at) VALUES (?, ?, ?, ?)',
+                          (fid, size, path, time.time()))
+        self.conn.commit()
+
+    def forget(self, table: str, key: str) -> int:
+        column = 'pwd_id' if table == 'transfers' else 'fid'
+        if table == 'transfers':
+            self.forget_saved_items(key)
+        cursor = self.conn.execute(f'DELETE FROM {table} WHERE {column} = ?', (key,))
+        self.conn.commit()
+        return cursor.rowcount
+
+    def query(self, table: str = 'transfers', since: Union[float, None] = None) -> List[Dict[str, Any]]:
+        if table not in TABLES:
+            raise ValueError(f'未知的记录类型：{table}')
+        rows = self.conn.execute(f'SELECT * FROM {table} WHERE done_at >= ? ORDER BY done_at', (since or 0,))
+        return [dict(row) for row in rows]
+
+    def export(self, path: str, table: str = 'transfers', since: Union[float, None] = None) -> int:
+        # 按文件扩展名导出为 csv、json 或 jsonl
+        rows = self.query(table, since)
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            if path.endswith('.csv'):
+                columns = [d[0] for d in self.conn.execute(f'SELECT * FROM {table} LIMIT 0').description]
+                writer = csv.DictWriter(f, fieldnames=columns)
+                writer.writeheader()
+                writer.writerows(rows)
+            elif path.endswith('.jsonl'):
+                for row in rows:
+                    f.write(json.dumps(row, ensure_ascii=False) + '\n')
+            else:
+                json.dump(rows, f, ensure_ascii=False, indent=2)
+        return len(rows)
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+if __name__ == '__main__':
+    # 用法：python ledger.py [transfers|downloads] [导出文件路径]
+    from quark_login import ensure_config_dir
+
+    ledger = TransferLedger(f'{ensure_config_dir()}/ledger.db')
+    table_name = sys.argv[1] if len(sys.argv) > 1 else 'transfers'
+    if len(sys.argv) > 2:
+        count = ledger.export(sys.argv[2], table_name)
+        print(f'已导出 {count} 条记录至 {sys.argv[2]}')
+    else:
+        for record in ledger.query(table_name):
+            print(json.dumps(record, ensure_ascii=False))
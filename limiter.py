@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import contextlib
+import time
+from typing import Dict, Iterator, List, Set, Tuple, Union
+from urllib.parse import urlsplit
+
+
+class TokenBucket:
+    # rate 为每秒补充的令牌数，rate <= 0 表示不限速
+    def __init__(self, rate: float, capacity: Union[float, None] = None) -> None:
+        self.rate: float = rate
+        self.capacity: float = capacity if capacity else max(rate, 1)
+        self._tokens: float = self.capacity
+        self._updated: float = time.monotonic()
+
+    def set_rate(self, rate: float, capacity: Union[float, None] = None) -> None:
+        self._refill()
+        self.rate = rate
+        self.capacity = capacity if capacity else max(rate, 1)
+        self._tokens = min(self._tokens, self.capacity)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if self.rate > 0:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1) -> None:
+        if self.rate <= 0:
+            return
+        # 先扣减令牌再等待，令牌不足时记为欠账，后来者排在其后，保证先到先得且无需加锁
+        self._refill()
+        self._tokens -= tokens
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / self.rate)
+
+
+class HostRateLimiter:
+    def __init__(self, rate: float, capacity: Union[float, None] = None) -> None:
+        self.rate: float = rate
+        self.capacity: Union[float, None] = capacity
+        self.buckets: Dict[str, TokenBucket] = {}
+
+    def bucket(self, url: str) -> TokenBucket:
+        host = urlsplit(url).netloc
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.rate, self.capacity)
+        return self.buckets[host]
+
+    async def acquire(self, url: str) -> None:
+        await self.bucket(url).acquire()
+
+
+class AdaptiveRateLimiter(TokenBucket):
+    # 遇到限流时速率乘性下降，成功后加性恢复，最高不超过初始速率
+    def __init__(self, rate: float, min_rate: float = 0.2, increase: float = 0.1, decrease: float = 0.5) -> None:
+        super().__init__(rate)
+        self.max_rate: float = rate
+        self.min_rate: float = min_rate
+        self.increase: float = increase
+        self.decrease: float = decrease
+
+    def on_success(self) -> None:
+        if self.rate < self.max_rate:
+            self.set_rate(min(self.max_rate, self.rate + self.increase))
+
+    def on_throttle(self) -> None:
+        # 初始速率 <= 0 表示不限速，只依靠调用方的退避等待，不降为 min_rate 后再也无法恢复
+        if self.max_rate > 0:
+            self.set_rate(max(self.min_rate, self.rate * self.decrease))
+
+
+# 带宽令牌桶的突发容量（秒），越小限速越平滑
+BANDWIDTH_BURST = 0.25
+MIN_BURST_BYTES = 64 * 1024
+RATE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def parse_rate(value: Union[str, float, int, None]) -> float:
+    # '10M'、'512K'、'1.5MB/s'、'2000000' -> 每秒字节数；空值或 0 表示不限速
+    if value is None or value == '':
+        return 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = value.strip().upper().removesuffix('/S').removesuffix('B')
+    unit = text[-1] if text and text[-1] in RATE_UNITS else ''
+    try:
+        return float(text[:-1] if unit else text) * RATE_UNITS[unit]
+    except ValueError:
+        raise ValueError(f'无法识别的速率：{value}') from None
+
+
+def parse_schedule(value: str) -> List[Tuple[int, int, float]]:
+    # '09:00-18:00=5M,23:00-07:00=0' -> [(开始分钟, 结束分钟, 每秒字节数)]，结束早于开始表示跨过零点
+    rules = []
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        try:
+            window, rate = item.split('=')
+            start, end = (int(h) * 60 + int(m) for h, m in (t.split(':') for t in window.split('-')))
+        except ValueError:
+            raise ValueError(f'无法识别的时段：{item}，格式为 HH:MM-HH:MM=速率') from None
+        rules.append((start, end, parse_rate(rate)))
+    return rules
+
+
+class BandwidthLimiter:
+    # 下载带宽限速：全局令牌桶由所有传输共享，每个文件另有独立的令牌桶（同一文件的多个分片连接共用），
+    # 每收到一块数据先后向两者申请同等字节数的令牌；令牌不足时暂停读取，TCP 接收窗口随之收紧，发送端也会放慢
+    # 速率 <= 0 表示不限速；rate、per_file 可在运行中修改，schedule 为按本地时间生效的全局速率，时段外使用 rate
+    def __init__(self, rate: float = 0, per_file: float = 0,
+                 schedule: Union[List[Tuple[int, int, float]], None] = None) -> None:
+        self.rate: float = rate
+        self.per_file: float = per_file
+        self.schedule: List[Tuple[int, int, float]] = schedule or []
+        self.bucket: TokenBucket = TokenBucket(rate, self.capacity(rate))
+        self.transfers: Set[TokenBucket] = set()
+        self._checked_minute: Union[int, None] = None
+
+    @staticmethod
+    def capacity(rate: float) -> float:
+        return max(rate * BANDWIDTH_BURST, MIN_BURST_BYTES)
+
+    def current_rate(self, now: Union[time.struct_time, None] = None) -> float:
+        now = now or time.localtime()
+        minute = now.tm_hour * 60 + now.tm_min
+        for start, end, rate in self.schedule:
+            if (start <= minute < end) if start <= end else (minute >= start or minute < end):
+                return rate
+        return self.rate
+
+    def set_rate(self, rate: float) -> None:
+        # 修改时段外的全局速率，当前不在任何时段内时立即生效
+        self.rate = rate
+        self._checked_minute = None
+        self.apply_schedule()
+
+    def set_per_file_rate(self, rate: float) -> None:
+        self.per_file = rate
+        for bucket in self.transfers:
+            bucket.set_rate(rate, self.capacity(rate))
+
+    def set_schedule(self, schedule: List[Tuple[int, int, float]]) -> None:
+        self.schedule = schedule
+        self._checked_minute = None
+        self.apply_schedule()
+
+    def apply_schedule(self) -> None:
+        # 每分钟最多检查一次当前时段
+        now = time.localtime()
+        minute = now.tm_hour * 60 + now.tm_min
+        if minute == self._checked_minute:
+            return
+        self._checked_minute = minute
+        rate = self.current_rate(now)
+        if rate != self.bucket.rate:
+            self.bucket.set_rate(rate, self.capacity(rate))
+
+    @contextlib.contextmanager
+    def transfer(self) -> Iterator[TokenBucket]:
+        # 一个文件的传输期间使用同一个令牌桶，结束后移除
+        bucket = TokenBucket(self.per_file, self.capacity(self.per_file))
+        self.transfers.add(bucket)
+        try:
+            yield bucket
+        finally:
+            self.transfers.discard(bucket)
+
+    async def consume(self, size: int, transfer: Union[TokenBucket, None] = None) -> None:
+        self.apply_schedule()
+        if transfer is not None:
+            await transfer.acquire(size)
+        await self.bucket.acquire(size)
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+import json
+import sqlite3
+import time
+from typing import Any, Union
+
+
+class ListingCache:
+    # 目录列表的本地 SQLite 缓存：超过 ttl 秒视为过期，条目数超过 max_entries 时淘汰最久未访问的条目；
+    # 调用方知道目录的 updated_at 时按其是否变化判断，不受 ttl 限制
+    def __init__(self, path: str, ttl: float = 3600, max_entries: int = 20000) -> None:
+        self.path: str = path
+        self.ttl: float = ttl
+        self.max_entries: int = max_entries
+        self.conn: sqlite3.Connection = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS listings (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                updated_at INTEGER,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_listings_accessed ON listings (accessed_at)')
+        self.conn.commit()
+
+    def get(self, key: str, updated_at: Union[int, None] = None) -> Union[Any, None]:
+        row = self.conn.execute('SELECT value, updated_at, fetched_at FROM listings WHERE key = ?',
+                                (key,)).fetchone()
+        if row is None:
+            return None
+        value, cached_updated_at, fetched_at = row
+        now = time.time()
+        if updated_at is not None and cached_updated_at is not None:
+            if updated_at != cached_updated_at:
+                return None
+        elif now - fetched_at > self.ttl:
+            return None
+        self.conn.execute('UPDATE listings SET accessed_at = ? WHERE key = ?', (now, key))
+        self.conn.commit()
+        return json.loads(value)
+
+    def put(self, key: str, value: Any, updated_at: Union[int, None] = None) -> None:
+        now = time.time()
+        self.conn.execute('INSERT OR REPLACE INTO listings (key, value, updated_at, fetched_at, accessed_at) '
+                          'VALUES (?, ?, ?, ?, ?)',
+                          (key, json.dumps(value, ensure_ascii=False), updated_at, now, now))
+        self.evict()
+        self.conn.commit()
+
+    def evict(self) -> None:
+        count = self.conn.execute('SELECT COUNT(*) FROM listings').fetchone()[0]
+        if count > self.max_entries:
+            self.conn.execute('DELETE FROM listings WHERE key IN '
+                              '(SELECT key FROM listings ORDER BY accessed_at LIMIT ?)',
+                              (count - self.max_entries,))
+
+    def invalidate(self, prefix: str = '') -> int:
+        # 删除以 prefix 开头的缓存条目，prefix 为空时清空全部缓存
+        cursor = self.conn.execute("DELETE FROM listings WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+        self.conn.commit()
+        return cursor.rowcount
+
+    def close(self) -> None:
+        self.conn.close()
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import os
+import time
+import uuid
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterator, List, Tuple, Union
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar('quark_span', default=None)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets: Tuple[float, ...] = buckets
+        self.counts: List[int] = [0] * len(buckets)
+        self.sum: float = 0.0
+        self.count: int = 0
+
+    def observe(self, value: float) -> None:
+        self.sum += value
+        self.count += 1
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((repr(bound), total))
+        result.append(('+Inf', self.count))
+        return result
+
+    def quantile(self, q: float) -> Union[float, None]:
+        # 按桶上界估算分位数
+        if not self.count:
+            return None
+        rank = q * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return float(bound) if bound != '+Inf' else self.buckets[-1]
+        return self.buckets[-1]
+
+
+class Span:
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'start', 'end', 'attributes', 'status')
+
+    def __init__(self, name: str, parent: Union['Span', None], attributes: Dict[str, Any]) -> None:
+        self.name: str = name
+        self.trace_id: str = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id: str = uuid.uuid4().hex[:16]
+        self.parent_id: Union[str, None] = parent.span_id if parent else None
+        self.start: float = time.time()
+        self.end: Union[float, None] = None
+        self.attributes: Dict[str, Any] = attributes
+        self.status: str = 'ok'
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'start': self.start,
+            'end': self.end,
+            'duration': (self.end or time.time()) - self.start,
+            'status': self.status,
+            'attributes': self.attributes,
+        }
+
+
+class Metrics:
+    # 进程内指标：计数器、直方图、仪表盘与可选的调用链记录，可导出为 Prometheus 文本或 JSON
+    def __init__(self, max_spans: int = 10000) -> None:
+        self.types: Dict[str, str] = {}
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.gauges: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self.collectors: List[Callable[['Metrics'], None]] = []
+        self.tracing: bool = False
+        self.spans: Deque[Span] = deque(maxlen=max_spans)
+        self._otel_tracer: Any = None
+
+    @staticmethod
+    def labels(labels: Dict[str, Any]) -> Labels:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name: str, value: float = 1, /, **labels: Any) -> None:
+        self.types.setdefault(name, 'counter')
+        key = (name, self.labels(labels))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, /, **labels: Any) -> None:
+        self.types.setdefault(name, 'gauge')
+        self.gauges[(name, self.labels(labels))] = value
+
+    def observe(self, name: str, value: float, /, **labels: Any) -> None:
+        self.types.setdefault(name, 'histogram')
+        key = (name, self.labels(labels))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def add_collector(self, collector: Callable[['Metrics'], None]) -> None:
+        # 导出前调用，用于读取队列长度等瞬时值；重复注册同一个 collector 时忽略
+        if collector not in self.collectors:
+            self.collectors.append(collector)
+
+    def remove_collector(self, collector: Callable[['Metrics'], None]) -> None:
+        # 对象关闭时调用，避免已关闭的对象被全局 METRICS 引用而无法回收
+        if collector in self.collectors:
+            self.collectors.remove(collector)
+
+    @contextlib.contextmanager
+    def timer(self, name: str, /, **labels: Any) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def enable_tracing(self, otel: bool = False) -> None:
+        # otel 为 True 且安装了 opentelemetry 时，同时创建 OpenTelemetry span
+        self.tracing = True
+        if otel:
+            try:
+                from opentelemetry import trace
+                self._otel_tracer = trace.get_tracer('quark')
+            except ImportError:
+                self._otel_tracer = None
+
+    @contextlib.contextmanager
+    def span(self, name: str, /, **attributes: Any) -> Iterator[Span]:
+        span = Span(name, _current_span.get(), attributes)
+        token = _current_span.set(span)
+        otel = self._otel_tracer.start_as_current_span(name, attributes=attributes) if self._otel_tracer else None
+        otel_span = otel.__enter__() if otel else None
+        try:
+            yield span
+        except BaseException as e:
+            span.status = 'error'
+            span.set('error', repr(e))
+            raise
+        finally:
+            span.end = time.time()
+            _current_span.reset(token)
+            self.observe('quark_span_seconds', span.end - span.start, name=name, status=span.status)
+            if self.tracing:
+                self.spans.append(span)
+            if otel:
+                for key, value in span.attributes.items():
+                    otel_span.set_attribute(key, str(value))
+                otel.__exit__(None, None, None)
+
+    def collect(self) -> None:
+        for collector in self.collectors:
+            collector(self)
+
+    def snapshot(self) -> Dict[str, Any]:
+        self.collect()
+
+        def series(key: Tuple[str, Labels]) -> Dict[str, Any]:
+            return {'name': key[0], 'labels': dict(key[1])}
+
+        histograms = []
+        for key, histogram in self.histograms.items():
+            histograms.append(dict(series(key), count=histogram.count, sum=histogram.sum,
+                                   p50=histogram.quantile(0.5), p90=histogram.quantile(0.9),
+                                   p99=histogram.quantile(0.99), buckets=dict(histogram.cumulative())))
+        return {
+            'timestamp': time.time(),
+            'counters': [dict(series(key), value=value) for key, value in self.counters.items()],
+            'gauges': [dict(series(key), value=value) for key, value in self.gauges.items()],
+            'histograms': histograms,
+        }
+
+    def to_prometheus(self) -> str:
+        self.collect()
+
+        def fmt(labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+            pairs = labels + extra
+            if not pairs:
+                return ''
+            escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+            return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+        lines = []
+        for name, kind in sorted(self.types.items()):
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == 'histogram':
+                for (metric, labels), histogram in self.histograms.items():
+                    if metric != name:
+                        continue
+                    for bound, total in histogram.cumulative():
+                        lines.append(f"{name}_bucket{fmt(labels, (('le', bound),))} {total}")
+                    lines.append(f'{name}_sum{fmt(labels)} {histogram.sum}')
+                    lines.append(f'{name}_count{fmt(labels)} {histogram.count}')
+            else:
+                values = self.counters if kind == 'counter' else self.gauges
+                for (metric, labels), value in values.items():
+                    if metric == name:
+                        lines.append(f'{name}{fmt(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def export_spans(self) -> List[Dict[str, Any]]:
+        return [span.to_dict() for span in self.spans]
+
+    def write(self, path: str) -> None:
+        # .prom 为 Prometheus 文本，.jsonl 为调用链记录，其余为 JSON 快照
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            if path.endswith('.prom'):
+                f.write(self.to_prometheus())
+            elif path.endswith('.jsonl'):
+                for span in self.export_spans():
+                    f.write(json.dumps(span, ensure_ascii=False) + '\n')
+            else:
+                json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+
+def traced(name: str, *arg_names: str) -> Callable:
+    # 为异步方法创建 span，arg_names 中的参数记为 span 属性，返回值为带 status 的字典时记录其状态
+    def decorator(func: Callable) -> Callable:
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            bound = signature.bind_partial(*args, **kwargs)
+            attributes = {arg: bound.arguments[arg] for arg in arg_names if arg in bound.arguments}
+            with METRICS.span(name, **attributes) as span:
+                result = await func(*args, **kwargs)
+                if isinstance(result, dict) and 'status' in result:
+                    span.set('result', result['status'])
+                return result
+
+        return wrapper
+
+    return decorator
+
+
+METRICS = Metrics()
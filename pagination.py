@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import math
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Union
+
+FetchPage = Callable[[int], Awaitable[Dict[str, Any]]]
+
+
+async def fetch_all_pages(fetch_page: FetchPage, concurrency: int = 4) -> List[Dict[str, Any]]:
+    # 先请求第一页拿到 metadata._total，剩余页并发请求后按页码顺序返回
+    # 总页数按服务端返回的 _size 计算，请求的每页数量超出接口上限时也不会漏页
+    first = await fetch_page(1)
+    metadata = first.get('metadata') or {}
+    total = metadata.get('_total', 0)
+    size = metadata.get('_size', 0)
+    if not size or total <= size:
+        return [first]
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(page: int) -> Dict[str, Any]:
+        async with semaphore:
+            return await fetch_page(page)
+
+    rest = await asyncio.gather(*(fetch(page) for page in range(2, math.ceil(total / size) + 1)))
+    return [first, *rest]
+
+
+async def iter_pages(fetch_page: FetchPage, concurrency: int = 4,
+                     first: Union[Dict[str, Any], None] = None) -> AsyncIterator[Dict[str, Any]]:
+    # 按页码顺序逐页产出，最多预取 concurrency 页，占用的内存与总页数无关；first 为已请求过的第一页
+    if first is None:
+        first = await fetch_page(1)
+    yield first
+    metadata = first.get('metadata') or {}
+    total = metadata.get('_total', 0)
+    size = metadata.get('_size', 0)
+    if not size or total <= size:
+        return
+
+    last = math.ceil(total / size)
+    next_page = 2
+    window: Deque[asyncio.Task] = deque()
+    try:
+        while next_page <= last or window:
+            while next_page <= last and len(window) < concurrency:
+                window.append(asyncio.create_task(fetch_page(next_page)))
+                next_page += 1
+            yield await window.popleft()
+    finally:
+        for task in window:
+            task.cancel()
+        await asyncio.gather(*window, return_exceptions=True)
@@ -1,42 +1,260 @@
 # -*- coding: utf-8 -*-
 
 import asyncio
+import contextlib
+import hashlib
+import posixpath
 import re
 import sys
+import time
 import httpx
-from prettytable import PrettyTable
-from tqdm import tqdm
-from quark_login import QuarkLogin, CONFIG_DIR
+from urllib.parse import urlsplit
+from quark_login import QuarkLogin, CONFIG_DIR, ensure_config_dir
+from downloader import SegmentedDownloader, DownloadScheduler
+from download_urls import DownloadUrlManager
+from storage import LocalSink, StdoutSink, S3Sink
+from pagination import fetch_all_pages, iter_pages
+from entries import FileEntry
+from task_waiter import TaskWaiter, TaskTimeoutError
+from walker import walk_tree, walk_folders
+from limiter import HostRateLimiter, AdaptiveRateLimiter, BandwidthLimiter
+from listing_cache import ListingCache
+from ledger import TransferLedger
+from journal import JobJournal, PENDING, IN_FLIGHT, DONE, FAILED
+from metrics import METRICS, Metrics, traced
+from result_writer import ResultWriter, result_path
 from utils import *
 import json
 import os
 import random
-from typing import List, Dict, Union, Tuple, Any
+from typing import List, Dict, Set, Union, Tuple, Any, AsyncIterator, Awaitable, Callable
+
+BATCH_CONCURRENCY = 5
+SHARE_CONCURRENCY = 4
+SHARE_RATE = 2.0
+# 批量分享默认分享所给文件夹下第几层的文件夹
+SHARE_DEPTH = 2
+# 分享结果与待重试文件的字段
+SHARE_FIELDS = ['n', 'first_dir', 'second_dir', 'share_url']
+RETRY_FIELDS = ['n', 'first_dir', 'second_dir', 'fid']
+# 每个转存请求最多包含的条目数，以及同时进行的转存请求数
+SAVE_BATCH_SIZE = 100
+SAVE_BATCH_CONCURRENCY = 3
+# 接口返回这些错误码时视为被限流
+THROTTLE_CODES = {429}
+# 网盘容量不足
+CAPACITY_CODE = 32003
+NOT_OWNER_MESSAGE = '下载文件必须是网盘内文件'
+# 分享详情超过这么多条时不写入列表缓存
+DETAIL_CACHE_LIMIT = 5000
+# 转存时显示的文件名数量
+PREVIEW_COUNT = 20
+# 边遍历边下载时最多排队等待下载的文件数，超过后暂停遍历，内存占用与目录树大小无关
+DOWNLOAD_QUEUE_LIMIT = 500
+
+# 按 (文件夹相对路径, 文件夹条目, 文件夹内的条目) 判断是否分享该文件夹
+SharePredicate = Callable[[str, Dict[str, Any], List[Dict[str, Any]]], bool]
+
+
+def contains_files(count: int) -> SharePredicate:
+    # 文件夹内直接包含的文件数超过 count 时分享该文件夹
+    def predicate(path: str, folder: Dict[str, Any], entries: List[Dict[str, Any]]) -> bool:
+        return sum(1 for entry in entries if not entry['dir']) > count
+
+    # 任务日志按名称区分不同的筛选条件
+    predicate.__qualname__ = f'contains_files({count})'
+    return predicate
+
+
+class QuarkApiError(Exception):
+    def __init__(self, code: int, message: str) -> None:
+        super().__init__(f'{code}: {message}')
+        self.code: int = code
+        self.message: str = message
+
+    @property
+    def throttled(self) -> bool:
+        return self.code in THROTTLE_CODES or '频繁' in self.message or 'too many' in self.message.lower()
 
 
 class QuarkPanFileManager:
-    def __init__(self, headless: bool = False, slow_mo: int = 0) -> None:
+    api_host: str = 'https://drive-pc.quark.cn'
+    save_host: str = 'https://drive.quark.cn'
+    account_host: str = 'https://pan.quark.cn'
+
+    def __init__(self, headless: bool = False, slow_mo: int = 0, cookies: Union[str, None] = None,
+                 http2: bool = True, max_connections: int = 100, max_keepalive_connections: int = 20,
+                 keepalive_expiry: float = 30.0, timeout: float = 60.0, connect_timeout: float = 60.0,
+                 rate_limit: float = 10.0, download_concurrency: int = 8, list_concurrency: int = 8,
+                 listing_cache_ttl: float = 3600, use_ledger: bool = True, use_journal: bool = True,
+                 download_folder: str = 'downloads',
+                 sink: Union[LocalSink, StdoutSink, S3Sink, None] = None,
+                 bandwidth: Union[BandwidthLimiter, None] = None) -> None:
         self.headless: bool = headless
         self.slow_mo: int = slow_mo
         self.folder_id: Union[str, None] = None
         self.user: Union[str, None] = '用户A'
         self.pdir_id: Union[str, None] = '0'
         self.dir_name: Union[str, None] = '根目录'
-        self.cookies: str = self.get_cookies()
-        self.headers: Dict[str, str] = {
-            'user-agent': 'Mozilla/5.0 (Windows NT 10.0; WOW64) AppleWebKit/537.36 (KHTML, like Gecko)'
-                          ' Chrome/94.0.4606.71 Safari/537.36 Core/1.94.225.400 QQBrowser/12.2.5544.400',
-            'origin': 'https://pan.quark.cn',
-            'referer': 'https://pan.quark.cn/',
-            'accept-language': 'zh-CN,zh;q=0.9',
-            'cookie': self.cookies,
-        }
+        self.http2: bool = http2
+        self.limits: httpx.Limits = httpx.Limits(max_connections=max_connections,
+                                                 max_keepalive_connections=max_keepalive_connections,
+                                                 keepalive_expiry=keepalive_expiry)
+        self.timeout: httpx.Timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self._client: Union[httpx.AsyncClient, None] = None
+        self._client_loop: Union[asyncio.AbstractEventLoop, None] = None
+        self.rate_limiter: HostRateLimiter = HostRateLimiter(rate_limit)
+        # 下载带宽限速，多个账号共用同一个 BandwidthLimiter 时共享全局带宽
+        self.bandwidth: Union[BandwidthLimiter, None] = bandwidth
+        self.downloader: SegmentedDownloader = SegmentedDownloader(self.stream, bandwidth=bandwidth)
+        self.download_concurrency: int = download_concurrency
+        self.download_folder: str = download_folder
+        # 下载的存储目标，默认保存到本地；保存路径仍以 download_folder 为根，S3 的对象键相对于它计算
+        self.sink: Union[LocalSink, StdoutSink, S3Sink] = sink or LocalSink(download_folder)
+        self.list_concurrency: int = list_concurrency
+        self.page_concurrency: int = 4
+        self.share_concurrency: int = SHARE_CONCURRENCY
+        self.share_rate: float = SHARE_RATE
+        self.save_batch_size: int = SAVE_BATCH_SIZE
+        self.save_batch_concurrency: int = SAVE_BATCH_CONCURRENCY
+        ensure_config_dir()
+        self.listing_cache: Union[ListingCache, None] = None
+        if listing_cache_ttl > 0:
+            self.listing_cache = ListingCache(f'{CONFIG_DIR}/listing_cache.db', ttl=listing_cache_ttl)
+        self.ledger: Union[TransferLedger, None] = TransferLedger(f'{CONFIG_DIR}/ledger.db') if use_ledger else None
+        self.journal: Union[JobJournal, None] = JobJournal(f'{CONFIG_DIR}/jobs.db') if use_journal else None
+        # 查询任务时被限流不代表任务失败，继续等待
+        self.task_waiter: TaskWaiter = TaskWaiter(self.get_task, lambda json_data: json_data['data']['status'] == 2,
+                                                  retryable=lambda e: isinstance(e, QuarkApiError) and e.throttled)
+        self.metrics: Metrics = METRICS
+        self.metrics.add_collector(self.collect_metrics)
+        # Cookie 在第一次发起请求时才读取，构造对象不会触发登录
+        self._cookies: Union[str, None] = cookies or None
+        self._headers: Union[Dict[str, str], None] = None
 
     def get_cookies(self) -> str:
         quark_login = QuarkLogin(headless=self.headless, slow_mo=self.slow_mo)
         cookies: str = quark_login.get_cookies()
         return cookies
 
+    @property
+    def cookies(self) -> str:
+        if self._cookies is None:
+            self._cookies = self.get_cookies()
+        return self._cookies
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        if self._headers is None:
+            self._headers = {
+                'user-agent': 'Mozilla/5.0 (Windows NT 10.0; WOW64) AppleWebKit/537.36 (KHTML, like Gecko)'
+                              ' Chrome/94.0.4606.71 Safari/537.36 Core/1.94.225.400 QQBrowser/12.2.5544.400',
+                'origin': 'https://pan.quark.cn',
+                'referer': 'https://pan.quark.cn/',
+                'accept-language': 'zh-CN,zh;q=0.9',
+                'cookie': self.cookies,
+            }
+        return self._headers
+
+    async def validate_session(self) -> bool:
+        # 异步校验 Cookie 是否有效，可与其他请求并发执行
+        try:
+            self.user = await self.get_user_info()
+        except QuarkApiError:
+            return False
+        return True
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # 连接池与事件循环绑定，菜单中每次 asyncio.run 都会创建新的事件循环
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(http2=self.http2, limits=self.limits, timeout=self.timeout)
+            self._client_loop = loop
+        return self._client
+
+    async def close(self) -> None:
+        self.metrics.remove_collector(self.collect_metrics)
+        await self.sink.close()
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+        self._client_loop = None
+
+    async def __aenter__(self) -> 'QuarkPanFileManager':
+        # 菜单每次操作都会 async with 一次，close 时移除的 collector 在这里重新注册
+        self.metrics.add_collector(self.collect_metrics)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    def endpoint(self, url: str) -> str:
+        # 接口按路径统计，下载地址（CDN）按域名统计，避免指标标签过多
+        parts = urlsplit(url)
+        if f'{parts.scheme}://{parts.netloc}' in (self.api_host, self.save_host, self.account_host):
+            return parts.path
+        return f'cdn:{parts.hostname}'
+
+    def collect_metrics(self, metrics: Metrics) -> None:
+        metrics.set_gauge('quark_task_waiter_pending', len(self.task_waiter.pending), user=self.user)
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        endpoint = self.endpoint(url)
+        with self.metrics.timer('quark_rate_limit_wait_seconds', endpoint=endpoint):
+            await self.rate_limiter.acquire(url)
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.metrics.inc('quark_http_errors_total', endpoint=endpoint, error=type(e).__name__)
+            raise
+        finally:
+            self.metrics.observe('quark_http_request_seconds', time.perf_counter() - start, endpoint=endpoint)
+        self.metrics.inc('quark_http_requests_total', endpoint=endpoint, method=method, status=response.status_code)
+        self.metrics.inc('quark_http_bytes_total', len(response.content), endpoint=endpoint)
+        return response
+
+    def cache_key(self, *parts: Any) -> str:
+        # 缓存按 Cookie 的摘要区分账号：self.user 在会话校验完成前仍是默认值，命令与校验并发执行时不能用来区分
+        account = hashlib.sha1(self.cookies.encode('utf-8')).hexdigest()[:16]
+        return ':'.join([account, *map(str, parts)])
+
+    def invalidate_listing(self, pdir_fid: str = '') -> None:
+        # 清除网盘某个文件夹的列表缓存，pdir_fid 为空时清除当前用户的全部缓存
+        if self.listing_cache is not None:
+            self.listing_cache.invalidate(self.cache_key('sort', pdir_fid, '') if pdir_fid else self.cache_key(''))
+
+    def check_response(self, response: httpx.Response) -> Dict[str, Any]:
+        if response.status_code == 429:
+            self.metrics.inc('quark_api_errors_total', code=429)
+            raise QuarkApiError(429, 'too many requests')
+        json_data = response.json()
+        if json_data.get('code', 0) != 0:
+            self.metrics.inc('quark_api_errors_total', code=json_data['code'])
+            raise QuarkApiError(json_data['code'], json_data.get('message', ''))
+        return json_data
+
+    @contextlib.asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs) -> AsyncIterator[httpx.Response]:
+        endpoint = self.endpoint(url)
+        with self.metrics.timer('quark_rate_limit_wait_seconds', endpoint=endpoint):
+            await self.rate_limiter.acquire(url)
+        start = time.perf_counter()
+        try:
+            async with self.client.stream(method, url, **kwargs) as response:
+                # 流式请求的耗时记到收到响应头为止，传输耗时体现在字节数与下载速度上
+                self.metrics.observe('quark_http_request_seconds', time.perf_counter() - start, endpoint=endpoint)
+                self.metrics.inc('quark_http_requests_total', endpoint=endpoint, method=method,
+                                 status=response.status_code)
+                try:
+                    yield response
+                finally:
+                    self.metrics.inc('quark_http_bytes_total', response.num_bytes_downloaded, endpoint=endpoint)
+        except httpx.HTTPError as e:
+            self.metrics.inc('quark_http_errors_total', endpoint=endpoint, error=type(e).__name__)
+            raise
+
     @staticmethod
     def get_pwd_id(share_url: str) -> str:
         return share_url.split('?')[0].split('/s/')[1]
@@ -54,75 +272,85 @@ class QuarkPanFileManager:
             '__dt': random.randint(100, 9999),
             '__t': get_timestamp(13),
         }
-        api = f"https://drive-pc.quark.cn/1/clouddrive/share/sharepage/token"
+        api = f"{self.api_host}/1/clouddrive/share/sharepage/token"
         data = {"pwd_id": pwd_id, "passcode": ""}
-        async with httpx.AsyncClient() as client:
-            timeout = httpx.Timeout(60.0, connect=60.0)
-            response = await client.post(api, json=data, params=params, headers=self.headers, timeout=timeout)
-            json_data = response.json()
-            if json_data['status'] == 200 and json_data['data']:
-                stoken = json_data["data"]["stoken"]
-            else:
-                stoken = ''
-                custom_print(f"文件转存失败，{json_data['message']}")
-            return stoken
-
-    async def get_detail(self, pwd_id: str, stoken: str, pdir_fid: str = '0') -> Tuple[
-                str, List[Dict[str, Union[int, str]]]]:
-        api = f"https://drive-pc.quark.cn/1/clouddrive/share/sharepage/detail"
-        page = 1
-        file_list: List[Dict[str, Union[int, str]]] = []
-
-        async with httpx.AsyncClient() as client:
-            while True:
-                params = {
-                    'pr': 'ucpro',
-                    'fr': 'pc',
-                    'uc_param_str': '',
-                    "pwd_id": pwd_id,
-                    "stoken": stoken,
-                    'pdir_fid': pdir_fid,
-                    'force': '0',
-                    "_page": str(page),
-                    '_size': '50',
-                    '_sort': 'file_type:asc,updated_at:desc',
-                    '__dt': random.randint(200, 9999),
-                    '__t': get_timestamp(13),
-                }
-
-                timeout = httpx.Timeout(60.0, connect=60.0)
-                response = await client.get(api, headers=self.headers, params=params, timeout=timeout)
-                json_data = response.json()
-
-                is_owner = json_data['data']['is_owner']
-                _total = json_data['metadata']['_total']
-                if _total < 1:
-                    return is_owner, file_list
-
-                _size = json_data['metadata']['_size']  # 每页限制数量
-                _count = json_data['metadata']['_count']  # 当前页数量
-
-                _list = json_data["data"]["list"]
-
-                for file in _list:
-                    d: Dict[str, Union[int, str]] = {
-                        "fid": file["fid"],
-                        "file_name": file["file_name"],
-                        "file_type": file["file_type"],
-                        "dir": file["dir"],
-                        "pdir_fid": file["pdir_fid"],
-                        "include_items": file["include_items"] if "include_items" in file else '',
-                        "share_fid_token": file["share_fid_token"],
-                        "status": file["status"]
-                    }
-                    file_list.append(d)
-                if _total <= _size or _count < _size:
-                    return is_owner, file_list
-
-                page += 1
+        response = await self.request('POST', api, json=data, params=params, headers=self.headers)
+        json_data = response.json()
+        if json_data['status'] == 200 and json_data['data']:
+            stoken = json_data["data"]["stoken"]
+        else:
+            stoken = ''
+            custom_print(f"文件转存失败，{json_data['message']}")
+        return stoken
+
+    async def iter_detail(self, pwd_id: str, stoken: str, pdir_fid: str = '0', size: int = 100,
+                          updated_at: Union[int, None] = None,
+                          use_cache: bool = True) -> Tuple[int, AsyncIterator[FileEntry]]:
+        # 请求第一页后返回 (is_owner, 条目迭代器)，其余页边请求边产出，条目数再多内存占用也保持平稳
+        api = f"{self.api_host}/1/clouddrive/share/sharepage/detail"
+        key = self.cache_key('detail', pwd_id, pdir_fid)
+        if use_cache and self.listing_cache is not None:
+            cached = self.listing_cache.get(key, updated_at=updated_at)
+            if cached is not None:
+                return cached[0], self.iter_cached(cached[1])
+
+        async def fetch_page(page: int) -> Dict[str, Any]:
+            params = {
+                'pr': 'ucpro',
+                'fr': 'pc',
+                'uc_param_str': '',
+                "pwd_id": pwd_id,
+                "stoken": stoken,
+                'pdir_fid': pdir_fid,
+                'force': '0',
+                "_page": str(page),
+                '_size': str(size),
+                '_sort': 'file_type:asc,updated_at:desc',
+                '__dt': random.randint(200, 9999),
+                '__t': get_timestamp(13),
+            }
+            response = await self.request('GET', api, headers=self.headers, params=params)
+            return response.json()
+
+        first = await fetch_page(1)
+        is_owner = first['data']['is_owner']
+
+        async def entries() -> AsyncIterator[FileEntry]:
+            # 条目数不超过 DETAIL_CACHE_LIMIT 时顺便写入列表缓存，超过后不再保留副本
+            cached: Union[List[Dict[str, Any]], None] = [] if self.listing_cache is not None else None
+            async for json_data in iter_pages(fetch_page, concurrency=self.page_concurrency, first=first):
+                for file in json_data["data"]["list"]:
+                    entry = FileEntry.from_api(file)
+                    if cached is not None:
+                        cached.append(entry.to_dict())
+                        if len(cached) > DETAIL_CACHE_LIMIT:
+                            cached = None
+                    yield entry
+            if cached is not None:
+                self.listing_cache.put(key, [is_owner, cached], updated_at=updated_at)
+
+        return is_owner, entries()
+
+    @staticmethod
+    async def iter_cached(items: List[Dict[str, Any]]) -> AsyncIterator[FileEntry]:
+        for item in items:
+            yield FileEntry.from_dict(item)
+
+    async def get_detail(self, pwd_id: str, stoken: str, pdir_fid: str = '0', size: int = 100,
+                         updated_at: Union[int, None] = None, use_cache: bool = True) -> Tuple[
+                int, List[FileEntry]]:
+        is_owner, entries = await self.iter_detail(pwd_id, stoken, pdir_fid, size=size, updated_at=updated_at,
+                                                   use_cache=use_cache)
+        return is_owner, [entry async for entry in entries]
 
     async def get_sorted_file_list(self, pdir_fid='0', page='1', size='100', fetch_total='false',
-                                   sort='') -> Dict[str, Any]:
+                                   sort='', updated_at: Union[int, None] = None,
+                                   use_cache: bool = True) -> Dict[str, Any]:
+        key = self.cache_key('sort', pdir_fid, page, size, fetch_total, sort)
+        if use_cache and self.listing_cache is not None:
+            cached = self.listing_cache.get(key, updated_at=updated_at)
+            if cached is not None:
+                return cached
         params = {
             'pr': 'ucpro',
             'fr': 'pc',
@@ -137,12 +365,32 @@ class QuarkPanFileManager:
             '__t': get_timestamp(13),
         }
 
-        async with httpx.AsyncClient() as client:
-            timeout = httpx.Timeout(60.0, connect=60.0)
-            response = await client.get('https://drive-pc.quark.cn/1/clouddrive/file/sort', params=params,
-                                        headers=self.headers, timeout=timeout)
-            json_data = response.json()
-            return json_data
+        response = await self.request('GET', f'{self.api_host}/1/clouddrive/file/sort', params=params,
+                                      headers=self.headers)
+        json_data = response.json()
+        if self.listing_cache is not None and json_data.get('code') == 0:
+            self.listing_cache.put(key, json_data, updated_at=updated_at)
+        return json_data
+
+    async def get_all_sorted_file_list(self, pdir_fid: str = '0', size: str = '100', sort: str = '',
+                                       updated_at: Union[int, None] = None) -> List[Dict[str, Any]]:
+        async def fetch_page(page: int) -> Dict[str, Any]:
+            return await self.get_sorted_file_list(pdir_fid, page=str(page), size=size, fetch_total='1', sort=sort,
+                                                   updated_at=updated_at)
+
+        pages = await fetch_all_pages(fetch_page, concurrency=self.page_concurrency)
+        return [item for json_data in pages for item in json_data['data']['list']]
+
+    async def iter_sorted_file_list(self, pdir_fid: str = '0', size: str = '100', sort: str = '',
+                                    updated_at: Union[int, None] = None) -> AsyncIterator[FileEntry]:
+        # 逐页产出网盘文件夹中的条目，每页仍经过列表缓存
+        async def fetch_page(page: int) -> Dict[str, Any]:
+            return await self.get_sorted_file_list(pdir_fid, page=str(page), size=size, fetch_total='1', sort=sort,
+                                                   updated_at=updated_at)
+
+        async for json_data in iter_pages(fetch_page, concurrency=self.page_concurrency):
+            for file in json_data['data']['list']:
+                yield FileEntry.from_api(file)
 
     async def get_user_info(self) -> str:
 
@@ -151,20 +399,31 @@ class QuarkPanFileManager:
             'platform': 'pc',
         }
 
-        async with httpx.AsyncClient() as client:
-            timeout = httpx.Timeout(60.0, connect=60.0)
-            response = await client.get('https://pan.quark.cn/account/info', params=params,
-                                        headers=self.headers, timeout=timeout)
-            json_data = response.json()
-            if json_data['data']:
-                nickname = json_data['data']['nickname']
-                return nickname
-            else:
-                input("登录失败！请重新运行本程序，然后在弹出的浏览器中登录夸克账号")
-                with open(f'{CONFIG_DIR}/cookies.txt', 'w', encoding='utf-8'):
-                    sys.exit(-1)
+        response = await self.request('GET', f'{self.account_host}/account/info', params=params,
+                                      headers=self.headers)
+        json_data = response.json()
+        if json_data['data']:
+            nickname = json_data['data']['nickname']
+            return nickname
+        raise QuarkApiError(json_data.get('code', -1), json_data.get('message') or '登录失败，Cookie 无效或已过期')
 
-    async def create_dir(self, pdir_name='新建文件夹') -> None:
+    async def get_capacity(self) -> Tuple[int, int]:
+        # 返回 (已用容量, 总容量)，单位字节
+        params = {
+            'pr': 'ucpro',
+            'fr': 'pc',
+            'uc_param_str': '',
+            'fetch_subscribe': 'true',
+            '_ch': 'home',
+            'fetch_identity': 'true',
+        }
+        response = await self.request('GET', f'{self.api_host}/1/clouddrive/member', params=params,
+                                      headers=self.headers)
+        data = self.check_response(response)['data']
+        return int(data.get('use_capacity', 0)), int(data.get('total_capacity', 0))
+
+    async def create_dir(self, pdir_name='新建文件夹', pdir_fid: str = '0', switch: bool = True) -> Union[str, None]:
+        # 创建成功返回新文件夹ID，switch 为 True 时同时将保存目录切换至该文件夹
         params = {
             'pr': 'ucpro',
             'fr': 'pc',
@@ -174,109 +433,227 @@ class QuarkPanFileManager:
         }
 
         json_data = {
-            'pdir_fid': '0',
+            'pdir_fid': pdir_fid,
             'file_name': pdir_name,
             'dir_path': '',
             'dir_init_lock': False,
         }
 
-        async with httpx.AsyncClient() as client:
-            timeout = httpx.Timeout(60.0, connect=60.0)
-            response = await client.post('https://drive-pc.quark.cn/1/clouddrive/file', params=params,
-                                         json=json_data, headers=self.headers, timeout=timeout)
-            json_data = response.json()
-            if json_data["code"] == 0:
-                custom_print(f'根目录下 {pdir_name} 文件夹创建成功！')
-                new_config = {'user': self.user, 'pdir_id': json_data["data"]["fid"], 'dir_name': pdir_name}
+        response = await self.request('POST', f'{self.api_host}/1/clouddrive/file', params=params,
+                                      json=json_data, headers=self.headers)
+        json_data = response.json()
+        if json_data["code"] == 0:
+            fid = json_data["data"]["fid"]
+            custom_print(f"{'根目录' if pdir_fid == '0' else pdir_fid} 下 {pdir_name} 文件夹创建成功！")
+            self.invalidate_listing(pdir_fid)
+            if switch:
+                self.pdir_id, self.dir_name = fid, pdir_name
+                new_config = {'user': self.user, 'pdir_id': fid, 'dir_name': pdir_name}
                 save_config(f'{CONFIG_DIR}/config.json', content=json.dumps(new_config, ensure_ascii=False))
-                global to_dir_id
-                to_dir_id = json_data["data"]["fid"]
                 custom_print(f"自动将保存目录切换至 {pdir_name} 文件夹")
-            elif json_data["code"] == 23008:
-                custom_print(f'文件夹同名冲突，请更换一个文件夹名称后重试', error_msg=True)
-            else:
-                custom_print(f"错误信息：{json_data['message']}", error_msg=True)
+            return fid
+        elif json_data["code"] == 23008:
+            custom_print(f'文件夹同名冲突，请更换一个文件夹名称后重试', error_msg=True)
+        else:
+            custom_print(f"错误信息：{json_data['message']}", error_msg=True)
+        return None
+
+    @staticmethod
+    def make_result(url: str, status: str, message: str = '', pwd_id: str = '', task_id: str = '') -> Dict[str, str]:
+        return {'url': url, 'pwd_id': pwd_id, 'status': status, 'message': message, 'task_id': task_id}
 
-    async def run(self, surl: str, folder_id: Union[str, None] = None, download: bool = False) -> None:
+    @traced('run', 'surl', 'download')
+    async def run(self, surl: str, folder_id: Union[str, None] = None, download: bool = False) -> Dict[str, str]:
         self.folder_id = folder_id
         custom_print(f'文件分享链接：{surl}')
         pwd_id = self.get_pwd_id(surl)
         stoken = await self.get_stoken(pwd_id)
         if not stoken:
-            return
-        is_owner, data_list = await self.get_detail(pwd_id, stoken)
+            return self.make_result(surl, 'failed', '获取stoken失败', pwd_id=pwd_id)
+        is_owner, entries = await self.iter_detail(pwd_id, stoken)
+        head = await anext(entries, None)
+        if head is None:
+            return self.make_result(surl, 'empty', '分享内容为空', pwd_id=pwd_id)
         files_count = 0
         folders_count = 0
         files_list: List[str] = []
         folders_list: List[str] = []
-        files_id_list = []
-        file_fid_list = []
 
-        if data_list:
-            total_files_count = len(data_list)
-            for data in data_list:
-                if data['dir']:
+        async def stream() -> AsyncIterator[FileEntry]:
+            # 边统计边交给转存或下载，文件名只保留前 PREVIEW_COUNT 个用于显示
+            nonlocal files_count, folders_count
+            entry: Union[FileEntry, None] = head
+            while entry is not None:
+                if entry.dir:
                     folders_count += 1
-                    folders_list.append(data["file_name"])
+                    if len(folders_list) < PREVIEW_COUNT:
+                        folders_list.append(entry.file_name)
                 else:
                     files_count += 1
-                    files_list.append(data["file_name"])
-                    files_id_list.append((data["fid"], data["file_name"]))
-
-            custom_print(f'转存总数：{total_files_count}，文件数：{files_count}，文件夹数：{folders_count} | 支持嵌套')
-            custom_print(f'文件转存列表：{files_list}')
-            custom_print(f'文件夹转存列表：{folders_list}')
-
-            fid_list = [i["fid"] for i in data_list]
-            share_fid_token_list = [i["share_fid_token"] for i in data_list]
+                    if len(files_list) < PREVIEW_COUNT:
+                        files_list.append(entry.file_name)
+                yield entry
+                entry = await anext(entries, None)
+
+        def print_counts() -> None:
+            more_files = f' 等{files_count}个' if files_count > len(files_list) else ''
+            more_folders = f' 等{folders_count}个' if folders_count > len(folders_list) else ''
+            custom_print(f'转存总数：{files_count + folders_count}，文件数：{files_count}，文件夹数：{folders_count} | 支持嵌套')
+            custom_print(f'文件转存列表：{files_list}{more_files}')
+            custom_print(f'文件夹转存列表：{folders_list}{more_folders}')
+
+        if not folder_id:
+            custom_print('保存目录ID不合法，请重新获取，如果无法获取，请输入0作为文件夹ID')
+            await entries.aclose()
+            return self.make_result(surl, 'failed', '保存目录ID不合法', pwd_id=pwd_id)
+
+        if download:
+            if is_owner == 0:
+                custom_print(f'{NOT_OWNER_MESSAGE}，请先将文件转存至网盘中')
+                await entries.aclose()
+                return self.make_result(surl, 'failed', NOT_OWNER_MESSAGE, pwd_id=pwd_id)
+
+            summary = await self.download_share_tree(pwd_id, stoken, stream(), save_folder=self.download_folder)
+            print_counts()
+            if summary['failed']:
+                result = self.make_result(surl, 'failed', f"{summary['failed']}个文件下载失败", pwd_id=pwd_id)
+            else:
+                result = self.make_result(surl, 'downloaded', pwd_id=pwd_id)
+                if self.ledger is not None:
+                    self.ledger.record_transfer(pwd_id, surl, kind='download', status='downloaded')
 
-            if not self.folder_id:
-                custom_print('保存目录ID不合法，请重新获取，如果无法获取，请输入0作为文件夹ID')
-                return
+        else:
+            if is_owner == 1:
+                custom_print(f'网盘中已经存在该文件，无需再次转存')
+                if self.ledger is not None:
+                    self.ledger.record_transfer(pwd_id, surl, status='exists', to_pdir_fid=folder_id)
+                await entries.aclose()
+                return self.make_result(surl, 'exists', '网盘中已经存在该文件', pwd_id=pwd_id)
+            summary = await self.save_entries(pwd_id, stoken, stream(), to_pdir_fid=folder_id)
+            print_counts()
+            task_id = ','.join(summary['task_ids'])
+            if summary['saved_batches']:
+                self.invalidate_listing(folder_id)
+            if not summary['failed_batches']:
+                if self.ledger is not None:
+                    self.ledger.record_transfer(pwd_id, surl, status='saved', to_pdir_fid=folder_id,
+                                                task_id=task_id)
+                    # 整条链接已记为转存完成，逐项记录不再需要
+                    self.ledger.forget_saved_items(pwd_id, folder_id)
+                result = self.make_result(surl, 'saved', pwd_id=pwd_id, task_id=task_id)
+            else:
+                message = (f"{summary['failed_batches']}/{summary['batches']}批转存失败"
+                           f"（{summary['failed_items']}项）：{summary['errors'][0]}")
+                result = self.make_result(surl, 'failed', message, pwd_id=pwd_id, task_id=task_id)
+        print()
+        return result
+
+    def open_job(self, kind: str, parts: List[Any],
+                 units: List[Tuple[str, Dict[str, Any]]]) -> Tuple[str, List[Dict[str, Any]]]:
+        # 同一批输入对应同一个任务ID，未完成的任务从断点继续；未启用任务日志时所有单元都视为待执行
+        digest = hashlib.sha1('\n'.join(str(part) for part in parts).encode('utf-8')).hexdigest()[:16]
+        job_id = f'{kind}:{digest}'
+        if self.journal is None:
+            return job_id, [{'seq': seq, 'key': key, 'payload': payload, 'state': PENDING, 'attempts': 0,
+                             'result': None, 'error': ''} for seq, (key, payload) in enumerate(units)]
+        self.journal.open_job(job_id, kind)
+        self.journal.add_units(job_id, units)
+        entries = self.journal.units(job_id)
+        done = sum(1 for entry in entries if entry['state'] == DONE)
+        if done:
+            custom_print(f'检测到未完成的任务，已完成 {done}/{len(entries)} 项，从断点继续')
+        return job_id, entries
+
+    def checkpoint(self, job_id: str, key: str, state: str, result: Any = None, error: str = '') -> None:
+        if self.journal is None:
+            return
+        if state == IN_FLIGHT:
+            self.journal.start(job_id, key)
+        elif state == DONE:
+            self.journal.finish(job_id, key, result)
+        elif state == FAILED:
+            self.journal.fail(job_id, key, error, result)
+        else:
+            self.journal.release(job_id, key)
 
-            if download:
-                if is_owner == 0:
-                    custom_print(f'下载文件必须是网盘内文件，请先将文件转存至网盘中')
-                    return
-
-                for i in data_list:
-                    if i['dir']:
-                        data_list2 = [i]
-                        not_dir = False
-                        while True:
-                            data_list3 = []
-                            for i2 in data_list2:
-                                custom_print(f'开始下载：{i2["file_name"]} 文件夹中的{i2["include_items"]}个文件')
-                                is_owner, file_data_list = await self.get_detail(pwd_id, stoken, pdir_fid=i2['fid'])
-                                folder = i["file_name"]
-                                fid_list = [i["fid"] for i in file_data_list]
-                                await self.quark_file_download(fid_list, folder=folder)
-                                file_fid_list.extend([i for i in file_data_list if not i2['dir']])
-                                dir_list = [i for i in file_data_list if i['dir']]
-                                if not dir_list:
-                                    not_dir = True
-                                data_list3.extend(dir_list)
-                            data_list2 = data_list3
-                            if not data_list2 or not_dir:
-                                break
-
-                if len(files_id_list) > 0 or len(file_fid_list) > 0:
-                    fid_list = [i[0] for i in files_id_list]
-                    file_fid_list.extend(fid_list)
-                    await self.quark_file_download(file_fid_list, folder='.')
+    def close_job(self, job_id: str) -> None:
+        if self.journal is None:
+            return
+        counts = self.journal.progress(job_id)
+        if self.journal.close_job(job_id) != DONE:
+            custom_print(f'任务未全部完成（失败 {counts[FAILED]} 项，未执行 {counts[PENDING] + counts[IN_FLIGHT]} 项），'
+                         f'再次运行同一任务将只处理剩余部分', error_msg=True)
+
+    async def batch_run(self, urls: List[str], folder_id: Union[str, None] = None, download: bool = False,
+                        concurrency: int = 5, skip_known: bool = True,
+                        on_result: Union[Callable[[Dict[str, str]], None], None] = None,
+                        runner: Union[Callable[..., Awaitable[Dict[str, str]]], None] = None) -> List[Dict[str, str]]:
+        # on_result 在每条链接处理完成时回调（按完成顺序），runner 默认为 self.run，多账号时由账号池替换
+        kind = 'download' if download else 'save'
+        job_id, entries = self.open_job(kind, [folder_id or '', *urls], [(url, {'url': url}) for url in urls])
+        semaphore = asyncio.Semaphore(concurrency)
+        # 网盘容量不足时后续链接必然失败，直接中止剩余任务
+        aborted = asyncio.Event()
+        # 从断点继续时已完成的链接不再处理，不计入待处理数
+        remaining = sum(1 for entry in entries if entry['state'] != DONE)
+        self.metrics.set_gauge('quark_batch_pending', remaining, kind=kind)
+
+        async def worker(entry: Dict[str, Any]) -> Dict[str, str]:
+            nonlocal remaining
+            url = entry['key']
+            if entry['state'] == DONE:
+                return entry['result']
+            async with semaphore:
+                if aborted.is_set():
+                    return self.make_result(url, 'skipped', '批量任务已中止')
+                pwd_id = self.get_pwd_id(url) if '/s/' in url else ''
+                if skip_known and self.ledger is not None and pwd_id and self.ledger.has_transfer(pwd_id, kind=kind):
+                    result = self.make_result(url, 'skipped', '已处理过，跳过', pwd_id=pwd_id)
+                else:
+                    self.checkpoint(job_id, url, IN_FLIGHT)
+                    custom_print(f"正在处理第{entry['seq'] + 1}个")
+                    try:
+                        result = await (runner or self.run)(url, folder_id, download=download)
+                    except QuarkApiError as e:
+                        if e.code == CAPACITY_CODE:
+                            aborted.set()
+                        result = self.make_result(url, 'failed', e.message)
+                    except Exception as e:
+                        custom_print(f'处理失败：{url}，{e!r}', error_msg=True)
+                        result = self.make_result(url, 'failed', repr(e))
+                if result['status'] == 'failed':
+                    self.checkpoint(job_id, url, FAILED, result, error=result['message'])
+                else:
+                    self.checkpoint(job_id, url, DONE, result)
+                if on_result is not None:
+                    on_result(result)
+                remaining -= 1
+                self.metrics.set_gauge('quark_batch_pending', remaining, kind=kind)
+                return result
+
+        results = await asyncio.gather(*(worker(entry) for entry in entries))
+        self.close_job(job_id)
+        self.print_batch_summary(results)
+        return list(results)
 
-            else:
-                if is_owner == 1:
-                    custom_print(f'网盘中已经存在该文件，无需再次转存')
-                    return
-                task_id = await self.get_share_save_task_id(pwd_id, stoken, fid_list, share_fid_token_list,
-                                                            to_pdir_fid=self.folder_id)
-                await self.submit_task(task_id)
-            print()
+    @staticmethod
+    def print_batch_summary(results: List[Dict[str, str]]) -> None:
+        counts: Dict[str, int] = {}
+        for result in results:
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+        custom_print(f"批量任务完成，共{len(results)}条链接：" + '，'.join(f'{k} {v}' for k, v in counts.items()))
+        failed = [result for result in results if result['status'] == 'failed']
+        if failed:
+            from prettytable import PrettyTable
+
+            table = PrettyTable(['序号', '分享地址', '失败原因'])
+            for idx, result in enumerate(failed, 1):
+                table.add_row([idx, result['url'], result['message']])
+            print(table)
 
     async def get_share_save_task_id(self, pwd_id: str, stoken: str, first_ids: List[str], share_fid_tokens: List[str],
                                      to_pdir_fid: str = '0') -> str:
-        task_url = "https://drive.quark.cn/1/clouddrive/share/sharepage/save"
+        task_url = f"{self.save_host}/1/clouddrive/share/sharepage/save"
         params = {
             "pr": "ucpro",
             "fr": "pc",
@@ -289,29 +666,129 @@ class QuarkPanFileManager:
                 "to_pdir_fid": to_pdir_fid, "pwd_id": pwd_id,
                 "stoken": stoken, "pdir_fid": "0", "scene": "link"}
 
-        async with httpx.AsyncClient() as client:
-            timeout = httpx.Timeout(60.0, connect=60.0)
-            response = await client.post(task_url, json=data, headers=self.headers, params=params, timeout=timeout)
-            json_data = response.json()
-            task_id = json_data['data']['task_id']
-            custom_print(f'获取任务ID：{task_id}')
-            return task_id
+        response = await self.request('POST', task_url, json=data, headers=self.headers, params=params)
+        json_data = self.check_response(response)
+        task_id = json_data['data']['task_id']
+        custom_print(f'获取任务ID：{task_id}')
+        return task_id
+
+    async def save_entries(self, pwd_id: str, stoken: str, entries: AsyncIterator[FileEntry],
+                           to_pdir_fid: str = '0') -> Dict[str, Any]:
+        # 按 save_batch_size 分批转存，最多 save_batch_concurrency 批同时提交并各自等待任务完成；
+        # 单批失败只记入统计，不影响其他批次；网盘容量不足或被限流时停止提交，等在途批次结束后抛出异常，
+        # 由 batch_run 中止任务或由账号池切换账号
+        # 已提交的批次记入已完成记录，再次转存同一链接时跳过已转存的条目，只提交失败的批次
+        summary: Dict[str, Any] = {'batches': 0, 'saved_batches': 0, 'failed_batches': 0, 'saved_items': 0,
+                                   'failed_items': 0, 'skipped_items': 0, 'task_ids': [], 'errors': []}
+        semaphore = asyncio.Semaphore(self.save_batch_concurrency)
+        tasks: List[asyncio.Task] = []
+        abort_error: List[QuarkApiError] = []
+        known, unresolved = await self.resolve_saved_items(pwd_id, to_pdir_fid)
+        for task_id, count in unresolved:
+            summary['batches'] += 1
+            summary['failed_batches'] += 1
+            summary['failed_items'] += count
+            summary['errors'].append(f'任务 {task_id} 尚未完成')
+
+        async def save_batch(index: int, fids: List[str], tokens: List[str]) -> None:
+            error = ''
+            task_id = ''
+            try:
+                task_id = await self.get_share_save_task_id(pwd_id, stoken, fids, tokens, to_pdir_fid=to_pdir_fid)
+                summary['task_ids'].append(task_id)
+                if self.ledger is not None:
+                    self.ledger.record_saved_items(pwd_id, to_pdir_fid, fids, task_id, status='submitted')
+                if not await self.submit_task(task_id):
+                    # 任务可能仍在服务端执行，保留 submitted 记录，下次运行时先查询任务结果
+                    error = f'任务 {task_id} 等待超时'
+                elif self.ledger is not None:
+                    self.ledger.record_saved_items(pwd_id, to_pdir_fid, fids, task_id)
+            except QuarkApiError as e:
+                # 任务明确失败时才删除 submitted 记录；被限流时任务结果未知，保留记录由下次运行查询
+                if task_id and not e.throttled and self.ledger is not None:
+                    self.ledger.forget_saved_items(pwd_id, to_pdir_fid, task_id=task_id)
+                if e.code == CAPACITY_CODE or e.throttled:
+                    abort_error.append(e)
+                error = e.message
+            except Exception as e:
+                error = repr(e)
+            finally:
+                semaphore.release()
+            if error:
+                summary['failed_batches'] += 1
+                summary['failed_items'] += len(fids)
+                summary['errors'].append(error)
+                self.metrics.inc('quark_save_batches_total', status='failed')
+                custom_print(f'第{index}批转存失败（{len(fids)}项）：{error}', error_msg=True)
+            else:
+                summary['saved_batches'] += 1
+                summary['saved_items'] += len(fids)
+                self.metrics.inc('quark_save_batches_total', status='saved')
+                if summary['batches'] > 1:
+                    done = summary['saved_batches'] + summary['failed_batches']
+                    custom_print(f"第{index}批转存完成（{len(fids)}项），已完成 {done} 批，"
+                                 f"共转存 {summary['saved_items']} 项")
+
+        async def submit(fids: List[str], tokens: List[str]) -> None:
+            # 先占用并发名额再创建任务，在途批次受限，条目流不会被提前读完
+            await semaphore.acquire()
+            summary['batches'] += 1
+            tasks.append(asyncio.create_task(save_batch(summary['batches'], fids, tokens)))
+
+        fids: List[str] = []
+        tokens: List[str] = []
+        try:
+            async for entry in entries:
+                if entry.fid in known:
+                    summary['skipped_items'] += 1
+                    continue
+                fids.append(entry.fid)
+                tokens.append(entry.share_fid_token)
+                if len(fids) >= self.save_batch_size:
+                    await submit(fids, tokens)
+                    fids, tokens = [], []
+                    if abort_error:
+                        break
+            if fids and not abort_error:
+                await submit(fids, tokens)
+        finally:
+            await asyncio.gather(*tasks)
+        if summary['skipped_items']:
+            custom_print(f"跳过上次已转存的 {summary['skipped_items']} 项")
+        if abort_error:
+            raise abort_error[0]
+        return summary
+
+    async def resolve_saved_items(self, pwd_id: str, to_pdir_fid: str) -> Tuple[Set[str], List[Tuple[str, int]]]:
+        # 返回上次已转存（或结果仍未知）的条目，以及仍未完成的任务 (task_id, 条目数)；
+        # 上次等待超时的任务先查询一次，失败的任务对应的条目重新转存
+        if self.ledger is None:
+            return set(), []
+        known = self.ledger.saved_items(pwd_id, to_pdir_fid)
+        unresolved = []
+        for task_id in {task_id for status, task_id in known.values() if status == 'submitted'}:
+            fids = [fid for fid, (_, item_task_id) in known.items() if item_task_id == task_id]
+            try:
+                json_data = await self.get_task(task_id)
+            except QuarkApiError as e:
+                if e.throttled:
+                    # 被限流时任务结果未知，本次不重新提交
+                    custom_print(f'任务 {task_id} 查询被限流，暂不重新转存其中的 {len(fids)} 项', error_msg=True)
+                    unresolved.append((task_id, len(fids)))
+                    continue
+                self.ledger.forget_saved_items(pwd_id, to_pdir_fid, task_id=task_id)
+                for fid in fids:
+                    known.pop(fid)
+                continue
+            if json_data['data'].get('status') == 2:
+                self.ledger.record_saved_items(pwd_id, to_pdir_fid, fids, task_id)
+            else:
+                # 仍在执行或无法确认时不重新提交，避免网盘中出现重复的文件
+                custom_print(f'任务 {task_id} 尚未完成，暂不重新转存其中的 {len(fids)} 项', error_msg=True)
+                unresolved.append((task_id, len(fids)))
+        return set(known), unresolved
 
-    @staticmethod
-    async def download_file(download_url: str, save_path: str, headers: dict) -> None:
-        async with httpx.AsyncClient() as client:
-            timeout = httpx.Timeout(60.0, connect=60.0)
-            async with client.stream("GET", download_url, headers=headers, timeout=timeout) as response:
-                total_size = int(response.headers["content-length"])
-                with open(save_path, "wb") as f:
-                    with tqdm(total=total_size, unit="B", unit_scale=True,
-                              desc=os.path.basename(save_path),
-                              ncols=80) as pbar:
-                        async for chunk in response.aiter_bytes():
-                            f.write(chunk)
-                            pbar.update(len(chunk))
-
-    async def quark_file_download(self, fids: List[str], folder: str = '') -> None:
+    async def get_download_urls(self, fids: List[str]) -> Union[List[Dict[str, Any]], None]:
         params = {
             'pr': 'ucpro',
             'fr': 'pc',
@@ -323,63 +800,119 @@ class QuarkPanFileManager:
         data = {
             'fids': fids
         }
-        download_api = 'https://drive-pc.quark.cn/1/clouddrive/file/download'
-        async with httpx.AsyncClient() as client:
-            timeout = httpx.Timeout(60.0, connect=60.0)
-            response = await client.post(download_api, json=data, headers=self.headers, params=params, timeout=timeout)
-            json_data = response.json()
-            data_list = json_data.get('data', None)
-            if json_data['status'] != 200:
-                custom_print(f"文件下载地址列表获取失败, {json_data['message']}", error_msg=True)
+        download_api = f'{self.api_host}/1/clouddrive/file/download'
+        response = await self.request('POST', download_api, json=data, headers=self.headers, params=params)
+        json_data = response.json()
+        data_list = json_data.get('data', None)
+        if json_data['status'] != 200:
+            custom_print(f"文件下载地址列表获取失败, {json_data['message']}", error_msg=True)
+            return
+        return data_list
+
+    async def download_share_tree(self, pwd_id: str, stoken: str, entries: AsyncIterator[FileEntry],
+                                  save_folder: str = 'downloads') -> Dict[str, Any]:
+        # 边遍历文件夹边下载，按网盘中的目录结构保存到本地；entries 为分享根目录的条目流
+        # 下载地址在文件开始下载时才由 DownloadUrlManager 分批获取，过期后自动重新获取
+        # 输出到标准输出时不记录已下载，每次都重新输出；S3 等非本地目标不检查本地文件是否存在
+        ledger = self.ledger if self.sink.durable else None
+
+        def on_complete(result: Dict[str, Any]) -> None:
+            if ledger is not None and result['key']:
+                ledger.record_download(result['key'], result['size'], result['path'])
+
+        scheduler = DownloadScheduler(self.downloader, self.headers, concurrency=self.download_concurrency,
+                                      on_complete=on_complete, sink=self.sink)
+        scheduler_task = asyncio.create_task(scheduler.run())
+        urls = DownloadUrlManager(self.get_download_urls)
+        skipped = 0
+
+        async def add_file(path: str, item: FileEntry) -> None:
+            nonlocal skipped
+            if ledger is not None and ledger.has_download(item['fid'], item.get('size'), check_file=self.sink.local):
+                skipped += 1
                 return
-            elif data_list:
-                custom_print('文件下载地址列表获取成功')
-
-            save_folder = f'downloads/{folder}' if folder else 'downloads'
-            os.makedirs(save_folder, exist_ok=True)
-            n = 0
-            for i in data_list:
-                n += 1
-                filename = i["file_name"]
-                custom_print(f'开始下载第{n}个文件-{filename}')
-                download_url = i["download_url"]
-                save_path = os.path.join(save_folder, filename)
-                await self.download_file(download_url, save_path, headers=self.headers)
-
-    async def submit_task(self, task_id: str, retry: int = 50) -> Union[
-                bool, Dict[str, Union[str, Dict[str, Union[int, str]]]]]:
-
-        for i in range(retry):
-            # 随机暂停100-50毫秒
-            await asyncio.sleep(random.randint(500, 1000) / 1000)
-            custom_print(f'第{i + 1}次提交任务')
-            submit_url = (f"https://drive-pc.quark.cn/1/clouddrive/task?pr=ucpro&fr=pc&uc_param_str=&task_id={task_id}"
-                          f"&retry_index={i}&__dt=21192&__t={get_timestamp(13)}")
-
-            async with httpx.AsyncClient() as client:
-                timeout = httpx.Timeout(60.0, connect=60.0)
-                response = await client.get(submit_url, headers=self.headers, timeout=timeout)
-                json_data = response.json()
-
-            if json_data['message'] == 'ok':
-                if json_data['data']['status'] == 2:
-                    if 'to_pdir_name' in json_data['data']['save_as']:
-                        folder_name = json_data['data']['save_as']['to_pdir_name']
-                    else:
-                        folder_name = ' 根目录'
-                    if json_data['data']['task_title'] == '分享-转存':
-                        custom_print(f"结束任务ID：{task_id}")
-                        custom_print(f'文件保存位置：{folder_name} 文件夹')
-                    return json_data
-            else:
-                if json_data['code'] == 32003 and 'capacity limit' in json_data['message']:
-                    custom_print("转存失败，网盘容量不足！请注意当前已成功保存的个数，避免重复保存", error_msg=True)
-                elif json_data['code'] == 41013:
-                    custom_print(f"”{to_dir_name}“ 网盘文件夹不存在，请重新运行按3切换保存目录后重试！", error_msg=True)
+            await scheduler.wait_room(DOWNLOAD_QUEUE_LIMIT)
+            size = item.get('size')
+            save_path = os.path.join(save_folder, path, item["file_name"])
+            # 地址按任务在下载队列中的顺序提前获取
+            scheduler.add(urls.link(item['fid'], scheduler.priority({'size': size})), save_path, size=size,
+                          key=item['fid'])
+
+        async def list_dir(fid: str, updated_at: Union[int, None]) -> List[FileEntry]:
+            _, file_list = await self.get_detail(pwd_id, stoken, pdir_fid=fid, updated_at=updated_at)
+            return file_list
+
+        try:
+            roots = []
+            async for item in entries:
+                if item.dir:
+                    roots.append((item.fid, item.file_name, item.updated_at))
                 else:
-                    custom_print(f"错误信息：{json_data['message']}", error_msg=True)
-                input(f'[{get_datetime()}] 已退出程序')
-                sys.exit()
+                    await add_file('', item)
+            async for path, item in walk_tree(list_dir, roots, workers=self.list_concurrency):
+                if not item['dir']:
+                    await add_file(path, item)
+        finally:
+            scheduler.close()
+            summary = await scheduler_task
+        if skipped:
+            custom_print(f'跳过 {skipped} 个已下载的文件')
+        self.print_download_summary(summary)
+        return summary
+
+    @staticmethod
+    def print_download_summary(summary: Dict[str, Any]) -> None:
+        custom_print(f"下载完成：成功 {summary['succeeded']} 个，失败 {summary['failed']} 个，"
+                     f"共 {summary['bytes'] / 1024 / 1024:.2f} MB，耗时 {summary['elapsed']:.1f} 秒，"
+                     f"平均速度 {summary['speed'] / 1024 / 1024:.2f} MB/s")
+        if summary['failures']:
+            from prettytable import PrettyTable
+
+            table = PrettyTable(['序号', '文件', '失败原因'])
+            for idx, failure in enumerate(summary['failures'], 1):
+                table.add_row([idx, failure['path'], failure['message']])
+            print(table)
+
+    async def get_task(self, task_id: str, retry_index: int = 0) -> Dict[str, Any]:
+        params = {
+            'pr': 'ucpro',
+            'fr': 'pc',
+            'uc_param_str': '',
+            'task_id': task_id,
+            'retry_index': str(retry_index),
+            '__dt': random.randint(100, 9999),
+            '__t': get_timestamp(13),
+        }
+        response = await self.request('GET', f'{self.api_host}/1/clouddrive/task', params=params,
+                                      headers=self.headers)
+        return self.check_response(response)
+
+    async def submit_task(self, task_id: str, timeout: Union[float, None] = None) -> Union[
+                None, Dict[str, Union[str, Dict[str, Union[int, str]]]]]:
+        custom_print(f'等待任务完成：{task_id}')
+        try:
+            with self.metrics.timer('quark_task_wait_seconds'):
+                json_data = await self.task_waiter.wait(task_id, timeout=timeout)
+        except TaskTimeoutError:
+            custom_print(f'任务等待超时：{task_id}', error_msg=True)
+            return None
+        except QuarkApiError as e:
+            if e.code == CAPACITY_CODE and 'capacity limit' in e.message:
+                custom_print("转存失败，网盘容量不足！请注意当前已成功保存的个数，避免重复保存", error_msg=True)
+            elif e.code == 41013:
+                custom_print(f"”{self.dir_name}“ 网盘文件夹不存在，请重新运行按3切换保存目录后重试！", error_msg=True)
+            else:
+                custom_print(f"错误信息：{e.message}", error_msg=True)
+            raise
+
+        if 'to_pdir_name' in json_data['data'].get('save_as', {}):
+            folder_name = json_data['data']['save_as']['to_pdir_name']
+        else:
+            folder_name = ' 根目录'
+        if json_data['data'].get('task_title') == '分享-转存':
+            custom_print(f"结束任务ID：{task_id}")
+            custom_print(f'文件保存位置：{folder_name} 文件夹')
+        return json_data
 
     def init_config(self, _user, _pdir_id, _dir_name):
         try:
@@ -420,6 +953,8 @@ class QuarkPanFileManager:
                 fd_list = file_list_data['data']['list']
                 fd_list = [{i['fid']: i['file_name']} for i in fd_list if i.get('dir')]
                 if fd_list:
+                    from prettytable import PrettyTable
+
                     table = PrettyTable(['序号', '文件夹ID', '文件夹名称'])
                     for idx, item in enumerate(fd_list, 1):
                         key, value = next(iter(item.items()))
@@ -462,27 +997,14 @@ class QuarkPanFileManager:
             'uc_param_str': '',
         }
 
-        async with httpx.AsyncClient() as client:
-            timeout = httpx.Timeout(60.0, connect=60.0)
-            response = await client.post('https://drive-pc.quark.cn/1/clouddrive/share', params=params,
-                                         json=json_data, headers=self.headers, timeout=timeout)
-            json_data = response.json()
-            return json_data['data']['task_id']
+        response = await self.request('POST', f'{self.api_host}/1/clouddrive/share', params=params,
+                                      json=json_data, headers=self.headers)
+        json_data = self.check_response(response)
+        return json_data['data']['task_id']
 
     async def get_share_id(self, task_id: str) -> str:
-        params = {
-            'pr': 'ucpro',
-            'fr': 'pc',
-            'uc_param_str': '',
-            'task_id': task_id,
-            'retry_index': '0',
-        }
-        async with httpx.AsyncClient() as client:
-            timeout = httpx.Timeout(60.0, connect=60.0)
-            response = await client.get('https://drive-pc.quark.cn/1/clouddrive/task', params=params,
-                                        headers=self.headers, timeout=timeout)
-            json_data = response.json()
-            return json_data['data']['share_id']
+        json_data = await self.task_waiter.wait(task_id)
+        return json_data['data']['share_id']
 
     async def submit_share(self, share_id: str) -> None:
         params = {
@@ -494,141 +1016,232 @@ class QuarkPanFileManager:
         json_data = {
             'share_id': share_id,
         }
-        async with httpx.AsyncClient() as client:
-            timeout = httpx.Timeout(60.0, connect=60.0)
-            response = await client.post('https://drive-pc.quark.cn/1/clouddrive/share/password', params=params,
-                                         json=json_data, headers=self.headers, timeout=timeout)
-            json_data = response.json()
-            share_url = json_data['data']['share_url']
-            if 'passcode' in json_data['data']:
-                share_url = share_url + f"?pwd={json_data['data']['passcode']}"
-            return share_url
+        response = await self.request('POST', f'{self.api_host}/1/clouddrive/share/password', params=params,
+                                      json=json_data, headers=self.headers)
+        json_data = self.check_response(response)
+        share_url = json_data['data']['share_url']
+        if 'passcode' in json_data['data']:
+            share_url = share_url + f"?pwd={json_data['data']['passcode']}"
+        return share_url
+
+    async def share_folders(self, units: List[Tuple[int, str, str, str]], on_result: Callable[[Dict[str, Any]], None],
+                            url_type: int = 1, expired_type: int = 2, password: str = '',
+                            concurrency: int = SHARE_CONCURRENCY, rate: float = SHARE_RATE,
+                            retry: int = 3,
+                            on_start: Union[Callable[[str], None], None] = None) -> List[Dict[str, Any]]:
+        # units 为 (序号, 一级目录, 二级目录, 文件夹ID)，on_result 按 units 的原始顺序回调，on_start 在开始分享某个文件夹时回调
+        limiter = AdaptiveRateLimiter(rate)
+        queue: asyncio.Queue = asyncio.Queue()
+        for index, unit in enumerate(units):
+            queue.put_nowait((index, unit))
+        finished: Dict[int, Dict[str, Any]] = {}
+        next_index = 0
+
+        def emit(index: int, result: Dict[str, Any]) -> None:
+            nonlocal next_index
+            finished[index] = result
+            while next_index in finished:
+                on_result(finished[next_index])
+                next_index += 1
+
+        async def share_one(n: int, first_dir: str, second_dir: str, fid: str) -> Dict[str, Any]:
+            with self.metrics.span('share_unit', folder=f'{first_dir}/{second_dir}', fid=fid) as span:
+                result = await share_attempts(n, first_dir, second_dir, fid)
+                if not result['share_url']:
+                    span.status = 'error'
+                    span.set('error', result['error'])
+                return result
+
+        async def share_attempts(n: int, first_dir: str, second_dir: str, fid: str) -> Dict[str, Any]:
+            result = {'n': n, 'first_dir': first_dir, 'second_dir': second_dir, 'fid': fid, 'share_url': '',
+                      'error': ''}
+            attempt = 0
+            throttled = 0
+            while attempt < retry:
+                await limiter.acquire()
+                try:
+                    custom_print(f'{n}.开始分享 {first_dir}/{second_dir} 文件夹')
+                    task_id = await self.get_share_task_id(fid, second_dir, url_type=url_type,
+                                                           expired_type=expired_type, password=password)
+                    share_id = await self.get_share_id(task_id)
+                    result['share_url'] = await self.submit_share(share_id)
+                    limiter.on_success()
+                    custom_print(f'{n}.分享成功 {first_dir}/{second_dir} 文件夹')
+                    return result
+                except QuarkApiError as e:
+                    result['error'] = str(e)
+                    if e.throttled and throttled < 8:
+                        # 被限流不计入重试次数，降低速率并退避后重试
+                        throttled += 1
+                        limiter.on_throttle()
+                        self.metrics.inc('quark_throttled_total', operation='share')
+                        await asyncio.sleep(min(2 ** throttled, 60) * random.uniform(0.5, 1.5))
+                        continue
+                except Exception as e:
+                    result['error'] = repr(e)
+                attempt += 1
+                if attempt < retry:
+                    self.metrics.inc('quark_retries_total', operation='share')
+            return result
+
+        async def worker() -> None:
+            while not queue.empty():
+                index, unit = queue.get_nowait()
+                if on_start is not None:
+                    on_start(unit[3])
+                emit(index, await share_one(*unit))
+
+        await asyncio.gather(*(worker() for _ in range(min(concurrency, len(units)))))
+        return [finished[index] for index in range(len(units))]
+
+    def share_entries(self, kind: str, parts: List[Any],
+                      units: List[Tuple[int, str, str, str]]) -> Tuple[str, List[Dict[str, Any]]]:
+        # 分享任务以文件夹ID为单元登记到任务日志，返回任务ID与全部单元（含上次运行已完成的单元）
+        return self.open_job(kind, parts, [(fid, {'n': n, 'first_dir': first_dir, 'second_dir': second_dir, 'fid': fid})
+                                           for n, first_dir, second_dir, fid in units])
 
+    @staticmethod
+    async def write_share_urls(writer: ResultWriter, entries: List[Dict[str, Any]]) -> int:
+        # 按单元顺序重写分享链接文件，先写临时文件再替换，中途退出也不会丢失已有结果
+        return await writer.rewrite(entry['result'] for entry in entries
+                                    if entry['state'] == DONE and entry['result'] and entry['result']['share_url'])
+
+    async def find_share_folders(self, root_fid: str, depth: int = SHARE_DEPTH,
+                                 predicate: Union[SharePredicate, None] = None,
+                                 max_depth: Union[int, None] = None) -> List[Tuple[str, str, str]]:
+        # 返回要分享的 (父文件夹相对路径, 文件夹名, fid)，按路径排序
+        # 未指定 predicate 时分享第 depth 层的全部文件夹；否则分享满足 predicate 的文件夹，且不再遍历其子文件夹，
+        # max_depth 限制遍历的层数
+        sort = 'file_type:asc,file_name:asc'
+
+        async def list_dir(fid: str, updated_at: Union[int, None]) -> List[Dict[str, Any]]:
+            return await self.get_all_sorted_file_list(fid, sort=sort, updated_at=updated_at)
+
+        targets = []
+        roots = [(root_fid, '', None)]
+        if predicate is None:
+            async for path, level, _, entries in walk_folders(list_dir, roots, workers=self.list_concurrency,
+                                                              max_depth=depth):
+                if level == depth:
+                    targets.extend((path, entry['file_name'], entry['fid']) for entry in entries if entry['dir'])
+        else:
+            matched = set()
+
+            def expand(path: str, folder: Union[Dict[str, Any], None], entries: List[Dict[str, Any]]) -> bool:
+                if folder is not None and predicate(path, folder, entries):
+                    matched.add(folder['fid'])
+                    return False
+                return True
+
+            async for path, _, folder, _ in walk_folders(list_dir, roots, workers=self.list_concurrency,
+                                                         max_depth=max_depth, expand=expand):
+                if folder is not None and folder['fid'] in matched:
+                    targets.append((posixpath.dirname(path), folder['file_name'], folder['fid']))
+        targets.sort(key=lambda target: (target[0].split('/'), target[1]))
+        return targets
+
+    @traced('share_run', 'share_url')
     async def share_run(self, share_url: str, folder_id: Union[str, None] = None, url_type: int = 1,
-                        expired_type: int = 2, password: str = '') -> None:
-        first_dir = ''
-        second_dir = ''
+                        expired_type: int = 2, password: str = '',
+                        on_result: Union[Callable[[Dict[str, Any]], None], None] = None, depth: int = SHARE_DEPTH,
+                        predicate: Union[SharePredicate, None] = None, max_depth: Union[int, None] = None,
+                        result_format: str = 'text') -> None:
+        # result_format 为分享链接文件的格式（text/csv/jsonl），失败记录与 retry.txt 始终为 text 格式
         try:
             self.folder_id = folder_id
             custom_print(f'文件夹网页地址：{share_url}')
             pwd_id = share_url.rsplit('/', maxsplit=1)[1].split('-')[0]
 
-            first_page = 1
-            n = 0
-            error = 0
             os.makedirs('share', exist_ok=True)
-            save_share_path = 'share/share_url.txt'
-
-            safe_copy(save_share_path, 'share/share_url_backup.txt')
-            with open(save_share_path, 'w', encoding='utf-8'):
-                pass
-            while True:
-                json_data = await self.get_sorted_file_list(pwd_id, page=str(first_page), size='50', fetch_total='1',
-                                                            sort='file_type:asc,file_name:asc')
-                for i1 in json_data['data']['list']:
-                    if i1['dir']:
-                        first_dir = i1['file_name']
-                        second_page = 1
-                        while True:
-                            # print(f'正在获取{first_dir}第{first_page}页，二级目录第{second_page}页，目前共分享{n}文件')
-                            json_data2 = await self.get_sorted_file_list(i1['fid'], page=str(second_page),
-                                                                         size='50', fetch_total='1',
-                                                                         sort='file_type:asc,file_name:asc')
-                            for i2 in json_data2['data']['list']:
-                                if i2['dir']:
-                                    n += 1
-                                    share_success = False
-                                    share_error_msg = ''
-                                    fid = ''
-                                    for i in range(3):
-                                        try:
-                                            second_dir = i2['file_name']
-                                            custom_print(f'{n}.开始分享 {first_dir}/{second_dir} 文件夹')
-                                            random_time = random.choice([0.5, 1, 1.5, 2])
-                                            await asyncio.sleep(random_time)
-                                            # print('获取到文件夹ID：', i2['fid'])
-                                            fid = i2['fid']
-                                            task_id = await self.get_share_task_id(fid, second_dir, url_type=url_type,
-                                                                                   expired_type=expired_type,
-                                                                                   password=password)
-                                            share_id = await self.get_share_id(task_id)
-                                            share_url = await self.submit_share(share_id)
-                                            with open(save_share_path, 'a', encoding='utf-8') as f:
-                                                content = f'{n} | {first_dir} | {second_dir} | {share_url}'
-                                                f.write(content + '\n')
-                                                custom_print(f'{n}.分享成功 {first_dir}/{second_dir} 文件夹')
-                                                share_success = True
-                                                break
-
-                                        except Exception as e:
-                                            share_error_msg = e
-                                            error += 1
-
-                                    if not share_success:
-                                        print('分享失败：', share_error_msg)
-                                        save_config('./share/share_error.txt',
-                                                    content=f'{error}.{first_dir}/{second_dir} 文件夹\n', mode='a')
-                                        save_config('./share/retry.txt',
-                                                    content=f'{n} | {first_dir} | {second_dir} | {fid}\n', mode='a')
-                            second_total = json_data2['metadata']['_total']
-                            second_size = json_data2['metadata']['_size']
-                            second_page = json_data2['metadata']['_page']
-                            if second_size * second_page >= second_total:
-                                break
-                            second_page += 1
-
-                second_total = json_data['metadata']['_total']
-                second_size = json_data['metadata']['_size']
-                second_page = json_data['metadata']['_page']
-                if second_size * second_page >= second_total:
-                    break
-                first_page += 1
-            custom_print(f"总共分享了 {n} 个文件夹，已经保存至 {save_share_path}")
+            save_share_path = result_path('share/share_url.txt', result_format)
+
+            safe_copy(save_share_path, result_path('share/share_url_backup.txt', result_format))
+            # first_dir 为父文件夹的相对路径，分享第 2 层时即第一层文件夹名
+            targets = await self.find_share_folders(pwd_id, depth=depth, predicate=predicate, max_depth=max_depth)
+            units = [(n, parent, name, fid) for n, (parent, name, fid) in enumerate(targets, start=1)]
+
+            parts = [pwd_id, url_type, expired_type, password]
+            if predicate is not None:
+                parts += [predicate.__qualname__, max_depth]
+            elif depth != SHARE_DEPTH:
+                parts.append(depth)
+            job_id, entries = self.share_entries('share', parts, units)
+            error = 0
+            async with ResultWriter(save_share_path, SHARE_FIELDS, fmt=result_format) as url_writer, \
+                    ResultWriter('./share/share_error.txt', ['message']) as error_writer, \
+                    ResultWriter('./share/retry.txt', RETRY_FIELDS) as retry_writer:
+                # 先写入上次运行已完成的结果，本次的结果随后追加，结束时再按顺序整体重写
+                await self.write_share_urls(url_writer, entries)
+
+                def write_result(result: Dict[str, Any]) -> None:
+                    nonlocal error
+                    if on_result is not None:
+                        on_result(result)
+                    if result['share_url']:
+                        self.checkpoint(job_id, result['fid'], DONE, result)
+                        url_writer.write(result)
+                    else:
+                        error += 1
+                        self.checkpoint(job_id, result['fid'], FAILED, result, error=result['error'])
+                        print('分享失败：', result['error'])
+                        error_writer.write({'message': f"{error}.{result['first_dir']}/{result['second_dir']} 文件夹"})
+                        retry_writer.write(result)
+
+                pending = [entry for entry in entries if entry['state'] != DONE]
+                await self.share_folders([(entry['seq'] + 1, entry['payload']['first_dir'],
+                                           entry['payload']['second_dir'], entry['key']) for entry in pending],
+                                         write_result, url_type=url_type, expired_type=expired_type,
+                                         password=password, concurrency=self.share_concurrency, rate=self.share_rate,
+                                         on_start=lambda fid: self.checkpoint(job_id, fid, IN_FLIGHT))
+                if self.journal is not None:
+                    self.close_job(job_id)
+                    await self.write_share_urls(url_writer, self.journal.units(job_id))
+            custom_print(f"总共分享了 {len(entries) - error} 个文件夹，已经保存至 {save_share_path}")
 
         except Exception as e:
             print('分享失败：', e)
-            with open('./share/share_error.txt', 'a', encoding='utf-8') as f:
-                f.write(f'{first_dir}/{second_dir} 文件夹')
-
-    async def share_run_retry(self, retry_url: str, url_type: int = 1, expired_type: int = 2, password: str = ''):
-
-        data_list = retry_url.split('\n')
-        n = 0
-        error = 0
-        save_share_path = 'share/retry_share_url.txt'
-        error_data = []
-        for i1 in data_list:
+            save_config('./share/share_error.txt', content=f'{share_url} 文件夹列表获取失败\n', mode='a')
+
+    @traced('share_run_retry')
+    async def share_run_retry(self, retry_url: str, url_type: int = 1, expired_type: int = 2, password: str = '',
+                              result_format: str = 'text'):
+        save_share_path = result_path('share/retry_share_url.txt', result_format)
+        units = []
+        for i1 in retry_url.split('\n'):
             data = i1.split(' | ')
             if data and len(data) == 4:
-                first_dir = data[-3]
-                second_dir = data[-2]
-                fid = data[-1]
-                share_error_msg = ''
-                for i in range(3):
-                    try:
-                        task_id = await self.get_share_task_id(fid, second_dir, url_type=url_type,
-                                                               expired_type=expired_type,
-                                                               password=password)
-                        # print('获取到任务ID：', task_id)
-                        share_id = await self.get_share_id(task_id)
-                        # print('获取到分享ID：', share_id)
-                        share_url = await self.submit_share(share_id)
-                        with open(save_share_path, 'a', encoding='utf-8') as f:
-                            content = f'{n} | {first_dir} | {second_dir} | {share_url}'
-                            f.write(content + '\n')
-                            custom_print(f'{n}.分享成功 {first_dir}/{second_dir} 文件夹')
-                            share_success = True
-                            break
-                    except Exception as e:
-                        # print('分享失败：', e)
-                        share_error_msg = e
-                        error += 1
+                units.append((int(data[0]) if data[0].isdigit() else len(units) + 1, data[-3], data[-2], data[-1]))
+
+        job_id, entries = self.share_entries('share-retry', [retry_url, url_type, expired_type, password], units)
+        # retry.txt 即本次的输入：仍然失败的条目先写入临时文件，正常结束后才替换 retry.txt，
+        # 中途出错或中断时 retry.txt 保持不变，下次运行得到相同的任务ID，可以从任务日志继续
+        async with ResultWriter(save_share_path, SHARE_FIELDS, fmt=result_format) as url_writer, \
+                ResultWriter('./share/retry.txt', RETRY_FIELDS, append=False) as retry_writer:
+
+            def on_result(result: Dict[str, Any]) -> None:
+                if result['share_url']:
+                    self.checkpoint(job_id, result['fid'], DONE, result)
+                    url_writer.write(result)
+                else:
+                    self.checkpoint(job_id, result['fid'], FAILED, result, error=result['error'])
+                    print('分享失败：', result['error'])
+                    retry_writer.write(result)
 
-                if not share_success:
-                    print('分享失败：', share_error_msg)
-                    error_data.append(i1)
-        error_content = '\n'.join(error_data)
-        save_config(path='./share/retry.txt', content=error_content, mode='w')
+            pending = [entry for entry in entries if entry['state'] != DONE]
+            await self.share_folders([(entry['payload']['n'], entry['payload']['first_dir'],
+                                       entry['payload']['second_dir'], entry['key']) for entry in pending], on_result,
+                                     url_type=url_type, expired_type=expired_type, password=password,
+                                     concurrency=self.share_concurrency, rate=self.share_rate,
+                                     on_start=lambda fid: self.checkpoint(job_id, fid, IN_FLIGHT))
+        self.close_job(job_id)
+
+
+def run_async(manager: QuarkPanFileManager, coro: Any) -> Any:
+    async def runner() -> Any:
+        async with manager:
+            return await coro
+
+    return asyncio.run(runner())
 
 
 def load_url_file(fpath: str) -> List[str]:
@@ -665,7 +1278,12 @@ if __name__ == '__main__':
     while True:
         print_menu()
 
-        to_dir_id, to_dir_name = asyncio.run(quark_file_manager.load_folder_id())
+        try:
+            to_dir_id, to_dir_name = run_async(quark_file_manager, quark_file_manager.load_folder_id())
+        except QuarkApiError:
+            input("登录失败！请重新运行本程序，然后在弹出的浏览器中登录夸克账号")
+            with open(f'{CONFIG_DIR}/cookies.txt', 'w', encoding='utf-8'):
+                sys.exit(-1)
 
         input_text = input("请输入你的选择(1—6或q退出)：")
 
@@ -686,16 +1304,18 @@ if __name__ == '__main__':
                         custom_print(f"\r检测到url.txt文件中有{len(urls)}条分享链接")
                         ok = input("请你确认是否开始批量保存(确认请按2):")
                         if ok and ok.strip() == '2':
-                            for index, url in enumerate(urls):
-                                print(f"正在转存第{index + 1}个")
-                                asyncio.run(quark_file_manager.run(url.strip(), to_dir_id))
+                            run_async(quark_file_manager, quark_file_manager.batch_run(
+                                urls, to_dir_id, concurrency=BATCH_CONCURRENCY))
                     except FileNotFoundError:
                         with open('url.txt', 'w', encoding='utf-8'):
                             sys.exit(-1)
                 else:
                     url = input("请输入夸克文件分享地址：")
                     if url and len(url.strip()) > 20:
-                        asyncio.run(quark_file_manager.run(url.strip(), to_dir_id))
+                        try:
+                            run_async(quark_file_manager, quark_file_manager.run(url.strip(), to_dir_id))
+                        except QuarkApiError:
+                            continue
 
             elif input_text.strip() == '2':
                 share_option = input("请输入你的选择(1分享 2重试分享)：")
@@ -722,21 +1342,23 @@ if __name__ == '__main__':
                 url_encrypt = 2 if is_private == '2' else 1
                 passcode = input('请输入你想设置的分享提取码(直接回车，可随机生成):') if url_encrypt == 2 else ''
                 if share_option and share_option == '1':
-                    asyncio.run(quark_file_manager.share_run(
+                    share_depth = input(f'请输入要分享第几层的文件夹(直接回车默认{SHARE_DEPTH}):').strip()
+                    run_async(quark_file_manager, quark_file_manager.share_run(
                         url.strip(), folder_id=to_dir_id, url_type=int(url_encrypt),
-                        expired_type=int(_expired_type), password=passcode))
+                        expired_type=int(_expired_type), password=passcode,
+                        depth=int(share_depth) if share_depth.isdigit() and int(share_depth) > 0 else SHARE_DEPTH))
                 else:
-                    asyncio.run(quark_file_manager.share_run_retry(url.strip(), url_type=url_encrypt,
-                                                                   expired_type=_expired_type, password=passcode))
+                    run_async(quark_file_manager, quark_file_manager.share_run_retry(
+                        url.strip(), url_type=url_encrypt, expired_type=_expired_type, password=passcode))
 
             elif input_text.strip() == '3':
-                to_dir_id, to_dir_name = asyncio.run(quark_file_manager.load_folder_id(renew=True))
+                to_dir_id, to_dir_name = run_async(quark_file_manager, quark_file_manager.load_folder_id(renew=True))
                 custom_print(f"已切换保存目录至网盘 {to_dir_name} 文件夹\n")
 
             elif input_text.strip() == '4':
                 create_name = input("请输入需要创建的文件夹名称：")
                 if create_name:
-                    asyncio.run(quark_file_manager.create_dir(create_name.strip()))
+                    run_async(quark_file_manager, quark_file_manager.create_dir(create_name.strip()))
                 else:
                     custom_print("创建的文件夹名称不可为空！")
 
@@ -746,15 +1368,15 @@ if __name__ == '__main__':
                     if is_batch:
                         if is_batch.strip() == '1':
                             url = input("请输入夸克文件分享地址：")
-                            asyncio.run(quark_file_manager.run(url.strip(), to_dir_id, download=True))
+                            run_async(quark_file_manager, quark_file_manager.run(url.strip(), to_dir_id, download=True))
                         elif is_batch.strip() == '2':
                             urls = load_url_file('./url.txt')
                             if not urls:
                                 print('\n分享地址为空！请先在url.txt文件中输入分享地址(一行一个)')
                                 continue
 
-                            for index, url in enumerate(urls):
-                                asyncio.run(quark_file_manager.run(url.strip(), to_dir_id, download=True))
+                            run_async(quark_file_manager, quark_file_manager.batch_run(
+                                urls, to_dir_id, download=True, concurrency=BATCH_CONCURRENCY))
 
                 except FileNotFoundError:
                     with open('url.txt', 'w', encoding='utf-8'):
@@ -1,29 +1,50 @@
+import json
 import os
 import subprocess
 import time
 from typing import Dict, Union, List
-from playwright.sync_api import sync_playwright
-from retrying import retry
 
 CONFIG_DIR = './config'
-os.makedirs(CONFIG_DIR, exist_ok=True)
+ACCOUNTS_DIR = f'{CONFIG_DIR}/accounts'
+
+
+def ensure_config_dir() -> str:
+    os.makedirs(CONFIG_DIR, exist_ok=True)
+    return CONFIG_DIR
 
 
 class QuarkLogin:
-    def __init__(self, headless: bool = True, slow_mo: int = 0):
+    def __init__(self, headless: bool = True, slow_mo: int = 0, cookies_path: str = f'{CONFIG_DIR}/cookies.txt',
+                 user_data_dir: str = './web_browser_data'):
         self.headless = headless
         self.slow_mo = slow_mo
         self.context = None
-
-    @staticmethod
-    def save_cookies(page) -> None:
+        self.cookies_path = cookies_path
+        self.user_data_dir = user_data_dir
+        # 解析后的 Cookie 按 Cookie 文件的修改时间缓存，避免每次启动都重新解析；
+        # 如 config/cookies.txt 对应 config/cookies.header.json，内容同样是登录凭据，只有当前用户可读写
+        self.cache_path = f'{os.path.splitext(cookies_path)[0]}.header.json'
+
+    @classmethod
+    def for_account(cls, name: str, headless: bool = True, slow_mo: int = 0) -> 'QuarkLogin':
+        # 多账号时每个账号使用独立的 Cookie 文件与浏览器数据目录
+        return cls(headless=headless, slow_mo=slow_mo, cookies_path=f'{ACCOUNTS_DIR}/{name}.txt',
+                   user_data_dir=f'./web_browser_data_{name}')
+
+    def save_cookies(self, page) -> None:
         cookie = page.context.cookies()
 
-        with open(f'{CONFIG_DIR}/cookies.txt', 'w', encoding='utf-8') as f:
+        os.makedirs(os.path.dirname(self.cookies_path) or '.', exist_ok=True)
+        with open(self.cookies_path, 'w', encoding='utf-8') as f:
             f.write(str(cookie))
 
-    @retry
     def login(self) -> None:
+        # playwright 与 retrying 只在需要登录时才导入，Cookie 有效时启动不必加载浏览器相关模块
+        from retrying import retry
+        retry(self._login)()
+
+    def _login(self) -> None:
+        from playwright.sync_api import sync_playwright
 
         # print("正在进行Playwright初始化...")
         # os.environ['PLAYWRIGHT_BROWSERS_PATH'] = '0'
@@ -33,7 +54,7 @@ class QuarkLogin:
 
         with sync_playwright() as p:
             self.context = p.firefox.launch_persistent_context(
-                './web_browser_data',
+                self.user_data_dir,
                 headless=self.headless,
                 slow_mo=self.slow_mo,
                 args=['--start-maximized'],
@@ -67,14 +88,38 @@ class QuarkLogin:
         cookie_str = '; '.join([f"{key}={value}" for key, value in cookies_dict.items()])
         return cookie_str
 
+    def load_cached_cookies(self) -> Union[Dict[str, str], None]:
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            if cached.get('mtime') == os.stat(self.cookies_path).st_mtime_ns:
+                return cached['cookies']
+        except (OSError, ValueError, KeyError):
+            pass
+        return None
+
+    def save_cached_cookies(self, cookies_dict: Dict[str, str]) -> None:
+        try:
+            cached = {'mtime': os.stat(self.cookies_path).st_mtime_ns, 'cookies': cookies_dict}
+            fd = os.open(self.cache_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            # 之前版本创建的缓存文件权限可能较宽，创建时指定的权限对已存在的文件不生效
+            os.chmod(self.cache_path, 0o600)
+            with open(fd, 'w', encoding='utf-8') as f:
+                json.dump(cached, f)
+        except OSError:
+            pass
+
     def check_cookies(self) -> Union[None, Union[Dict[str, str], str]]:
         try:
-            with open(f'{CONFIG_DIR}/cookies.txt', 'r') as f:
+            with open(self.cookies_path, 'r') as f:
                 content = f.read()
 
             if content and '[' in content:
-                saved_cookies = eval(content)
-                cookies_dict = self.transfer_cookies(saved_cookies)
+                cookies_dict = self.load_cached_cookies()
+                if cookies_dict is None:
+                    saved_cookies = eval(content)
+                    cookies_dict = self.transfer_cookies(saved_cookies)
+                    self.save_cached_cookies(cookies_dict)
                 timestamp = int(time.time())
                 if 'expires' in cookies_dict and timestamp > int(cookies_dict['expires']):
                     return None
@@ -89,7 +134,7 @@ class QuarkLogin:
         cookie = self.check_cookies()
         if not cookie:
             self.login()
-            with open(f'{CONFIG_DIR}/cookies.txt', 'r') as f:
+            with open(self.cookies_path, 'r') as f:
                 content = f.read()
                 if not content:
                     return
@@ -104,7 +149,13 @@ class QuarkLogin:
 
 
 if __name__ == '__main__':
-    quark_login = QuarkLogin(headless=False, slow_mo=500)
+    # 用法：python quark_login.py [账号名]，指定账号名时登录信息保存至 config/accounts/账号名.txt
+    import sys
+
+    if len(sys.argv) > 1:
+        quark_login = QuarkLogin.for_account(sys.argv[1], headless=False, slow_mo=500)
+    else:
+        quark_login = QuarkLogin(headless=False, slow_mo=500)
     quark_login.login()
     cookies = quark_login.get_cookies()
     # print('Cookie:', cookies)
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import csv
+import io
+import json
+import os
+from typing import Any, Dict, Iterable, List, TextIO, Union
+
+FORMATS = ('text', 'csv', 'jsonl')
+EXTENSIONS = {'text': '.txt', 'csv': '.csv', 'jsonl': '.jsonl'}
+# 缓冲的记录数达到 FLUSH_SIZE 或距上次写入超过 FLUSH_INTERVAL 秒时写入文件
+FLUSH_SIZE = 100
+FLUSH_INTERVAL = 1.0
+
+
+def result_path(path: str, fmt: str) -> str:
+    # 按输出格式替换扩展名，如 share/share_url.txt -> share/share_url.csv
+    return os.path.splitext(path)[0] + EXTENSIONS[fmt]
+
+
+class ResultWriter:
+    # 一个任务对应一个结果文件：write 只把记录放入缓冲区，由后台任务批量写入
+    # append=True 时追加到一直打开的文件，每批写入后 flush 并 fsync，每行只写入一次；
+    # append=False 时写入同目录的 .tmp 文件，正常结束时才整体替换原文件，中途出错或中断时原文件保持不变
+    # text 格式为 fields 各字段以 " | " 连接，与 share_url.txt、retry.txt 的原有格式一致
+    def __init__(self, path: str, fields: List[str], fmt: str = 'text', append: bool = True,
+                 flush_size: int = FLUSH_SIZE, flush_interval: float = FLUSH_INTERVAL) -> None:
+        if fmt not in FORMATS:
+            raise ValueError(f'不支持的输出格式：{fmt}')
+        self.path: str = path
+        self.tmp_path: str = path + '.tmp'
+        self.fields: List[str] = fields
+        self.fmt: str = fmt
+        self.append: bool = append
+        self.flush_size: int = flush_size
+        self.flush_interval: float = flush_interval
+        self.count: int = 0
+        self._buffer: List[str] = []
+        self._file: Union[TextIO, None] = None
+        self._lock: asyncio.Lock = asyncio.Lock()
+        self._wake: asyncio.Event = asyncio.Event()
+        self._task: Union[asyncio.Task, None] = None
+        self._closed: bool = False
+
+    async def __aenter__(self) -> 'ResultWriter':
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type: Any, *exc_info: Any) -> None:
+        # 出错或被中断时不替换原文件
+        await self.close(commit=exc_type is None)
+
+    async def open(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        await self._run_io(self._open)
+        self._task = asyncio.create_task(self._run())
+
+    def format(self, record: Dict[str, Any]) -> str:
+        values = [record.get(field, '') for field in self.fields]
+        if self.fmt == 'jsonl':
+            return json.dumps(dict(zip(self.fields, values)), ensure_ascii=False) + '\n'
+        if self.fmt == 'csv':
+            buffer = io.StringIO()
+            csv.writer(buffer, lineterminator='\n').writerow(values)
+            return buffer.getvalue()
+        return ' | '.join(str(value) for value in values) + '\n'
+
+    def header(self) -> str:
+        return self.format(dict(zip(self.fields, self.fields))) if self.fmt == 'csv' else ''
+
+    def write(self, record: Dict[str, Any]) -> None:
+        if self._closed:
+            raise RuntimeError(f'结果文件已关闭：{self.path}')
+        self._buffer.append(self.format(record))
+        self.count += 1
+        if len(self._buffer) >= self.flush_size:
+            self._wake.set()
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if not self._buffer:
+                return
+            lines, self._buffer = self._buffer, []
+            await self._run_io(self._write, ''.join(lines))
+
+    async def rewrite(self, records: Iterable[Dict[str, Any]]) -> int:
+        # 用 records 整体替换已写入的内容（丢弃尚未写入的缓冲），返回写入的记录数
+        lines = [self.format(record) for record in records]
+        async with self._lock:
+            self._buffer.clear()
+            await self._run_io(self._rewrite, ''.join(lines))
+        return len(lines)
+
+    @staticmethod
+    async def _run_io(func: Any, *args: Any) -> Any:
+        # 文件 IO 在线程池中运行，避免阻塞事件循环
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    def _open(self) -> None:
+        target = self.path if self.append else self.tmp_path
+        mode = 'a' if self.append and os.path.exists(self.path) and os.path.getsize(self.path) > 0 else 'w'
+        self._file = open(target, mode, encoding='utf-8', newline='')
+        if mode == 'w':
+            self._write(self.header())
+
+    def _write(self, text: str) -> None:
+        self._file.write(text)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _rewrite(self, text: str) -> None:
+        if not self.append:
+            self._file.seek(0)
+            self._file.truncate()
+            self._write(self.header() + text)
+            return
+        # 先写临时文件再替换，其他进程读取时不会看到写了一半的文件
+        self._file.close()
+        with open(self.tmp_path, 'w', encoding='utf-8', newline='') as f:
+            f.write(self.header() + text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.tmp_path, self.path)
+        self._file = open(self.path, 'a', encoding='utf-8', newline='')
+
+    def _close(self, commit: bool) -> None:
+        self._file.close()
+        self._file = None
+        if not self.append:
+            if commit:
+                os.replace(self.tmp_path, self.path)
+            else:
+                os.remove(self.tmp_path)
+
+    async def _run(self) -> None:
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def close(self, commit: bool = True) -> None:
+        # commit 为 False 时（append=False）丢弃临时文件，原文件保持不变；追加模式下已得到的结果总是写入
+        if self._closed:
+            return
+        self._closed = True
+        if self._task is not None:
+            self._wake.set()
+            task, self._task = self._task, None
+            await task
+        await self.flush()
+        if self._file is not None:
+            await self._run_io(self._close, commit)
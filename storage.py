@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+# 下载的存储目标：本地目录（默认，支持分片与断点续传）、标准输出、S3 兼容的对象存储（分段上传，不经过本地磁盘）
+# open_sink('downloads') / open_sink('-') / open_sink('s3://bucket/prefix')；S3 的地址与密钥取自环境变量
+# S3_ENDPOINT_URL、AWS_ACCESS_KEY_ID、AWS_SECRET_ACCESS_KEY、AWS_SESSION_TOKEN、AWS_REGION
+
+import asyncio
+import contextlib
+import datetime
+import hashlib
+import hmac
+import os
+import sys
+from typing import AsyncIterator, BinaryIO, Dict, List, Tuple, Union
+from urllib.parse import quote, unquote, urlsplit
+from xml.etree import ElementTree
+
+import httpx
+
+from downloader import SegmentedDownloader, DownloadError, DownloadUrl, IntegrityError, ProgressCallback
+from integrity import StreamHasher, hash_executor, normalize_md5
+from metrics import METRICS
+
+MB = 1024 * 1024
+# S3 要求除最后一段外每段至少 5MB，最多 10000 段
+PART_SIZE = 8 * MB
+MAX_PARTS = 10000
+# 所有文件共用的上传缓冲区个数，内存占用上限约为 BUFFER_COUNT * 分段大小，与文件大小和并发数无关
+BUFFER_COUNT = 6
+EMPTY_SHA256 = hashlib.sha256(b'').hexdigest()
+
+
+class StorageError(DownloadError):
+    pass
+
+
+class LocalSink:
+    # 写入本地目录，即 SegmentedDownloader 原有的分片下载与断点续传
+    # local：保存路径是否为本地文件；durable：完成后能否据此跳过重复下载
+    local = True
+    durable = True
+
+    def __init__(self, root: str = 'downloads') -> None:
+        self.root: str = root
+
+    async def store(self, downloader: SegmentedDownloader, url: DownloadUrl, save_path: str, headers: Dict[str, str],
+                    size: Union[int, None] = None, progress: Union[ProgressCallback, None] = None,
+                    on_size: Union[ProgressCallback, None] = None, md5: Union[str, None] = None) -> int:
+        os.makedirs(os.path.dirname(save_path) or '.', exist_ok=True)
+        return await downloader.download(url, save_path, headers, size=size, progress=progress, on_size=on_size,
+                                         md5=md5)
+
+    async def close(self) -> None:
+        pass
+
+
+class StdoutSink:
+    # 依次把文件内容写到标准输出（或其他二进制流），便于通过管道交给其他程序；多个文件首尾相接，不会交错
+    # 内容一经输出无法撤回，因此校验失败只记为失败，不会重新下载
+    local = False
+    durable = False
+
+    def __init__(self, output: Union[BinaryIO, None] = None) -> None:
+        # 默认使用进程真正的标准输出，命令行模式会把 sys.stdout 重定向到 stderr 输出日志
+        self.output: BinaryIO = output or sys.__stdout__.buffer
+        self.lock: asyncio.Lock = asyncio.Lock()
+
+    async def store(self, downloader: SegmentedDownloader, url: DownloadUrl, save_path: str, headers: Dict[str, str],
+                    size: Union[int, None] = None, progress: Union[ProgressCallback, None] = None,
+                    on_size: Union[ProgressCallback, None] = None, md5: Union[str, None] = None) -> int:
+        loop = asyncio.get_running_loop()
+        hasher = StreamHasher()
+        written = 0
+        async with self.lock:
+            async for chunk in downloader.iter_content(url, headers, size, progress):
+                await hasher.feed(written, chunk)
+                # 管道另一端读得慢时在线程中阻塞，不占用事件循环，同时让下载也慢下来
+                await loop.run_in_executor(None, self.output.write, chunk)
+                written += len(chunk)
+            await loop.run_in_executor(None, self.output.flush)
+        if size is not None and written != size:
+            raise StorageError(f'文件大小不符：{written}/{size} 字节')
+        md5 = normalize_md5(md5)
+        if md5:
+            digest = await hasher.hexdigest('')
+            if digest != md5:
+                raise StorageError(f'md5 不符：{digest}/{md5}')
+        return written
+
+    async def close(self) -> None:
+        pass
+
+
+def sign_v4(method: str, url: str, headers: Dict[str, str], payload_hash: str, access_key: str, secret_key: str,
+            region: str, service: str = 's3', now: Union[datetime.datetime, None] = None) -> Dict[str, str]:
+    # AWS Signature Version 4，返回加上 Host、X-Amz-Date、X-Amz-Content-Sha256、Authorization 后的请求头
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    amz_date = now.strftime('%Y%m%dT%H%M%SZ')
+    date = amz_date[:8]
+    parts = urlsplit(url)
+    host = parts.netloc
+    if (parts.scheme == 'http' and host.endswith(':80')) or (parts.scheme == 'https' and host.endswith(':443')):
+        host = host.rsplit(':', 1)[0]
+    headers = dict(headers, host=host, **{'x-amz-date': amz_date, 'x-amz-content-sha256': payload_hash})
+    canonical_headers = sorted((key.lower(), ' '.join(str(value).split())) for key, value in headers.items())
+    signed_headers = ';'.join(key for key, _ in canonical_headers)
+    query = []
+    for pair in parts.query.split('&') if parts.query else []:
+        key, _, value = pair.partition('=')
+        query.append((quote(unquote(key), safe='-_.~'), quote(unquote(value), safe='-_.~')))
+    canonical_request = '\n'.join([
+        method,
+        quote(unquote(parts.path) or '/', safe='/-_.~'),
+        '&'.join(f'{key}={value}' for key, value in sorted(query)),
+        ''.join(f'{key}:{value}\n' for key, value in canonical_headers),
+        signed_headers,
+        payload_hash,
+    ])
+    scope = f'{date}/{region}/{service}/aws4_request'
+    string_to_sign = '\n'.join(['AWS4-HMAC-SHA256', amz_date, scope,
+                                hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()])
+    key = f'AWS4{secret_key}'.encode('utf-8')
+    for part in (date, region, service, 'aws4_request'):
+        key = hmac.new(key, part.encode('utf-8'), hashlib.sha256).digest()
+    signature = hmac.new(key, string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+    headers['Authorization'] = (f'AWS4-HMAC-SHA256 Credential={access_key}/{scope}, '
+                                f'SignedHeaders={signed_headers}, Signature={signature}')
+    return headers
+
+
+def xml_text(body: bytes, tag: str) -> str:
+    # 读取 S3 响应中第一个名为 tag 的元素，忽略命名空间
+    for element in ElementTree.fromstring(body).iter():
+        if element.tag.rsplit('}', 1)[-1] == tag:
+            return element.text or ''
+    return ''
+
+
+class S3Sink:
+    # 写入 S3 兼容的对象存储（AWS S3、MinIO 等），使用路径形式的地址 endpoint/bucket/key
+    # 下载流按顺序填满固定大小的缓冲区，每填满一个就作为一段并发上传；缓冲区用完时下载等待上传完成，内存占用有上限
+    # 不超过一段的文件直接 PUT；大小或 md5 校验失败时取消分段上传，不会留下不完整的对象
+    local = False
+    durable = True
+
+    def __init__(self, endpoint: str, bucket: str, access_key: str, secret_key: str, region: str = 'us-east-1',
+                 prefix: str = '', root: str = '.', session_token: Union[str, None] = None,
+                 part_size: int = PART_SIZE, buffers: int = BUFFER_COUNT, retries: int = 3,
+                 timeout: float = 60.0) -> None:
+        if part_size < 5 * MB:
+            raise ValueError('分段大小不能小于 5MB')
+        self.endpoint: str = endpoint.rstrip('/')
+        self.bucket: str = bucket
+        self.access_key: str = access_key
+        self.secret_key: str = secret_key
+        self.region: str = region
+        self.prefix: str = prefix.strip('/')
+        self.root: str = root
+        self.session_token: Union[str, None] = session_token
+        self.part_size: int = part_size
+        self.retries: int = retries
+        self.timeout: float = timeout
+        self.client: Union[httpx.AsyncClient, None] = None
+        self.buffer_count: int = buffers
+        self.pool: Union[asyncio.Queue, None] = None
+
+    def key_of(self, save_path: str) -> str:
+        # save_path 相对于 root 的路径作为对象键，加上 prefix
+        path = os.path.relpath(save_path, self.root).replace(os.sep, '/')
+        if path == '..' or path.startswith('../'):
+            path = os.path.basename(save_path)
+        return f'{self.prefix}/{path}' if self.prefix else path
+
+    def object_url(self, key: str) -> str:
+        return f"{self.endpoint}/{quote(self.bucket)}/{quote(key, safe='/-_.~')}"
+
+    @staticmethod
+    async def body(view: memoryview) -> AsyncIterator[memoryview]:
+        # 直接发送缓冲区的内容，请求对象不持有数据副本，缓冲区归还后不会有残留的大块内存等待回收
+        yield view
+
+    async def request(self, method: str, key: str, query: str = '', content: Union[bytes, memoryview] = b'',
+                      headers: Union[Dict[str, str], None] = None) -> httpx.Response:
+        if self.client is None:
+            self.client = httpx.AsyncClient(timeout=self.timeout)
+        url = self.object_url(key) + (f'?{query}' if query else '')
+        if content:
+            payload_hash = await asyncio.get_running_loop().run_in_executor(
+                hash_executor(), lambda: hashlib.sha256(content).hexdigest())
+        else:
+            payload_hash = EMPTY_SHA256
+        headers = dict(headers or {})
+        if isinstance(content, memoryview):
+            headers['Content-Length'] = str(len(content))
+        if self.session_token:
+            headers['x-amz-security-token'] = self.session_token
+        attempt = 0
+        while True:
+            signed = sign_v4(method, url, headers, payload_hash, self.access_key, self.secret_key, self.region)
+            try:
+                body = self.body(content) if isinstance(content, memoryview) else content
+                response = await self.client.request(method, url, content=body, headers=signed)
+                if response.status_code < 500 and response.status_code != 429:
+                    break
+                error = StorageError(f'{method} {key} 返回状态码 {response.status_code}')
+            except httpx.TransportError as e:
+                error = e
+            attempt += 1
+            if attempt > self.retries:
+                raise error
+            METRICS.inc('quark_retries_total', operation='s3')
+            await asyncio.sleep(min(2 ** attempt, 30))
+        METRICS.inc('quark_s3_requests_total', method=method, status=str(response.status_code))
+        if response.status_code >= 300:
+            raise StorageError(f'{method} {key} 失败：{response.status_code} '
+                               f'{xml_text(response.content, "Code") if response.content else ""}')
+        return response
+
+    def buffers(self) -> asyncio.Queue:
+        if self.pool is None:
+            self.pool = asyncio.Queue()
+            for _ in range(self.buffer_count):
+                self.pool.put_nowait(bytearray(self.part_size))
+        return self.pool
+
+    async def store(self, downloader: SegmentedDownloader, url: DownloadUrl, save_path: str, headers: Dict[str, str],
+                    size: Union[int, None] = None, progress: Union[ProgressCallback, None] = None,
+                    on_size: Union[ProgressCallback, None] = None, md5: Union[str, None] = None) -> int:
+        key = self.key_of(save_path)
+        pool = self.buffers()
+        hasher = StreamHasher()
+        upload_id = ''
+        etags: Dict[int, str] = {}
+        uploads: List[asyncio.Task] = []
+        buffer = await pool.get()
+        filled = 0
+        written = 0
+
+        async def upload_part(number: int, part: bytearray, length: int) -> None:
+            try:
+                response = await self.request('PUT', key, f'partNumber={number}&uploadId={quote(upload_id)}',
+                                              memoryview(part)[:length])
+                etags[number] = response.headers.get('etag', '')
+                METRICS.inc('quark_s3_bytes_total', length)
+            finally:
+                pool.put_nowait(part)
+
+        async def start_part(part: bytearray, length: int) -> None:
+            nonlocal upload_id
+            # 上传任务创建之前出错时由这里归还缓冲区，之后由 upload_part 归还
+            try:
+                if not upload_id:
+                    response = await self.request('POST', key, 'uploads=')
+                    upload_id = xml_text(response.content, 'UploadId')
+                    if not upload_id:
+                        raise StorageError(f'创建分段上传失败：{key}')
+                if len(uploads) >= MAX_PARTS:
+                    raise StorageError(f'文件超过 {MAX_PARTS} 段，请调大分段大小：{key}')
+            except BaseException:
+                pool.put_nowait(part)
+                raise
+            uploads.append(asyncio.create_task(upload_part(len(uploads) + 1, part, length)))
+            # 已失败的分段不必等到最后才发现
+            for task in uploads:
+                if task.done() and task.exception() is not None:
+                    raise task.exception()
+
+        try:
+            async for chunk in downloader.iter_content(url, headers, size, progress):
+                await hasher.feed(written, chunk)
+                written += len(chunk)
+                view = memoryview(chunk)
+                while view:
+                    length = min(len(view), self.part_size - filled)
+                    buffer[filled:filled + length] = view[:length]
+                    filled += length
+                    view = view[length:]
+                    if filled == self.part_size:
+                        part, buffer = buffer, None
+                        await start_part(part, filled)
+                        # 没有空闲缓冲区时在这里等待上传完成，下载随之暂停
+                        buffer = await pool.get()
+                        filled = 0
+
+            if size is not None and written != size:
+                METRICS.inc('quark_integrity_failures_total', reason='size')
+                raise IntegrityError(f'文件大小不符：{written}/{size} 字节')
+            md5 = normalize_md5(md5)
+            if md5:
+                digest = await hasher.hexdigest('')
+                if digest != md5:
+                    METRICS.inc('quark_integrity_failures_total', reason='md5')
+                    raise IntegrityError(f'md5 不符：{digest}/{md5}')
+
+            if not upload_id:
+                await self.request('PUT', key, content=memoryview(buffer)[:filled])
+                METRICS.inc('quark_s3_bytes_total', filled)
+                return written
+            if filled:
+                part, buffer = buffer, None
+                await start_part(part, filled)
+            await asyncio.gather(*uploads)
+            body = ''.join(f'<Part><PartNumber>{number}</PartNumber><ETag>{etags[number]}</ETag></Part>'
+                           for number in sorted(etags))
+            response = await self.request('POST', key, f'uploadId={quote(upload_id)}',
+                                          f'<CompleteMultipartUpload>{body}</CompleteMultipartUpload>'.encode())
+            # 合并分段的请求可能返回 200 但正文是错误信息
+            if xml_text(response.content, 'Code'):
+                raise StorageError(f'合并分段失败：{key}，{xml_text(response.content, "Code")}')
+            return written
+        except BaseException:
+            for task in uploads:
+                task.cancel()
+            await asyncio.gather(*uploads, return_exceptions=True)
+            if upload_id:
+                with contextlib.suppress(Exception):
+                    await self.request('DELETE', key, f'uploadId={quote(upload_id)}')
+            raise
+        finally:
+            if buffer is not None:
+                pool.put_nowait(buffer)
+
+    async def close(self) -> None:
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+
+def parse_s3_target(target: str) -> Tuple[str, str]:
+    # s3://bucket/prefix -> (bucket, prefix)
+    parts = urlsplit(target)
+    return parts.netloc, parts.path.strip('/')
+
+
+def open_sink(target: str, root: Union[str, None] = None) -> Union[LocalSink, StdoutSink, S3Sink]:
+    # target 为本地目录、- 或 s3://bucket/prefix；root 为保存路径的根目录，S3 的对象键相对于它计算
+    if target == '-':
+        return StdoutSink()
+    if target.startswith('s3://'):
+        bucket, prefix = parse_s3_target(target)
+        endpoint = os.environ.get('S3_ENDPOINT_URL') or \
+            f"https://s3.{os.environ.get('AWS_REGION', 'us-east-1')}.amazonaws.com"
+        access_key = os.environ.get('AWS_ACCESS_KEY_ID', '')
+        secret_key = os.environ.get('AWS_SECRET_ACCESS_KEY', '')
+        if not bucket or not access_key or not secret_key:
+            raise StorageError('S3 目标需要 s3://bucket/prefix 形式的地址，以及 AWS_ACCESS_KEY_ID、AWS_SECRET_ACCESS_KEY')
+        return S3Sink(endpoint, bucket, access_key, secret_key, region=os.environ.get('AWS_REGION', 'us-east-1'),
+                      prefix=prefix, root=root or '.', session_token=os.environ.get('AWS_SESSION_TOKEN'))
+    return LocalSink(target)
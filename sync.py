@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+# 增量同步：把分享链接或网盘文件夹镜像到本地目录，只下载新增或变化的文件，可选删除远端已不存在的文件
+# 用法：python sync.py 分享地址或文件夹ID 本地目录 [--delete] [--dry-run]
+
+import asyncio
+import os
+import posixpath
+import sqlite3
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterator, List, Tuple, Union
+
+from downloader import DownloadScheduler, SegmentedDownloader
+from download_urls import DownloadUrlManager
+from quark import QuarkPanFileManager, NOT_OWNER_MESSAGE, DOWNLOAD_QUEUE_LIMIT
+from utils import custom_print
+from walker import walk_tree, ListDir
+
+MANIFEST_NAME = '.quark_sync.db'
+# 批量标记已存在文件时的批大小
+SEEN_BATCH_SIZE = 500
+
+
+class SyncError(Exception):
+    pass
+
+
+class SyncManifest:
+    # 本地镜像目录中的清单：相对路径 -> 远端 fid、大小、修改时间；seen 为最近一次同步时远端仍存在该文件的同步ID
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+        self.conn: sqlite3.Connection = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                fid TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                updated_at INTEGER NOT NULL,
+                synced_at REAL NOT NULL,
+                seen TEXT NOT NULL DEFAULT ''
+            )''')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        self.conn.commit()
+
+    def get_meta(self, key: str) -> Union[str, None]:
+        row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row['value'] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        self.conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+        self.conn.commit()
+
+    def get(self, path: str) -> Union[sqlite3.Row, None]:
+        return self.conn.execute('SELECT * FROM files WHERE path = ?', (path,)).fetchone()
+
+    def mark_seen(self, paths: List[str], run_id: str) -> None:
+        self.conn.executemany('UPDATE files SET seen = ? WHERE path = ?', [(run_id, path) for path in paths])
+        self.conn.commit()
+
+    def record(self, path: str, fid: str, size: int, updated_at: int, run_id: str) -> None:
+        self.conn.execute('INSERT OR REPLACE INTO files (path, fid, size, updated_at, synced_at, seen) '
+                          'VALUES (?, ?, ?, ?, ?, ?)', (path, fid, size, updated_at, time.time(), run_id))
+        self.conn.commit()
+
+    def stale(self, run_id: str) -> Iterator[sqlite3.Row]:
+        # 本次同步中远端没有出现过的文件
+        return iter(self.conn.execute('SELECT * FROM files WHERE seen != ? ORDER BY path', (run_id,)).fetchall())
+
+    def remove(self, path: str) -> None:
+        self.conn.execute('DELETE FROM files WHERE path = ?', (path,))
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def classify(row: Union[sqlite3.Row, None], entry: Dict[str, Any], local_path: str) -> str:
+    # new：清单中没有；changed：fid、大小或修改时间变化；missing：本地文件被删除或大小不符；unchanged：无需下载
+    if row is None:
+        return 'new'
+    # 列表没有返回大小时只比较 fid 与修改时间
+    size = entry.get('size')
+    if row['fid'] != entry['fid'] or (size and row['size'] != size) or \
+            row['updated_at'] != entry.get('updated_at', 0):
+        return 'changed'
+    try:
+        if os.path.getsize(local_path) != row['size']:
+            return 'missing'
+    except OSError:
+        return 'missing'
+    return 'unchanged'
+
+
+def local_path_of(local_dir: str, path: str) -> str:
+    # 远端文件名中的 .. 等不允许写到镜像目录之外
+    full = os.path.realpath(os.path.join(local_dir, *path.split('/')))
+    root = os.path.realpath(local_dir)
+    if os.path.commonpath([full, root]) != root:
+        raise SyncError(f'非法的文件路径：{path}')
+    return full
+
+
+async def resolve_source(manager: QuarkPanFileManager, source: str) -> Tuple[ListDir, str]:
+    # 分享链接按分享详情遍历（须为网盘内文件才能下载），否则按网盘文件夹ID或网页端文件夹地址遍历
+    if '/s/' in source:
+        pwd_id = manager.get_pwd_id(source)
+        stoken = await manager.get_stoken(pwd_id)
+        if not stoken:
+            raise SyncError(f'获取stoken失败：{source}')
+
+        async def list_share(fid: str, updated_at: Union[int, None]) -> List[Any]:
+            # 根目录没有 updated_at 可供校验，不使用缓存
+            is_owner, file_list = await manager.get_detail(pwd_id, stoken, pdir_fid=fid, updated_at=updated_at,
+                                                           use_cache=updated_at is not None)
+            if is_owner == 0:
+                raise SyncError(f'{NOT_OWNER_MESSAGE}，请先将文件转存至网盘中')
+            return file_list
+
+        return list_share, '0'
+
+    fid = source.rsplit('/', maxsplit=1)[-1].split('-')[0]
+    manager.invalidate_listing(fid)
+
+    async def list_drive(pdir_fid: str, updated_at: Union[int, None]) -> List[Any]:
+        return await manager.get_all_sorted_file_list(pdir_fid, updated_at=updated_at)
+
+    return list_drive, fid
+
+
+async def sync(manager: QuarkPanFileManager, source: str, local_dir: str, delete: bool = False,
+               dry_run: bool = False, on_event: Union[Callable[[Dict[str, Any]], None], None] = None) -> Dict[str, Any]:
+    # on_event 收到需要处理的文件（new/changed/missing/deleted/stale/failed），未变化的文件只计数
+    os.makedirs(local_dir, exist_ok=True)
+    manifest = SyncManifest(os.path.join(local_dir, MANIFEST_NAME))
+    counts = {'new': 0, 'changed': 0, 'missing': 0, 'unchanged': 0, 'downloaded': 0, 'failed': 0, 'deleted': 0,
+              'stale': 0, 'bytes': 0}
+    try:
+        previous = manifest.get_meta('source')
+        if previous and previous != source:
+            raise SyncError(f'{local_dir} 是 {previous} 的镜像目录，请换一个本地目录')
+        list_dir, root = await resolve_source(manager, source)
+        manifest.set_meta('source', source)
+        run_id = uuid.uuid4().hex
+
+        def emit(action: str, path: str, **extra: Any) -> None:
+            if on_event is not None:
+                on_event(dict(extra, action=action, path=path))
+
+        # 等待下载完成的文件：相对路径 -> (fid, 大小, 修改时间)
+        queued: Dict[str, Tuple[str, int, int]] = {}
+
+        def on_complete(result: Dict[str, Any]) -> None:
+            fid, size, updated_at = queued.pop(result['key'])
+            manifest.record(result['key'], fid, size or result['size'] or 0, updated_at, run_id)
+            counts['downloaded'] += 1
+            counts['bytes'] += result['size'] or 0
+
+        scheduler = DownloadScheduler(manager.downloader, manager.headers, concurrency=manager.download_concurrency,
+                                      on_complete=on_complete)
+        scheduler_task = asyncio.create_task(scheduler.run()) if not dry_run else None
+        # 下载地址在文件开始下载时才分批获取，同步大量文件时不会用到已过期的地址
+        urls = DownloadUrlManager(manager.get_download_urls)
+        seen: List[str] = []
+
+        try:
+            async for path, entry in walk_tree(list_dir, [(root, '', None)], workers=manager.list_concurrency):
+                if entry['dir']:
+                    continue
+                rel = posixpath.join(path, entry['file_name'])
+                local_path = local_path_of(local_dir, rel)
+                row = manifest.get(rel)
+                action = classify(row, entry, local_path)
+                counts[action] += 1
+                if row is not None:
+                    seen.append(rel)
+                    if len(seen) >= SEEN_BATCH_SIZE:
+                        manifest.mark_seen(seen, run_id)
+                        seen.clear()
+                if action == 'unchanged':
+                    continue
+                emit(action, rel, fid=entry['fid'], size=entry.get('size') or 0)
+                if dry_run:
+                    continue
+                if action == 'changed':
+                    # 旧版本留下的分片进度不能用于新内容
+                    for stale_path in (SegmentedDownloader.part_path(local_path),
+                                       SegmentedDownloader.state_path(local_path)):
+                        if os.path.exists(stale_path):
+                            os.remove(stale_path)
+                queued[rel] = (entry['fid'], entry.get('size') or 0, entry.get('updated_at', 0))
+                await scheduler.wait_room(DOWNLOAD_QUEUE_LIMIT)
+                size = entry.get('size')
+                scheduler.add(urls.link(entry['fid'], scheduler.priority({'size': size})), local_path, size=size,
+                              key=rel)
+            manifest.mark_seen(seen, run_id)
+        finally:
+            if scheduler_task is not None:
+                scheduler.close()
+                summary = await scheduler_task
+                messages = {failure['key']: failure['message'] for failure in summary['failures']}
+                # 下载失败或未能获取下载地址的文件仍留在 queued 中，下次同步会重新下载
+                for rel in queued:
+                    counts['failed'] += 1
+                    emit('failed', rel, message=messages.get(rel, '获取下载地址失败'))
+
+        # 只有完整遍历了远端目录树才处理已不存在的文件
+        for row in manifest.stale(run_id):
+            if not delete:
+                counts['stale'] += 1
+                emit('stale', row['path'])
+                continue
+            counts['deleted'] += 1
+            emit('deleted', row['path'])
+            if dry_run:
+                continue
+            local_path = local_path_of(local_dir, row['path'])
+            if os.path.exists(local_path):
+                os.remove(local_path)
+            manifest.remove(row['path'])
+        custom_print(f"同步完成：新增 {counts['new']}，变化 {counts['changed']}，缺失 {counts['missing']}，"
+                     f"未变化 {counts['unchanged']}，下载 {counts['downloaded']} 个（{counts['bytes'] / 1024 / 1024:.2f} MB），"
+                     f"失败 {counts['failed']}，" + (f"删除 {counts['deleted']}" if delete else f"远端已不存在 {counts['stale']}"))
+        return counts
+    finally:
+        manifest.close()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='把分享链接或网盘文件夹增量同步到本地目录')
+    parser.add_argument('source', help='分享地址、网盘文件夹ID或网页端文件夹地址')
+    parser.add_argument('output', help='本地镜像目录')
+    parser.add_argument('--delete', action='store_true', help='删除远端已不存在的本地文件')
+    parser.add_argument('--dry-run', action='store_true', help='只列出需要处理的文件，不下载也不删除')
+    args = parser.parse_args()
+
+    async def main() -> None:
+        async with QuarkPanFileManager(headless=True) as manager:
+            await sync(manager, args.source, args.output, delete=args.delete, dry_run=args.dry_run,
+                       on_event=lambda event: custom_print(f"{event['action']}：{event['path']}"))
+
+    asyncio.run(main())
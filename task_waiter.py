@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Union
+
+import httpx
+
+FetchTask = Callable[[str, int], Awaitable[Dict[str, Any]]]
+Retryable = Callable[[Exception], bool]
+
+
+class TaskTimeoutError(Exception):
+    pass
+
+
+class _PendingTask:
+    __slots__ = ('task_id', 'future', 'next_at', 'delay', 'retry_index', 'deadline')
+
+    def __init__(self, task_id: str, future: asyncio.Future, next_at: float, delay: float, deadline: float) -> None:
+        self.task_id: str = task_id
+        self.future: asyncio.Future = future
+        self.next_at: float = next_at
+        self.delay: float = delay
+        self.retry_index: int = 0
+        self.deadline: float = deadline
+
+
+class TaskWaiter:
+    # 所有等待中的任务共用一个轮询循环，同时在途的查询数不超过 max_inflight，
+    # 并发再高轮询压力也保持平稳；每个任务按指数退避加抖动安排下一次查询
+    # 网络错误与 retryable 判定为暂时性的错误（如被限流）不结束等待，按退避继续查询直到超时
+    def __init__(self, fetch_task: FetchTask, is_done: Callable[[Dict[str, Any]], bool], max_inflight: int = 4,
+                 initial_delay: float = 0.2, max_delay: float = 5.0, factor: float = 2.0, jitter: float = 0.2,
+                 timeout: float = 60.0, retryable: Union[Retryable, None] = None) -> None:
+        self.fetch_task: FetchTask = fetch_task
+        self.is_done: Callable[[Dict[str, Any]], bool] = is_done
+        self.retryable: Union[Retryable, None] = retryable
+        self.max_inflight: int = max_inflight
+        self.initial_delay: float = initial_delay
+        self.max_delay: float = max_delay
+        self.factor: float = factor
+        self.jitter: float = jitter
+        self.timeout: float = timeout
+        self.pending: Dict[str, _PendingTask] = {}
+        self._poller: Union[asyncio.Task, None] = None
+        self._wakeup: Union[asyncio.Event, None] = None
+        self._loop: Union[asyncio.AbstractEventLoop, None] = None
+
+    def _jittered(self, delay: float) -> float:
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    async def wait(self, task_id: str, timeout: Union[float, None] = None) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # 菜单每次操作都用 asyncio.run 新建事件循环，上一个循环留下的 future 与轮询任务已不能使用
+            self._loop = loop
+            self.pending.clear()
+            self._poller = None
+            self._wakeup = None
+        if task_id in self.pending:
+            return await asyncio.shield(self.pending[task_id].future)
+        now = time.monotonic()
+        pending = _PendingTask(task_id, loop.create_future(), now + self._jittered(self.initial_delay),
+                               self.initial_delay, now + (timeout if timeout is not None else self.timeout))
+        self.pending[task_id] = pending
+        if self._poller is None or self._poller.done():
+            self._wakeup = asyncio.Event()
+            self._poller = asyncio.create_task(self._poll_loop())
+        else:
+            self._wakeup.set()
+        return await pending.future
+
+    async def wait_many(self, task_ids: List[str], timeout: Union[float, None] = None) -> List[Any]:
+        # 返回值与 task_ids 一一对应，失败的任务对应位置为异常对象
+        return await asyncio.gather(*(self.wait(task_id, timeout) for task_id in task_ids), return_exceptions=True)
+
+    def _finish(self, pending: _PendingTask, result: Any = None, error: Union[BaseException, None] = None) -> None:
+        self.pending.pop(pending.task_id, None)
+        if pending.future.done():
+            return
+        if error is not None:
+            pending.future.set_exception(error)
+        else:
+            pending.future.set_result(result)
+
+    def _reschedule(self, pending: _PendingTask) -> None:
+        pending.retry_index += 1
+        pending.delay = min(pending.delay * self.factor, self.max_delay)
+        pending.next_at = time.monotonic() + self._jittered(pending.delay)
+
+    async def _check(self, pending: _PendingTask) -> None:
+        try:
+            json_data = await self.fetch_task(pending.task_id, pending.retry_index)
+        except httpx.TransportError:
+            json_data = None
+        except Exception as e:
+            if self.retryable is None or not self.retryable(e):
+                self._finish(pending, error=e)
+                return
+            json_data = None
+        if json_data is not None and self.is_done(json_data):
+            self._finish(pending, json_data)
+        elif time.monotonic() >= pending.deadline:
+            self._finish(pending, error=TaskTimeoutError(f'任务 {pending.task_id} 等待超时'))
+        else:
+            self._reschedule(pending)
+
+    async def _poll_loop(self) -> None:
+        inflight: Dict[str, asyncio.Task] = {}
+        while self.pending or inflight:
+            now = time.monotonic()
+            for pending in list(self.pending.values()):
+                if pending.future.done():
+                    self.pending.pop(pending.task_id, None)
+                    continue
+                if len(inflight) >= self.max_inflight:
+                    break
+                if pending.task_id not in inflight and pending.next_at <= now:
+                    inflight[pending.task_id] = asyncio.create_task(self._check(pending))
+
+            waiting = [p.next_at for p in self.pending.values() if p.task_id not in inflight]
+            if waiting and len(inflight) < self.max_inflight:
+                sleep_for = max(0.0, min(waiting) - time.monotonic())
+            else:
+                sleep_for = None
+            self._wakeup.clear()
+            wakers = [asyncio.create_task(self._wakeup.wait())]
+            if inflight:
+                wakers.extend(inflight.values())
+            done, _ = await asyncio.wait(wakers, timeout=sleep_for, return_when=asyncio.FIRST_COMPLETED)
+            if not wakers[0].done():
+                wakers[0].cancel()
+            for task_id, task in list(inflight.items()):
+                if task.done():
+                    del inflight[task_id]
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 模拟服务在 benchmarks 目录中
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # QuarkPanFileManager 会在当前目录下创建 config，测试在临时目录中运行
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
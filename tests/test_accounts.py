@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+from typing import Any, Dict, Tuple
+
+from accounts import Account, AccountPool, NoAccountAvailable
+from bench_suite import build_manager
+from mock_server import MockQuarkServer
+
+SAVE_PATH = '/1/clouddrive/share/sharepage/save'
+URL = 'https://pan.quark.cn/s/mockpool'
+
+
+def throttled(method: str, query: Dict[str, str], body: bytes) -> Tuple[int, Dict[str, Any], Dict[str, str]]:
+    return 429, {'status': 429, 'code': 429, 'message': 'too many requests'}, {}
+
+
+def test_throttled_save_fails_over_to_next_account():
+    # 每个账号对应一个模拟服务，账号 a 转存时被限流
+    async def main() -> Tuple[Dict[str, Any], Account, Account, MockQuarkServer]:
+        async with MockQuarkServer(tree=(1, 0, 4)) as first, MockQuarkServer(tree=(1, 0, 4)) as second:
+            first.routes[SAVE_PATH] = throttled
+            a = Account('a', build_manager(first))
+            b = Account('b', build_manager(second))
+            async with AccountPool([a, b]) as pool:
+                result = await pool.run(URL)
+            return result, a, b, second
+
+    result, a, b, second = asyncio.run(main())
+    assert result['status'] == 'saved' and result['account'] == 'b'
+    assert a.throttled_until > 0 and a.throttle_count == 1 and a.succeeded == 0
+    assert b.succeeded == 1 and second.hits.get(SAVE_PATH, 0) == 1
+
+
+def failing(code: int, message: str):
+    def handler(method: str, query: Dict[str, str], body: bytes) -> Tuple[int, Dict[str, Any], Dict[str, str]]:
+        return MockQuarkServer.error(code, message)
+
+    return handler
+
+
+def test_failed_result_is_not_counted_as_success():
+    async def main() -> Tuple[Dict[str, Any], Account]:
+        async with MockQuarkServer(tree=(1, 0, 4)) as server:
+            server.routes[SAVE_PATH] = failing(41099, 'mock save failed')
+            a = Account('a', build_manager(server))
+            a.throttle_count = 2
+            async with AccountPool([a]) as pool:
+                return await pool.run(URL), a
+
+    result, a = asyncio.run(main())
+    assert result['status'] == 'failed' and result['account'] == 'a'
+    assert a.succeeded == 0 and a.failed == 1 and a.throttle_count == 2
+    assert 'mock save failed' in a.last_error
+
+
+def test_full_account_is_skipped():
+    async def main() -> Tuple[Dict[str, Any], Account, Account]:
+        async with MockQuarkServer(tree=(1, 0, 4)) as first, MockQuarkServer(tree=(1, 0, 4)) as second:
+            first.routes[SAVE_PATH] = failing(32003, 'capacity limit[{0}]')
+            a = Account('a', build_manager(first))
+            b = Account('b', build_manager(second))
+            async with AccountPool([a, b]) as pool:
+                result = await pool.run(URL)
+                # 容量不足的账号不再被选中
+                assert pool.pick(set()) is b
+            return result, a, b
+
+    result, a, b = asyncio.run(main())
+    assert result['account'] == 'b' and result['status'] == 'saved'
+    assert a.full and not a.usable()
+
+
+def test_download_moves_to_owning_account(tmp_path):
+    # 文件不属于账号 a 时由账号 b 下载
+    async def main() -> Dict[str, Any]:
+        async with MockQuarkServer(tree=(1, 0, 2), file_size=64) as first, \
+                MockQuarkServer(tree=(1, 0, 2), file_size=64, share_is_owner=True) as second:
+            a = Account('a', build_manager(first, download_folder=str(tmp_path / 'a')))
+            b = Account('b', build_manager(second, download_folder=str(tmp_path / 'b')))
+            async with AccountPool([a, b]) as pool:
+                return await pool.run(URL, download=True)
+
+    result = asyncio.run(main())
+    assert result['status'] == 'downloaded' and result['account'] == 'b'
+    assert len(list((tmp_path / 'b').iterdir())) == 2
+
+
+def test_no_usable_account():
+    async def main() -> None:
+        async with MockQuarkServer() as server:
+            server.routes['/account/info'] = failing(31001, 'require login')
+            async with AccountPool([Account('a', build_manager(server))]) as pool:
+                assert not pool.accounts[0].healthy
+                await pool.run(URL)
+
+    try:
+        asyncio.run(main())
+    except NoAccountAvailable:
+        pass
+    else:
+        raise AssertionError('应当抛出 NoAccountAvailable')
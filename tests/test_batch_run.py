@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+from typing import Dict, List, Set, Tuple
+
+from journal import JobJournal
+from metrics import Metrics
+from quark import QuarkPanFileManager
+
+URLS = [f'https://pan.quark.cn/s/batch{n}' for n in range(3)]
+
+
+def make_manager(workdir) -> QuarkPanFileManager:
+    manager = QuarkPanFileManager(cookies='mock=1', listing_cache_ttl=0, use_ledger=False, use_journal=False)
+    manager.journal = JobJournal(str(workdir / 'jobs.db'))
+    manager.metrics = Metrics()
+    return manager
+
+
+def test_resumed_batch_runs_only_unfinished_links(workdir):
+    calls: List[str] = []
+    failing: Set[str] = {URLS[1]}
+
+    async def runner(url: str, folder_id: str, download: bool = False) -> Dict[str, str]:
+        calls.append(url)
+        status = 'failed' if url in failing else 'saved'
+        return QuarkPanFileManager.make_result(url, status, 'mock' if url in failing else '')
+
+    async def batch() -> Tuple[List[str], float]:
+        async with make_manager(workdir) as manager:
+            results = await manager.batch_run(URLS, folder_id='0', runner=runner, skip_known=False)
+            pending = manager.metrics.gauges[('quark_batch_pending', (('kind', 'save'),))]
+            manager.journal.close()
+        return [result['status'] for result in results], pending
+
+    assert asyncio.run(batch()) == (['saved', 'failed', 'saved'], 0)
+    failing.clear()
+    calls.clear()
+    # 再次运行同一批链接只处理上次失败的链接，待处理数同样降到 0
+    assert asyncio.run(batch()) == (['saved', 'saved', 'saved'], 0)
+    assert calls == [URLS[1]]
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+import threading
+from typing import Any, Dict, List, Tuple
+
+import httpx
+import pytest
+
+import cli
+from mock_server import MockQuarkServer
+
+TOKEN_PATH = '/1/clouddrive/share/sharepage/token'
+OPTIONS = ['--cookies', 'mock=1', '--rate-limit', '0', '--no-cache', '--no-ledger', '--no-journal']
+
+
+@pytest.fixture
+def server(workdir, monkeypatch):
+    # cli.main 自己调用 asyncio.run，模拟服务放在另一个线程的事件循环中运行
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    mock = MockQuarkServer(tree=(2, 1, 2))
+    asyncio.run_coroutine_threadsafe(mock.start(), loop).result()
+    build_manager = cli.build_manager
+
+    def build_mock_manager(args):
+        manager = build_manager(args)
+        manager.api_host = manager.save_host = manager.account_host = mock.base_url
+        return manager
+
+    monkeypatch.setattr(cli, 'build_manager', build_mock_manager)
+    yield mock
+    asyncio.run_coroutine_threadsafe(mock.stop(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+
+
+def run_cli(capsys, argv: List[str]) -> Tuple[int, List[Dict[str, Any]]]:
+    code = cli.main(argv)
+    # stdout 中只能有 JSON Lines，日志都在 stderr
+    return code, [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+def test_ls_outputs_json_lines(server, capsys):
+    code, records = run_cli(capsys, ['ls', *OPTIONS])
+    assert code == 0
+    assert [record['file_name'] for record in records] == ['file_0_0.bin', 'file_0_1.bin', 'dir_0_0']
+    assert set(records[0]) == {*cli.LIST_FIELDS, 'path'}
+
+    code, records = run_cli(capsys, ['ls', '-r', *OPTIONS])
+    assert code == 0
+    assert sorted(record['path'] for record in records if not record['dir']) == [
+        'dir_0_0/file_1_0.bin', 'dir_0_0/file_1_1.bin', 'file_0_0.bin', 'file_0_1.bin']
+
+
+def test_save_reports_each_link_and_exits_1_on_failure(server, capsys):
+    handle_token = server.routes[TOKEN_PATH]
+
+    def token(method: str, query: Dict[str, str], body: bytes):
+        if json.loads(body)['pwd_id'] == 'bad':
+            return server.error(41006, 'share not found')
+        return handle_token(method, query, body)
+
+    server.routes[TOKEN_PATH] = token
+    code, records = run_cli(capsys, ['save', 'https://pan.quark.cn/s/good', 'https://pan.quark.cn/s/bad',
+                                     '--folder-id', '0', *OPTIONS])
+    assert code == 1
+    statuses = {record['url']: record['status'] for record in records}
+    assert statuses['https://pan.quark.cn/s/good'] != 'failed'
+    assert statuses['https://pan.quark.cn/s/bad'] == 'failed'
+
+
+def test_mkdir(server, capsys):
+    code, records = run_cli(capsys, ['mkdir', 'new', *OPTIONS])
+    assert code == 0 and records[0]['file_name'] == 'new' and records[0]['fid']
+
+
+def test_invalid_cookie_is_an_error_line(server, capsys):
+    server.routes['/account/info'] = lambda method, query, body: server.error(31001, 'require login')
+    code, records = run_cli(capsys, ['ls', *OPTIONS])
+    assert code == 2
+    assert records[-1]['command'] == 'ls' and 'Cookie' in records[-1]['error']
+
+
+def test_network_error_is_an_error_line(server, capsys, monkeypatch):
+    async def validate_session(self) -> bool:
+        raise httpx.ConnectTimeout('')
+
+    monkeypatch.setattr(cli.QuarkPanFileManager, 'validate_session', validate_session)
+    code, records = run_cli(capsys, ['ls', *OPTIONS])
+    # 没有错误信息的异常输出异常类型
+    assert code == 2 and records[-1] == {'command': 'ls', 'error': 'ConnectTimeout'}
+
+
+def test_missing_urls_is_an_error_line(server, capsys):
+    code, records = run_cli(capsys, ['save', *OPTIONS])
+    assert code == 2 and records == [{'command': 'save', 'error': records[0]['error']}]
+    assert '分享地址' in records[0]['error']
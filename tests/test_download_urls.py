@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import time
+from typing import Any, Dict, List
+
+import httpx
+import pytest
+
+from downloader import SegmentedDownloader
+from download_urls import DownloadUrlManager, url_expires
+
+CONTENT = bytes(range(256)) * 64
+
+
+class FakeCdn:
+    # 下载地址带有递增的版本号，被作废的旧地址返回 reject_status；fetch 模拟获取下载地址的接口
+    def __init__(self, reject: int = 0, reject_status: int = 403) -> None:
+        self.version: int = 0
+        self.reject: int = reject
+        self.reject_status: int = reject_status
+        self.batches: List[List[str]] = []
+
+    async def fetch(self, fids: List[str]) -> List[Dict[str, Any]]:
+        self.batches.append(list(fids))
+        self.version += 1
+        return [{'fid': fid, 'file_name': f'{fid}.bin', 'size': len(CONTENT),
+                 'download_url': f'https://cdn.example/{fid}?v={self.version}'} for fid in fids]
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        if self.reject:
+            self.reject -= 1
+            return httpx.Response(self.reject_status)
+        range_header = request.headers.get('range')
+        if not range_header:
+            return httpx.Response(200, content=CONTENT)
+        start, _, end = range_header.removeprefix('bytes=').partition('-')
+        end = int(end) if end else len(CONTENT) - 1
+        return httpx.Response(206, content=CONTENT[int(start):end + 1],
+                              headers={'content-range': f'bytes {start}-{end}/{len(CONTENT)}'})
+
+
+def download(cdn: FakeCdn, tmp_path, **kwargs: Any) -> bytes:
+    async def main() -> bytes:
+        async with httpx.AsyncClient(transport=httpx.MockTransport(cdn.handle)) as client:
+            downloader = SegmentedDownloader(client.stream, retries=0, **kwargs)
+            urls = DownloadUrlManager(cdn.fetch)
+            path = str(tmp_path / 'a.bin')
+            await downloader.download(urls.link('a'), path, {}, size=len(CONTENT))
+            with open(path, 'rb') as f:
+                return f.read()
+
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize('status', [403, 410])
+def test_rejected_url_is_refreshed(tmp_path, status):
+    cdn = FakeCdn(reject=2, reject_status=status)
+    assert download(cdn, tmp_path) == CONTENT
+    # 首次获取地址加上两次被拒绝后重新获取
+    assert len(cdn.batches) == 3
+
+
+def test_rejected_url_during_segmented_download(tmp_path):
+    # 多个分片同时被拒绝时只重新获取一次地址
+    cdn = FakeCdn(reject=2)
+    assert download(cdn, tmp_path, connections=4, chunk_size=2048, min_split_size=4096) == CONTENT
+    assert len(cdn.batches) <= 3
+
+
+def test_gives_up_after_refresh_limit(tmp_path):
+    cdn = FakeCdn(reject=100)
+    with pytest.raises(httpx.HTTPStatusError):
+        download(cdn, tmp_path)
+    assert len(cdn.batches) == 4
+
+
+def test_batches_follow_priority():
+    cdn = FakeCdn()
+    urls = DownloadUrlManager(cdn.fetch, batch_size=3)
+
+    async def main() -> None:
+        links = {fid: urls.link(fid, priority) for fid, priority in (('a', 3), ('b', 1), ('c', 2), ('d', 0))}
+        # 开始下载 a 时顺带获取优先级最靠前的 d、b 的地址
+        assert await links['a'].get() == 'https://cdn.example/a?v=1'
+        assert cdn.batches == [['a', 'd', 'b']]
+        assert await links['b'].get() == 'https://cdn.example/b?v=1'
+        assert await links['c'].get() == 'https://cdn.example/c?v=2'
+        assert links['c'].info['file_name'] == 'c.bin'
+        assert cdn.batches == [['a', 'd', 'b'], ['c']]
+
+    asyncio.run(main())
+
+
+def test_url_expiry():
+    now = time.time()
+    assert url_expires('https://cdn.example/a?Expires=1700000000&sign=x', now) == 1700000000
+    assert url_expires('https://cdn.example/a?x-oss-expires=1700000001', now) == 1700000001
+    assert url_expires('https://cdn.example/a', now, lifetime=60) == now + 60
+
+    async def fetch(fids: List[str]) -> List[Dict[str, Any]]:
+        # 有效期只有 10 秒的地址只提前一半作废
+        return [{'fid': fid, 'download_url': f'https://cdn.example/{fid}?Expires={int(now) + 10}'} for fid in fids]
+
+    urls = DownloadUrlManager(fetch, margin=120)
+
+    async def main() -> float:
+        _, expires, _ = await urls.resolve('a')
+        return expires
+
+    assert int(now) + 4 <= asyncio.run(main()) <= int(now) + 6
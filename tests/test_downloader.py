@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Union
+
+import httpx
+import pytest
+
+from downloader import DownloadScheduler, IntegrityError, SegmentedDownloader
+
+CONTENT = os.urandom(64 * 1024 + 100)
+CHUNK = 8 * 1024
+
+
+class RangeServer:
+    # 按 Range 返回 content（sizes 中列出的路径返回对应大小的内容），记录每次请求的 Range 头；
+    # corrupt 为返回损坏内容的剩余次数
+    def __init__(self, content: bytes = CONTENT, corrupt: int = 0, sizes: Union[Dict[str, int], None] = None) -> None:
+        self.content: bytes = content
+        self.sizes: Dict[str, int] = sizes or {}
+        self.corrupt: int = corrupt
+        self.ranges: List[Union[str, None]] = []
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        content = self.content[:self.sizes.get(request.url.path, len(self.content))]
+        if self.corrupt:
+            self.corrupt -= 1
+            content = bytes(len(content))
+        range_header = request.headers.get('range')
+        self.ranges.append(range_header)
+        if not range_header:
+            return httpx.Response(200, content=content)
+        start, _, end = range_header.removeprefix('bytes=').partition('-')
+        start, end = int(start), int(end) if end else len(content) - 1
+        return httpx.Response(206, content=content[start:end + 1],
+                              headers={'content-range': f'bytes {start}-{end}/{len(content)}'})
+
+
+def run_download(server: RangeServer, save_path: str, size: Union[int, None] = len(CONTENT),
+                 md5: Union[str, None] = None, **kwargs: Any) -> int:
+    async def main() -> int:
+        async with httpx.AsyncClient(transport=httpx.MockTransport(server.handle)) as client:
+            downloader = SegmentedDownloader(client.stream, retries=0, **kwargs)
+            return await downloader.download('https://cdn.example/file', save_path, {}, size=size, md5=md5)
+
+    return asyncio.run(main())
+
+
+def test_segmented_download(tmp_path):
+    server = RangeServer()
+    save_path = str(tmp_path / 'file.bin')
+    size = run_download(server, save_path, md5=hashlib.md5(CONTENT).hexdigest(), connections=4, chunk_size=CHUNK,
+                        min_split_size=2 * CHUNK)
+    assert size == len(CONTENT)
+    with open(save_path, 'rb') as f:
+        assert f.read() == CONTENT
+    # 探测一次，之后每个分片一个请求
+    chunk_count = (len(CONTENT) + CHUNK - 1) // CHUNK
+    assert server.ranges[0] == 'bytes=0-0'
+    assert sorted(server.ranges[1:]) == sorted(
+        f'bytes={index * CHUNK}-{min((index + 1) * CHUNK, len(CONTENT)) - 1}' for index in range(chunk_count))
+    assert not os.path.exists(save_path + '.part') and not os.path.exists(save_path + '.part.json')
+
+
+def test_small_file_is_downloaded_in_one_request(tmp_path):
+    server = RangeServer()
+    save_path = str(tmp_path / 'file.bin')
+    run_download(server, save_path, min_split_size=len(CONTENT) + 1)
+    assert server.ranges == [None]
+    with open(save_path, 'rb') as f:
+        assert f.read() == CONTENT
+
+
+def test_segmented_download_resumes_from_state(tmp_path):
+    # 上次下载完成了分片 0、1、5，本次只请求其余分片，不重新探测大小
+    save_path = str(tmp_path / 'file.bin')
+    done = [0, 1, 5]
+    with open(save_path + '.part', 'wb') as f:
+        f.truncate(len(CONTENT))
+        for index in done:
+            f.seek(index * CHUNK)
+            f.write(CONTENT[index * CHUNK:(index + 1) * CHUNK])
+    with open(save_path + '.part.json', 'w', encoding='utf-8') as f:
+        json.dump({'size': len(CONTENT), 'chunk_size': CHUNK, 'done': done}, f)
+
+    server = RangeServer()
+    # 分片大小以进度文件中记录的为准
+    run_download(server, save_path, md5=hashlib.md5(CONTENT).hexdigest(), connections=2, chunk_size=4 * CHUNK,
+                 min_split_size=2 * CHUNK)
+    chunk_count = (len(CONTENT) + CHUNK - 1) // CHUNK
+    starts = sorted(int(value.removeprefix('bytes=').split('-')[0]) for value in server.ranges)
+    assert starts == [index * CHUNK for index in range(chunk_count) if index not in done]
+    with open(save_path, 'rb') as f:
+        assert f.read() == CONTENT
+    assert not os.path.exists(save_path + '.part.json')
+
+
+def test_single_stream_download_resumes_from_part(tmp_path):
+    save_path = str(tmp_path / 'file.bin')
+    with open(save_path + '.part', 'wb') as f:
+        f.write(CONTENT[:1000])
+    server = RangeServer()
+    run_download(server, save_path, min_split_size=len(CONTENT) + 1)
+    assert server.ranges == ['bytes=1000-']
+    with open(save_path, 'rb') as f:
+        assert f.read() == CONTENT
+
+
+def test_md5_mismatch_is_quarantined(tmp_path):
+    server = RangeServer(corrupt=1)
+    save_path = str(tmp_path / 'file.bin')
+    with pytest.raises(IntegrityError) as info:
+        run_download(server, save_path, md5=hashlib.md5(CONTENT).hexdigest(), min_split_size=len(CONTENT) + 1)
+    # 损坏的文件移入 .quarantine，不留下进度，重新下载时从头开始
+    assert os.path.dirname(info.value.quarantine_path) == str(tmp_path / '.quarantine')
+    with open(info.value.quarantine_path, 'rb') as f:
+        assert f.read() == bytes(len(CONTENT))
+    assert not os.path.exists(save_path) and not os.path.exists(save_path + '.part')
+
+    run_download(server, save_path, md5=hashlib.md5(CONTENT).hexdigest(), min_split_size=len(CONTENT) + 1)
+    assert server.ranges == [None, None]
+
+
+def test_size_mismatch_is_quarantined(tmp_path):
+    save_path = str(tmp_path / 'file.bin')
+    with pytest.raises(IntegrityError, match='文件大小不符'):
+        run_download(RangeServer(), save_path, size=len(CONTENT) - 1, min_split_size=2 * len(CONTENT))
+    assert len(os.listdir(tmp_path / '.quarantine')) == 1
+
+
+def run_scheduler(server: RangeServer, jobs: List[Dict[str, Any]], **kwargs: Any):
+    # 依次返回 (完成顺序, 汇总)
+    async def main():
+        completed: List[str] = []
+        async with httpx.AsyncClient(transport=httpx.MockTransport(server.handle)) as client:
+            downloader = SegmentedDownloader(client.stream, retries=0, min_split_size=len(CONTENT) + 1)
+            scheduler = DownloadScheduler(downloader, {}, on_complete=lambda result: completed.append(result['key']),
+                                          **kwargs)
+            for job in jobs:
+                scheduler.add(**job)
+            scheduler.close()
+            return completed, await scheduler.run()
+
+    return asyncio.run(main())
+
+
+def test_scheduler_runs_smallest_first(tmp_path):
+    jobs = [{'url': f'https://cdn.example/{name}', 'save_path': str(tmp_path / name), 'size': size, 'key': name}
+            for name, size in (('big', 300), ('unknown', None), ('small', 100), ('medium', 200))]
+    server = RangeServer(sizes={'/big': 300, '/unknown': 50, '/small': 100, '/medium': 200})
+    completed, summary = run_scheduler(server, jobs, concurrency=1)
+    # 大小未知的文件排在最后
+    assert completed == ['small', 'medium', 'big', 'unknown']
+    assert summary['succeeded'] == 4 and summary['bytes'] == 650
+
+
+def test_scheduler_requeues_quarantined_file(tmp_path):
+    md5 = hashlib.md5(CONTENT).hexdigest()
+    job = {'url': 'https://cdn.example/file', 'save_path': str(tmp_path / 'file.bin'), 'size': len(CONTENT),
+           'md5': md5, 'key': 'file'}
+    completed, summary = run_scheduler(RangeServer(corrupt=1), [job], concurrency=2, verify_retries=1)
+    assert completed == ['file'] and summary['succeeded'] == 1 and summary['failed'] == 0
+    assert summary['bytes'] == len(CONTENT)
+    with open(tmp_path / 'file.bin', 'rb') as f:
+        assert f.read() == CONTENT
+
+    # 重下次数用完后记为失败，每次的损坏文件都保留在隔离目录中
+    job['save_path'] = str(tmp_path / 'other.bin')
+    completed, summary = run_scheduler(RangeServer(corrupt=5), [job], concurrency=2, verify_retries=1)
+    assert completed == [] and summary['failed'] == 1 and summary['bytes'] == 0
+    assert 'IntegrityError' in summary['failures'][0]['message']
+    assert len([name for name in os.listdir(tmp_path / '.quarantine') if name.startswith('other.bin')]) == 2
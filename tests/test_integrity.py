@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import base64
+import hashlib
+import os
+import random
+
+import integrity
+from integrity import StreamHasher, hash_file, normalize_md5
+
+
+def chunks(data: bytes, size: int):
+    return [(offset, data[offset:offset + size]) for offset in range(0, len(data), size)]
+
+
+def test_out_of_order_chunks_hash_in_offset_order(tmp_path):
+    data = os.urandom(1024 * 1024 + 7)
+    parts = chunks(data, 64 * 1024)
+    random.Random(1).shuffle(parts)
+    path = tmp_path / 'data.bin'
+    path.write_bytes(b'')
+
+    async def main() -> StreamHasher:
+        hasher = StreamHasher()
+        for offset, part in parts:
+            await hasher.feed(offset, part)
+        # 传入空文件：结果必须来自增量计算而不是重新读取文件
+        assert await hasher.hexdigest(str(path)) == hashlib.md5(data).hexdigest()
+        return hasher
+
+    hasher = asyncio.run(main())
+    assert not hasher.fallback and not hasher.held
+
+
+def test_falls_back_to_file_when_hold_limit_exceeded(tmp_path, monkeypatch):
+    monkeypatch.setattr(integrity, 'HOLD_LIMIT', 100 * 1024)
+    data = os.urandom(512 * 1024)
+    path = tmp_path / 'data.bin'
+    path.write_bytes(data)
+
+    async def main() -> str:
+        hasher = StreamHasher()
+        # 倒序送入，前面的数据一直不到，暂存超过上限
+        for offset, part in reversed(chunks(data, 64 * 1024)):
+            await hasher.feed(offset, part)
+        assert hasher.fallback
+        return await hasher.hexdigest(str(path))
+
+    assert asyncio.run(main()) == hashlib.md5(data).hexdigest()
+
+
+def test_reset_restarts_from_zero(tmp_path):
+    data = os.urandom(200 * 1024)
+
+    async def main() -> str:
+        hasher = StreamHasher()
+        await hasher.feed(0, b'stale data')
+        await hasher.reset()
+        for offset, part in chunks(data, 50 * 1024):
+            await hasher.feed(offset, part)
+        return await hasher.hexdigest(str(tmp_path / 'missing'))
+
+    assert asyncio.run(main()) == hashlib.md5(data).hexdigest()
+
+
+def test_hash_file(tmp_path):
+    data = os.urandom(300 * 1024)
+    path = tmp_path / 'data.bin'
+    path.write_bytes(data)
+    assert hash_file(str(path), block_size=64 * 1024) == hashlib.md5(data).hexdigest()
+
+
+def test_normalize_md5():
+    digest = hashlib.md5(b'quark').digest()
+    assert normalize_md5(digest.hex().upper()) == digest.hex()
+    assert normalize_md5(base64.b64encode(digest).decode()) == digest.hex()
+    assert normalize_md5('') is None and normalize_md5(None) is None
+    assert normalize_md5('not-a-digest') is None
+    assert normalize_md5(base64.b64encode(b'short').decode()) is None
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+from journal import JobJournal, PENDING, IN_FLIGHT, DONE, FAILED
+
+
+def test_resume_after_crash(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    journal = JobJournal(path)
+    job_id = journal.open_job('job', 'save')
+    journal.add_units(job_id, [(f'u{n}', {'n': n}) for n in range(4)])
+    journal.start(job_id, 'u0')
+    journal.finish(job_id, 'u0', result={'ok': True})
+    journal.start(job_id, 'u1')
+    journal.fail(job_id, 'u1', 'boom')
+    journal.start(job_id, 'u2')
+    # 模拟进程在 u2 执行中崩溃：不调用 close_job，直接重新打开
+    journal.close()
+
+    journal = JobJournal(path)
+    journal.open_job('job', 'save')
+    units = {unit['key']: unit for unit in journal.units(job_id)}
+    assert units['u0']['state'] == DONE and units['u0']['result'] == {'ok': True}
+    # 执行中与失败的单元重新待执行，尝试次数保留
+    assert units['u1']['state'] == PENDING and units['u1']['attempts'] == 1
+    assert units['u2']['state'] == PENDING and units['u2']['attempts'] == 1
+    assert units['u3']['state'] == PENDING and units['u3']['attempts'] == 0
+    assert [unit['key'] for unit in journal.units(job_id, (PENDING,))] == ['u1', 'u2', 'u3']
+    journal.close()
+
+
+def test_add_units_keeps_existing_state_and_order(tmp_path):
+    journal = JobJournal(str(tmp_path / 'jobs.db'))
+    job_id = journal.open_job('job', 'share')
+    journal.add_units(job_id, [('a', {}), ('b', {})])
+    journal.start(job_id, 'a')
+    journal.finish(job_id, 'a')
+    journal.add_units(job_id, [('a', {'new': 1}), ('c', {})])
+    units = journal.units(job_id)
+    assert [(unit['key'], unit['state']) for unit in units] == [('a', DONE), ('b', PENDING), ('c', PENDING)]
+    assert units[0]['payload'] == {}
+    journal.close()
+
+
+def test_close_job_status_and_reopen_done_job(tmp_path):
+    journal = JobJournal(str(tmp_path / 'jobs.db'))
+    job_id = journal.open_job('job', 'save')
+    journal.add_units(job_id, [('a', {}), ('b', {})])
+    journal.start(job_id, 'a')
+    assert journal.progress(job_id) == {PENDING: 1, IN_FLIGHT: 1, DONE: 0, FAILED: 0}
+    assert journal.close_job(job_id) == 'running'
+    journal.finish(job_id, 'a')
+    journal.fail(job_id, 'b', 'boom')
+    assert journal.close_job(job_id) == FAILED
+    # 失败的任务再次打开时只重做失败的单元
+    journal.open_job(job_id, 'save')
+    assert [unit['key'] for unit in journal.units(job_id, (PENDING,))] == ['b']
+    journal.finish(job_id, 'b')
+    assert journal.close_job(job_id) == DONE
+    # 已完成的任务再次打开视为新任务
+    journal.open_job(job_id, 'save')
+    assert journal.units(job_id) == []
+    journal.close()
+
+
+def test_release_returns_unit_to_pending(tmp_path):
+    journal = JobJournal(str(tmp_path / 'jobs.db'))
+    job_id = journal.open_job('job', 'save')
+    journal.add_units(job_id, [('a', {})])
+    journal.start(job_id, 'a')
+    journal.release(job_id, 'a')
+    assert journal.units(job_id)[0]['state'] == PENDING
+    journal.close()
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+from ledger import TransferLedger
+
+
+def test_transfers(tmp_path):
+    ledger = TransferLedger(str(tmp_path / 'ledger.db'))
+    assert not ledger.has_transfer('p1')
+    ledger.record_transfer('p1', 'https://pan.quark.cn/s/p1', to_pdir_fid='0', task_id='t1')
+    assert ledger.has_transfer('p1')
+    assert not ledger.has_transfer('p1', kind='download')
+    assert ledger.forget('transfers', 'p1') == 1
+    assert not ledger.has_transfer('p1')
+    ledger.close()
+
+
+def test_has_download_checks_size_and_file(tmp_path):
+    ledger = TransferLedger(str(tmp_path / 'ledger.db'))
+    path = tmp_path / 'a.bin'
+    path.write_bytes(b'x' * 10)
+    ledger.record_download('f1', 10, str(path))
+    assert ledger.has_download('f1', 10)
+    # 大小未知时不按大小比较
+    assert ledger.has_download('f1', None)
+    assert not ledger.has_download('f1', 11)
+    path.unlink()
+    assert not ledger.has_download('f1', 10)
+    assert ledger.has_download('f1', 10, check_file=False)
+    ledger.record_download('f2', None, str(path))
+    assert ledger.has_download('f2', 123, check_file=False)
+    ledger.close()
+
+
+def test_saved_items(tmp_path):
+    ledger = TransferLedger(str(tmp_path / 'ledger.db'))
+    ledger.record_saved_items('p1', '0', ['a', 'b'], 't1', status='submitted')
+    ledger.record_saved_items('p1', '0', ['c'], 't2')
+    ledger.record_saved_items('p1', 'other', ['d'], 't3')
+    assert ledger.saved_items('p1', '0') == {'a': ('submitted', 't1'), 'b': ('submitted', 't1'), 'c': ('saved', 't2')}
+    ledger.record_saved_items('p1', '0', ['a', 'b'], 't1')
+    assert ledger.saved_items('p1', '0')['a'] == ('saved', 't1')
+    ledger.forget_saved_items('p1', '0', task_id='t2')
+    assert set(ledger.saved_items('p1', '0')) == {'a', 'b'}
+    # 删除整条链接的转存记录时一并删除逐项记录
+    ledger.forget('transfers', 'p1')
+    assert ledger.saved_items('p1', '0') == {} and ledger.saved_items('p1', 'other') == {}
+    ledger.close()
+
+
+def test_export(tmp_path):
+    ledger = TransferLedger(str(tmp_path / 'ledger.db'))
+    ledger.record_transfer('p1', 'u1')
+    ledger.record_transfer('p2', 'u2', status='exists')
+    assert ledger.export(str(tmp_path / 'out.jsonl')) == 2
+    rows = [json.loads(line) for line in (tmp_path / 'out.jsonl').read_text(encoding='utf-8').splitlines()]
+    assert [(row['pwd_id'], row['status']) for row in rows] == [('p1', 'saved'), ('p2', 'exists')]
+    assert ledger.export(str(tmp_path / 'out.csv')) == 2
+    assert (tmp_path / 'out.csv').read_text(encoding='utf-8').splitlines()[0].startswith('pwd_id,kind,url')
+    ledger.close()
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import time
+
+import pytest
+
+from limiter import (TokenBucket, AdaptiveRateLimiter, BandwidthLimiter, HostRateLimiter, parse_rate,
+                     parse_schedule)
+
+
+def elapsed(coro_factory) -> float:
+    start = time.monotonic()
+    asyncio.run(coro_factory())
+    return time.monotonic() - start
+
+
+def test_token_bucket_rate():
+    # 容量 1、每秒 20 个令牌：第一个立即通过，其余 10 个每个等待 0.05 秒
+    bucket = TokenBucket(20, capacity=1)
+
+    async def main():
+        for _ in range(11):
+            await bucket.acquire()
+
+    assert 0.45 <= elapsed(main) < 0.9
+
+
+def test_token_bucket_concurrent_waiters_are_serialized():
+    # 并发申请按先后顺序排队，总耗时与逐个申请相同
+    bucket = TokenBucket(20, capacity=1)
+
+    async def main():
+        await asyncio.gather(*(bucket.acquire() for _ in range(11)))
+
+    assert 0.45 <= elapsed(main) < 0.9
+
+
+def test_token_bucket_unlimited_and_burst():
+    bucket = TokenBucket(0)
+
+    async def unlimited():
+        for _ in range(1000):
+            await bucket.acquire()
+
+    assert elapsed(unlimited) < 0.1
+    burst = TokenBucket(10, capacity=5)
+
+    async def within_burst():
+        for _ in range(5):
+            await burst.acquire()
+
+    assert elapsed(within_burst) < 0.05
+
+
+def test_host_rate_limiter_buckets_per_host():
+    limiter = HostRateLimiter(5)
+    assert limiter.bucket('https://a.example/x') is limiter.bucket('https://a.example/y')
+    assert limiter.bucket('https://a.example/x') is not limiter.bucket('https://b.example/x')
+
+
+def test_adaptive_rate_limiter():
+    limiter = AdaptiveRateLimiter(2, min_rate=0.5, increase=0.25)
+    limiter.on_throttle()
+    assert limiter.rate == 1
+    limiter.on_throttle()
+    limiter.on_throttle()
+    assert limiter.rate == 0.5
+    for _ in range(20):
+        limiter.on_success()
+    assert limiter.rate == 2
+    unlimited = AdaptiveRateLimiter(0)
+    unlimited.on_throttle()
+    assert unlimited.rate == 0
+
+
+def test_bandwidth_limiter_global_and_per_file():
+    # 全局 1MB/s、突发 256KB：消耗 768KB 约需 0.5 秒
+    limiter = BandwidthLimiter(rate=1024 * 1024)
+
+    async def consume_global():
+        for _ in range(12):
+            await limiter.consume(64 * 1024)
+
+    assert 0.4 <= elapsed(consume_global) < 0.9
+    # 单文件 512KB/s、突发 128KB：消耗 384KB 约需 0.5 秒，全局不限速
+    per_file = BandwidthLimiter(per_file=512 * 1024)
+
+    async def consume_file():
+        with per_file.transfer() as bucket:
+            assert bucket in per_file.transfers
+            for _ in range(6):
+                await per_file.consume(64 * 1024, bucket)
+        assert not per_file.transfers
+
+    assert 0.4 <= elapsed(consume_file) < 0.9
+
+
+def test_bandwidth_limiter_runtime_changes():
+    limiter = BandwidthLimiter(rate=0, per_file=1000)
+    with limiter.transfer() as bucket:
+        limiter.set_per_file_rate(2000)
+        assert bucket.rate == 2000
+    limiter.set_rate(4096)
+    assert limiter.bucket.rate == 4096
+
+
+def test_parse_rate():
+    assert parse_rate('10M') == 10 * 1024 * 1024
+    assert parse_rate('512k') == 512 * 1024
+    assert parse_rate('1.5MB/s') == 1.5 * 1024 * 1024
+    assert parse_rate('2000000') == 2000000
+    assert parse_rate('') == 0 and parse_rate(None) == 0 and parse_rate(3) == 3
+    with pytest.raises(ValueError):
+        parse_rate('fast')
+
+
+def test_schedule_windows():
+    schedule = parse_schedule('09:00-18:00=5M, 23:00-07:00=0')
+    assert schedule == [(540, 1080, 5 * 1024 * 1024), (1380, 420, 0)]
+    limiter = BandwidthLimiter(rate=1024, schedule=schedule)
+
+    def at(hour: int, minute: int = 0) -> float:
+        return limiter.current_rate(time.struct_time((2024, 1, 1, hour, minute, 0, 0, 1, -1)))
+
+    assert at(9) == 5 * 1024 * 1024 and at(17, 59) == 5 * 1024 * 1024
+    assert at(18) == 1024
+    # 跨过零点的时段
+    assert at(23, 30) == 0 and at(3) == 0 and at(7) == 1024
+    with pytest.raises(ValueError):
+        parse_schedule('9-18=5M')
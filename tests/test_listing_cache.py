@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from listing_cache import ListingCache
+from quark import QuarkPanFileManager
+
+
+def test_ttl_and_updated_at(tmp_path, monkeypatch):
+    cache = ListingCache(str(tmp_path / 'cache.db'), ttl=60)
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now)
+    cache.put('a', [{'fid': '1'}])
+    cache.put('b', [{'fid': '2'}], updated_at=100)
+    assert cache.get('a') == [{'fid': '1'}]
+    monkeypatch.setattr(time, 'time', lambda: now + 61)
+    assert cache.get('a') is None
+    # 已知 updated_at 时只看是否变化，不受 ttl 限制
+    assert cache.get('b', updated_at=100) == [{'fid': '2'}]
+    assert cache.get('b', updated_at=101) is None
+    cache.close()
+
+
+def test_evicts_least_recently_accessed(tmp_path, monkeypatch):
+    cache = ListingCache(str(tmp_path / 'cache.db'), max_entries=2)
+    clock = [1000.0]
+    monkeypatch.setattr(time, 'time', lambda: clock[0])
+    for key in ('a', 'b'):
+        clock[0] += 1
+        cache.put(key, key)
+    clock[0] += 1
+    assert cache.get('a') == 'a'
+    clock[0] += 1
+    cache.put('c', 'c')
+    assert cache.get('b') is None
+    assert cache.get('a') == 'a' and cache.get('c') == 'c'
+    cache.close()
+
+
+def test_invalidate_prefix(tmp_path):
+    cache = ListingCache(str(tmp_path / 'cache.db'))
+    for key in ('sort:1', 'sort:2', 'share:1'):
+        cache.put(key, key)
+    assert cache.invalidate('sort:') == 2
+    assert cache.get('share:1') == 'share:1'
+    assert cache.invalidate() == 1
+    cache.close()
+
+
+def test_manager_cache_keys_are_per_account(workdir):
+    # 会话校验完成前 user 仍是默认值，缓存键不能依赖它
+    first = QuarkPanFileManager(cookies='a=1', listing_cache_ttl=0, use_ledger=False, use_journal=False)
+    second = QuarkPanFileManager(cookies='a=2', listing_cache_ttl=0, use_ledger=False, use_journal=False)
+    assert first.user == second.user
+    key = first.cache_key('sort', '0')
+    assert key != second.cache_key('sort', '0')
+    first.user = 'nickname'
+    assert first.cache_key('sort', '0') == key
+    assert key.startswith(first.cache_key('')) and key.endswith(':sort:0')
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+import httpx
+import pytest
+
+from metrics import METRICS, Histogram, Metrics
+from quark import QuarkApiError, QuarkPanFileManager
+
+
+def make_manager() -> QuarkPanFileManager:
+    manager = QuarkPanFileManager(cookies='mock=1', listing_cache_ttl=0, use_ledger=False, use_journal=False)
+    METRICS.remove_collector(manager.collect_metrics)
+    manager.metrics = Metrics()
+    return manager
+
+
+def test_collector_survives_repeated_async_with(workdir):
+    # 菜单每次操作都 async with 一次管理器，之后导出的指标中仍有等待中的任务数
+    manager = make_manager()
+
+    async def action() -> None:
+        async with manager:
+            pass
+
+    for _ in range(2):
+        asyncio.run(action())
+        assert manager.collect_metrics not in manager.metrics.collectors
+        asyncio.run(manager.__aenter__())
+        assert manager.metrics.collectors.count(manager.collect_metrics) == 1
+        snapshot = manager.metrics.snapshot()
+        assert any(gauge['name'] == 'quark_task_waiter_pending' for gauge in snapshot['gauges'])
+
+
+def test_check_response_counts_errors_on_own_metrics(workdir):
+    manager = make_manager()
+    before = dict(METRICS.counters)
+    with pytest.raises(QuarkApiError) as error:
+        manager.check_response(httpx.Response(429))
+    assert error.value.throttled
+    with pytest.raises(QuarkApiError):
+        manager.check_response(httpx.Response(200, json={'code': 41004, 'message': 'not found'}))
+    assert manager.metrics.counters[('quark_api_errors_total', (('code', '429'),))] == 1
+    assert manager.metrics.counters[('quark_api_errors_total', (('code', '41004'),))] == 1
+    assert METRICS.counters == before
+
+
+def test_histogram_and_prometheus_output():
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5):
+        histogram.observe(value)
+    assert histogram.cumulative() == [('0.1', 1), ('1.0', 3), ('+Inf', 4)]
+    assert histogram.quantile(0.5) == 1.0
+    metrics = Metrics()
+    metrics.inc('quark_requests_total', endpoint='/a"b')
+    metrics.set_gauge('quark_queue_depth', 3)
+    text = metrics.to_prometheus()
+    assert '# TYPE quark_requests_total counter' in text
+    assert 'quark_requests_total{endpoint="/a\\"b"} 1' in text
+    assert 'quark_queue_depth 3' in text
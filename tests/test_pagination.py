@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+from typing import Any, Dict, List
+
+from bench_suite import build_manager
+from mock_server import MockQuarkServer
+from pagination import fetch_all_pages, iter_pages
+
+
+class Pages:
+    # 共 total 条，服务端每页 size 条；页码越小响应越慢，用于检查按页码顺序返回
+    def __init__(self, total: int, size: int) -> None:
+        self.total: int = total
+        self.size: int = size
+        self.requested: List[int] = []
+        self.active: int = 0
+        self.max_active: int = 0
+
+    async def fetch_page(self, page: int) -> Dict[str, Any]:
+        self.requested.append(page)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(0.001 * (20 - page % 20))
+        finally:
+            self.active -= 1
+        items = list(range((page - 1) * self.size, min(page * self.size, self.total)))
+        return {'data': {'list': items}, 'metadata': {'_total': self.total, '_size': self.size, '_page': page}}
+
+
+def items_of(pages: List[Dict[str, Any]]) -> List[int]:
+    return [item for page in pages for item in page['data']['list']]
+
+
+def test_fetch_all_pages_in_order_with_bounded_concurrency():
+    pages = Pages(total=95, size=10)
+    result = asyncio.run(fetch_all_pages(pages.fetch_page, concurrency=3))
+    assert items_of(result) == list(range(95))
+    assert sorted(pages.requested) == list(range(1, 11))
+    assert 1 < pages.max_active <= 3
+
+
+def test_single_page_is_fetched_once():
+    pages = Pages(total=5, size=10)
+    assert items_of(asyncio.run(fetch_all_pages(pages.fetch_page))) == list(range(5))
+    assert pages.requested == [1]
+    pages = Pages(total=0, size=10)
+    assert items_of(asyncio.run(fetch_all_pages(pages.fetch_page))) == []
+
+
+def test_iter_pages_prefetches_a_bounded_window():
+    pages = Pages(total=200, size=10)
+
+    async def main() -> List[int]:
+        items = []
+        async for page in iter_pages(pages.fetch_page, concurrency=4):
+            items.extend(page['data']['list'])
+            # 第一页之外最多预取 concurrency 页
+            assert len(pages.requested) <= page['metadata']['_page'] + 4
+        return items
+
+    assert asyncio.run(main()) == list(range(200))
+    assert pages.max_active <= 4
+
+
+def test_iter_pages_stops_fetching_when_consumer_stops():
+    pages = Pages(total=200, size=10)
+
+    async def main() -> None:
+        async for page in iter_pages(pages.fetch_page, concurrency=4):
+            if page['metadata']['_page'] == 3:
+                break
+        await asyncio.sleep(0.05)
+
+    asyncio.run(main())
+    # 提前退出后取消预取中的请求，不再请求后续页
+    assert max(pages.requested) <= 3 + 4
+    assert pages.active == 0
+
+
+def test_manager_lists_every_page_when_server_caps_page_size(workdir):
+    # 服务端每页最多返回 7 条，少于请求的 100 条，页数按服务端返回的 _size 计算
+    async def main() -> None:
+        async with MockQuarkServer(tree=(1, 0, 30), page_limit=7) as server:
+            async with build_manager(server) as manager:
+                names = [item['file_name'] for item in await manager.get_all_sorted_file_list('0')]
+                assert names == [f'file_0_{n}.bin' for n in range(30)]
+                assert server.hits['/1/clouddrive/file/sort'] == 5
+
+                stoken = await manager.get_stoken('mockpages')
+                _, entries = await manager.get_detail('mockpages', stoken, use_cache=False)
+                assert [entry['file_name'] for entry in entries] == names
+
+    asyncio.run(main())
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+
+import pytest
+
+from result_writer import ResultWriter, result_path
+
+FIELDS = ['url', 'status']
+
+
+def test_append_keeps_previous_lines(tmp_path):
+    path = str(tmp_path / 'out.txt')
+
+    async def run(records) -> None:
+        async with ResultWriter(path, FIELDS, flush_size=2) as writer:
+            for record in records:
+                writer.write(record)
+
+    asyncio.run(run([{'url': 'a', 'status': 'ok'}]))
+    asyncio.run(run([{'url': 'b', 'status': 'failed'}, {'url': 'c'}]))
+    assert (tmp_path / 'out.txt').read_text(encoding='utf-8') == 'a | ok\nb | failed\nc | \n'
+
+
+def test_csv_header_written_once(tmp_path):
+    path = str(tmp_path / 'out.csv')
+
+    async def run(url: str) -> None:
+        async with ResultWriter(path, FIELDS, fmt='csv') as writer:
+            writer.write({'url': url, 'status': 'a,b'})
+
+    asyncio.run(run('x'))
+    asyncio.run(run('y'))
+    assert (tmp_path / 'out.csv').read_text(encoding='utf-8') == 'url,status\nx,"a,b"\ny,"a,b"\n'
+
+
+def test_replace_is_committed_only_on_success(tmp_path):
+    # 重试时以 retry.txt 为输入，中途中断不能丢失尚未重试的条目
+    path = tmp_path / 'retry.txt'
+    path.write_text('old | failed\n', encoding='utf-8')
+
+    async def interrupted() -> None:
+        async with ResultWriter(str(path), FIELDS, append=False, flush_size=1) as writer:
+            writer.write({'url': 'new', 'status': 'failed'})
+            await writer.flush()
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        asyncio.run(interrupted())
+    assert path.read_text(encoding='utf-8') == 'old | failed\n'
+    assert not (tmp_path / 'retry.txt.tmp').exists()
+
+    async def finished() -> None:
+        async with ResultWriter(str(path), FIELDS, append=False) as writer:
+            writer.write({'url': 'new', 'status': 'failed'})
+
+    asyncio.run(finished())
+    assert path.read_text(encoding='utf-8') == 'new | failed\n'
+
+
+def test_rewrite_and_jsonl(tmp_path):
+    path = str(tmp_path / 'out.jsonl')
+
+    async def main() -> None:
+        async with ResultWriter(path, FIELDS, fmt='jsonl') as writer:
+            writer.write({'url': 'a', 'status': 'ok'})
+            await writer.flush()
+            assert await writer.rewrite([{'url': 'b', 'status': 'ok'}]) == 1
+            writer.write({'url': 'c', 'status': 'ok'})
+
+    asyncio.run(main())
+    lines = (tmp_path / 'out.jsonl').read_text(encoding='utf-8').splitlines()
+    assert [json.loads(line)['url'] for line in lines] == ['b', 'c']
+
+
+def test_result_path_and_closed_writer(tmp_path):
+    assert result_path('share/share_url.txt', 'csv') == 'share/share_url.csv'
+
+    async def main() -> None:
+        writer = ResultWriter(str(tmp_path / 'out.txt'), FIELDS)
+        await writer.open()
+        await writer.close()
+        with pytest.raises(RuntimeError):
+            writer.write({'url': 'a'})
+
+    asyncio.run(main())
+    with pytest.raises(ValueError):
+        ResultWriter(str(tmp_path / 'out.xml'), FIELDS, fmt='xml')
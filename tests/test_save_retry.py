@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+from typing import Any, Dict, List, Union
+
+from bench_suite import build_manager
+from ledger import TransferLedger
+from mock_server import MockQuarkServer
+
+SAVE_PATH = '/1/clouddrive/share/sharepage/save'
+TASK_PATH = '/1/clouddrive/task'
+URL = 'https://pan.quark.cn/s/mockretry'
+
+
+def run_twice(workdir, fail_first: Union[int, None] = None, task_delay: float = 0.0,
+              timeout: float = 60.0) -> List[Any]:
+    # 第一次运行时包含第 fail_first 个文件的批次转存失败，第二次运行全部成功；
+    # 返回两次运行的 (结果, 提交的 fid 列表)
+    async def main() -> List[Any]:
+        async with MockQuarkServer(tree=(1, 0, 25), task_delay=task_delay) as server:
+            handle_save = server.routes[SAVE_PATH]
+            fail_fid = server.files()[fail_first]['fid'] if fail_first is not None else None
+            submitted: List[List[str]] = []
+            failing = [True]
+
+            def save(method: str, query: Dict[str, str], body: bytes):
+                fids = json.loads(body)['fid_list']
+                submitted.append(fids)
+                if failing[0] and fail_fid in fids:
+                    return server.error(41099, 'mock save failed')
+                return handle_save(method, query, body)
+
+            server.routes[SAVE_PATH] = save
+            results = []
+            for _ in range(2):
+                async with build_manager(server) as manager:
+                    manager.ledger = TransferLedger(str(workdir / 'ledger.db'))
+                    manager.save_batch_size = 10
+                    manager.task_waiter.timeout = timeout
+                    results.append((await manager.run(URL, folder_id='0'), list(submitted)))
+                    manager.ledger.close()
+                submitted.clear()
+                failing[0] = False
+                server.task_delay = 0.0
+            return results
+
+    return asyncio.run(main())
+
+
+def test_retry_submits_only_failed_batch(workdir):
+    (first, first_submitted), (second, second_submitted) = run_twice(workdir, fail_first=12)
+    assert first['status'] == 'failed'
+    assert sorted(len(fids) for fids in first_submitted) == [5, 10, 10]
+    assert second['status'] == 'saved'
+    # 第二批（第 10-19 个文件）失败，重试时只提交这一批
+    assert len(second_submitted) == 1 and len(second_submitted[0]) == 10
+    assert TransferLedger(str(workdir / 'ledger.db')).saved_items(first['pwd_id'], '0') == {}
+
+
+def test_throttled_task_poll_keeps_waiting(workdir):
+    # 查询任务时偶尔返回 429 不算转存失败
+    async def main() -> Dict[str, Any]:
+        async with MockQuarkServer(tree=(1, 0, 4)) as server:
+            handle_task = server.routes[TASK_PATH]
+            polls = [0]
+
+            def task(method: str, query: Dict[str, str], body: bytes):
+                polls[0] += 1
+                if polls[0] == 1:
+                    return 429, {'status': 429, 'code': 429, 'message': 'too many requests'}, {}
+                return handle_task(method, query, body)
+
+            server.routes[TASK_PATH] = task
+            async with build_manager(server) as manager:
+                manager.task_waiter.initial_delay = 0.01
+                return await manager.run(URL, folder_id='0')
+
+    assert asyncio.run(main())['status'] == 'saved'
+
+
+def test_timed_out_task_is_not_resubmitted(workdir):
+    # 等待超时但服务端随后完成的任务，重试时查询结果而不是重新提交
+    (first, first_submitted), (second, second_submitted) = run_twice(workdir, task_delay=0.3, timeout=0.05)
+    assert first['status'] == 'failed' and len(first_submitted) == 3
+    assert second['status'] == 'saved'
+    assert second_submitted == []
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import os
+from typing import Any, Dict, List
+
+import pytest
+
+from bench_suite import build_manager
+from mock_server import FileBody, MockQuarkServer
+from sync import MANIFEST_NAME, SyncError, SyncManifest, sync
+
+
+def mirror_files(local_dir) -> Dict[str, bytes]:
+    result = {}
+    for folder, _, names in os.walk(local_dir):
+        for name in names:
+            # 清单及其 -wal、-shm 文件不属于镜像内容
+            if not name.startswith(MANIFEST_NAME):
+                path = os.path.join(folder, name)
+                with open(path, 'rb') as f:
+                    result[os.path.relpath(path, local_dir).replace(os.sep, '/')] = f.read()
+    return result
+
+
+def expected_files(server: MockQuarkServer) -> Dict[str, bytes]:
+    result = {}
+    for node in server.files():
+        parts = [node['file_name']]
+        parent = node['pdir_fid']
+        while parent != '0':
+            parts.insert(0, server.nodes[parent]['file_name'])
+            parent = server.nodes[parent]['pdir_fid']
+        result['/'.join(parts)] = FileBody.content(node['fid'], node['size'])
+    return result
+
+
+async def run_sync(server: MockQuarkServer, local_dir, source: str = '0', **kwargs: Any):
+    # 返回 (计数, 事件列表)
+    events: List[Dict[str, Any]] = []
+    async with build_manager(server) as manager:
+        counts = await sync(manager, source, str(local_dir), on_event=events.append, **kwargs)
+    return counts, events
+
+
+def test_sync_mirrors_and_then_skips_unchanged(workdir):
+    async def main() -> None:
+        async with MockQuarkServer(tree=(2, 2, 2)) as server:
+            local_dir = workdir / 'mirror'
+            counts, events = await run_sync(server, local_dir)
+            assert counts['new'] == counts['downloaded'] == 6 and counts['failed'] == 0
+            assert sorted(event['path'] for event in events) == sorted(expected_files(server))
+            assert mirror_files(local_dir) == expected_files(server)
+
+            server.reset_counters()
+            counts, events = await run_sync(server, local_dir)
+            # 第二次同步没有任何变化，不请求下载地址也不下载文件
+            assert counts['unchanged'] == 6 and counts['downloaded'] == 0 and events == []
+            assert '/1/clouddrive/file/download' not in server.hits and '/dl' not in server.hits
+
+    asyncio.run(main())
+
+
+def test_sync_detects_changed_missing_and_stale_files(workdir):
+    async def main() -> None:
+        async with MockQuarkServer(tree=(1, 0, 4)) as server:
+            local_dir = workdir / 'mirror'
+            await run_sync(server, local_dir)
+            changed, missing, removed, _ = server.files()
+            # 远端修改一个文件、删除一个文件，本地删除一个文件
+            changed['size'] = 2048
+            changed['updated_at'] += 1000
+            server.children['0'].remove(removed['fid'])
+            del server.nodes[removed['fid']]
+            os.remove(local_dir / missing['file_name'])
+
+            counts, events = await run_sync(server, local_dir, dry_run=True)
+            actions = {event['path']: event['action'] for event in events}
+            assert actions == {changed['file_name']: 'changed', missing['file_name']: 'missing',
+                               removed['file_name']: 'stale'}
+            # 试运行不改动本地目录
+            assert not (local_dir / missing['file_name']).exists()
+            assert (local_dir / removed['file_name']).exists()
+
+            counts, _ = await run_sync(server, local_dir)
+            assert counts['downloaded'] == 2 and counts['stale'] == 1 and counts['deleted'] == 0
+            assert (local_dir / removed['file_name']).exists()
+
+            counts, events = await run_sync(server, local_dir, delete=True)
+            assert [(event['action'], event['path']) for event in events] == [('deleted', removed['file_name'])]
+            assert mirror_files(local_dir) == expected_files(server)
+
+    asyncio.run(main())
+
+
+def test_local_dir_is_bound_to_one_source(workdir):
+    async def main() -> None:
+        async with MockQuarkServer(tree=(1, 0, 1)) as server:
+            local_dir = workdir / 'mirror'
+            await run_sync(server, local_dir)
+            with pytest.raises(SyncError):
+                await run_sync(server, local_dir, source='https://pan.quark.cn/s/other')
+
+    asyncio.run(main())
+
+
+def test_manifest_tracks_seen_paths(tmp_path):
+    manifest = SyncManifest(str(tmp_path / MANIFEST_NAME))
+    manifest.record('a.bin', 'f1', 10, 1, 'run1')
+    manifest.record('b/c.bin', 'f2', 20, 2, 'run1')
+    manifest.mark_seen(['a.bin'], 'run2')
+    assert [row['path'] for row in manifest.stale('run2')] == ['b/c.bin']
+    manifest.remove('b/c.bin')
+    assert list(manifest.stale('run2')) == []
+    assert manifest.get('a.bin')['fid'] == 'f1'
+    manifest.set_meta('source', '0')
+    manifest.close()
+
+    manifest = SyncManifest(str(tmp_path / MANIFEST_NAME))
+    assert manifest.get_meta('source') == '0' and manifest.get_meta('other') is None
+    manifest.close()
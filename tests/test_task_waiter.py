@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+from typing import Any, Dict, List
+
+import httpx
+import pytest
+
+from task_waiter import TaskWaiter, TaskTimeoutError
+
+
+class Throttled(Exception):
+    pass
+
+
+class FakeTasks:
+    # 每个任务查询 polls 次后完成；记录同时在途的查询数
+    def __init__(self, polls: int = 2, delay: float = 0.0) -> None:
+        self.polls: int = polls
+        self.delay: float = delay
+        self.calls: Dict[str, int] = {}
+        self.inflight: int = 0
+        self.max_inflight: int = 0
+
+    async def fetch(self, task_id: str, retry_index: int) -> Dict[str, Any]:
+        self.inflight += 1
+        self.max_inflight = max(self.max_inflight, self.inflight)
+        try:
+            await asyncio.sleep(self.delay)
+            self.calls[task_id] = self.calls.get(task_id, 0) + 1
+            if task_id.startswith('bad'):
+                raise ValueError(task_id)
+            if task_id.startswith('flaky') and self.calls[task_id] == 1:
+                raise httpx.ConnectError('reset')
+            if task_id.startswith('throttled') and self.calls[task_id] <= 2:
+                raise Throttled(task_id)
+            status = 2 if self.calls[task_id] >= self.polls and not task_id.startswith('slow') else 1
+            return {'data': {'task_id': task_id, 'status': status}}
+        finally:
+            self.inflight -= 1
+
+
+def make_waiter(tasks: FakeTasks, **kwargs: Any) -> TaskWaiter:
+    options = dict(initial_delay=0.01, max_delay=0.02, jitter=0.0, timeout=2.0)
+    options.update(kwargs)
+    return TaskWaiter(tasks.fetch, lambda json_data: json_data['data']['status'] == 2, **options)
+
+
+def test_wait_many_shares_one_poller_and_limits_inflight():
+    tasks = FakeTasks(polls=3, delay=0.01)
+    waiter = make_waiter(tasks, max_inflight=2)
+
+    async def main() -> List[Any]:
+        return await waiter.wait_many([f't{n}' for n in range(6)])
+
+    results = asyncio.run(main())
+    assert [result['data']['task_id'] for result in results] == [f't{n}' for n in range(6)]
+    assert all(count == 3 for count in tasks.calls.values())
+    assert tasks.max_inflight <= 2
+    assert not waiter.pending
+
+
+def test_errors_are_returned_per_task():
+    tasks = FakeTasks(polls=1)
+    waiter = make_waiter(tasks)
+
+    async def main() -> List[Any]:
+        return await waiter.wait_many(['ok', 'bad', 'flaky', 'slow'], timeout=0.2)
+
+    ok, bad, flaky, slow = asyncio.run(main())
+    assert ok['data']['status'] == 2
+    assert isinstance(bad, ValueError)
+    # 网络错误视为未完成，下一次查询成功
+    assert flaky['data']['status'] == 2 and tasks.calls['flaky'] == 2
+    assert isinstance(slow, TaskTimeoutError)
+
+
+def test_retryable_errors_keep_polling():
+    tasks = FakeTasks(polls=1)
+    waiter = make_waiter(tasks, retryable=lambda e: isinstance(e, Throttled))
+
+    async def main() -> List[Any]:
+        return await waiter.wait_many(['throttled', 'bad'])
+
+    throttled, bad = asyncio.run(main())
+    assert throttled['data']['status'] == 2 and tasks.calls['throttled'] == 3
+    assert isinstance(bad, ValueError)
+    # 没有 retryable 时被限流直接结束等待
+    plain = make_waiter(FakeTasks(polls=1))
+    assert isinstance(asyncio.run(plain.wait_many(['throttled']))[0], Throttled)
+
+
+def test_same_task_is_polled_once():
+    tasks = FakeTasks(polls=2)
+    waiter = make_waiter(tasks)
+
+    async def main() -> List[Any]:
+        return await asyncio.gather(waiter.wait('t'), waiter.wait('t'))
+
+    first, second = asyncio.run(main())
+    assert first == second and tasks.calls['t'] == 2
+
+
+def test_reused_across_event_loops():
+    # 菜单每次操作都新建事件循环，上一个循环中未完成的等待不能影响下一次
+    tasks = FakeTasks(polls=3)
+    waiter = make_waiter(tasks)
+
+    async def abandon() -> None:
+        # 返回时等待仍未完成，asyncio.run 结束时连同轮询任务一起取消
+        asyncio.create_task(waiter.wait('t'))
+        await asyncio.sleep(0.005)
+
+    asyncio.run(abandon())
+    assert 't' in waiter.pending
+
+    async def main() -> Any:
+        return await asyncio.wait_for(waiter.wait('t'), timeout=1)
+
+    assert asyncio.run(main())['data']['status'] == 2
+    assert not waiter.pending
+
+
+def test_timeout():
+    waiter = make_waiter(FakeTasks())
+
+    async def main() -> Any:
+        return await waiter.wait('slow', timeout=0.05)
+
+    with pytest.raises(TaskTimeoutError):
+        asyncio.run(main())
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+from typing import Any, Dict, List, Union
+
+import pytest
+
+from walker import walk_folders, walk_tree
+
+
+def make_tree(depth: int, dirs: int, files: int) -> Dict[str, List[Dict[str, Any]]]:
+    # 文件夹ID -> 条目列表，文件夹的ID即其相对路径
+    tree: Dict[str, List[Dict[str, Any]]] = {}
+
+    def build(fid: str, level: int) -> None:
+        entries = [{'fid': f'{fid}/f{n}', 'file_name': f'f{n}', 'dir': False} for n in range(files)]
+        if level < depth:
+            for n in range(dirs):
+                child = f'{fid}/d{n}'
+                entries.append({'fid': child, 'file_name': f'd{n}', 'dir': True, 'updated_at': level})
+                build(child, level + 1)
+        tree[fid] = entries
+
+    build('root', 1)
+    return tree
+
+
+class Lister:
+    def __init__(self, tree: Dict[str, List[Dict[str, Any]]], fail: str = '') -> None:
+        self.tree = tree
+        self.fail: str = fail
+        self.listed: List[str] = []
+
+    async def __call__(self, fid: str, updated_at: Union[int, None]) -> List[Dict[str, Any]]:
+        await asyncio.sleep(0)
+        if fid == self.fail:
+            raise RuntimeError(fid)
+        self.listed.append(fid)
+        return self.tree[fid]
+
+
+def collect(lister: Lister, **kwargs: Any) -> List[Any]:
+    async def main() -> List[Any]:
+        return [item async for item in walk_tree(lister, [('root', '', None)], **kwargs)]
+
+    return asyncio.run(main())
+
+
+def test_walks_every_entry_with_relative_paths():
+    tree = make_tree(3, 3, 2)
+    lister = Lister(tree)
+    items = collect(lister, workers=4)
+    assert len(items) == sum(len(entries) for entries in tree.values())
+    assert sorted(lister.listed) == sorted(tree)
+    paths = {(path, item['file_name']) for path, item in items}
+    assert ('', 'd0') in paths and ('d0', 'f1') in paths and ('d2/d1', 'f0') in paths
+
+
+def test_max_depth_and_expand():
+    tree = make_tree(3, 2, 1)
+    items = collect(Lister(tree), max_depth=1)
+    assert {path for path, _ in items} == {''}
+
+    async def folders() -> List[Any]:
+        # 只展开根文件夹与 d0，d1 本身会列出，但其子文件夹不再遍历
+        expand = lambda path, folder, entries: folder is None or path == 'd0'  # noqa: E731
+        return [item async for item in walk_folders(Lister(tree), [('root', '', None)], expand=expand)]
+
+    listed = sorted((path, depth) for path, depth, _, _ in asyncio.run(folders()))
+    assert listed == [('', 1), ('d0', 2), ('d0/d0', 3), ('d0/d1', 3), ('d1', 2)]
+
+
+def test_error_is_raised_and_workers_stop():
+    lister = Lister(make_tree(3, 3, 1), fail='root/d1')
+    with pytest.raises(RuntimeError, match='root/d1'):
+        collect(lister, workers=2)
+
+
+def test_slow_consumer_bounds_listing():
+    # 调用方不取结果时 worker 不会把整棵树都列出来
+    tree = make_tree(4, 4, 0)
+    lister = Lister(tree)
+
+    async def main() -> None:
+        folders = walk_folders(lister, [('root', '', None)], workers=2)
+        await anext(folders)
+        await asyncio.sleep(0.05)
+        await folders.aclose()
+
+    asyncio.run(main())
+    assert len(lister.listed) < 10 < len(tree)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import posixpath
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Tuple, Union
+
+ListDir = Callable[[str, Union[int, None]], Awaitable[List[Dict[str, Any]]]]
+
+_DONE = object()
+
+
+class _WalkError:
+    def __init__(self, error: BaseException) -> None:
+        self.error: BaseException = error
+
+
+# 是否继续遍历某个文件夹的子文件夹，参数为 (文件夹相对路径, 文件夹条目, 文件夹内的条目)，根文件夹的条目为 None
+Expand = Callable[[str, Union[Dict[str, Any], None], List[Dict[str, Any]]], bool]
+
+
+async def walk_folders(list_dir: ListDir, roots: List[Tuple[str, str, Union[int, None]]], workers: int = 8,
+                       max_depth: Union[int, None] = None, expand: Union[Expand, None] = None
+                       ) -> AsyncIterator[Tuple[str, int, Union[Dict[str, Any], None], List[Dict[str, Any]]]]:
+    # 并发广度优先遍历目录树，roots 为 (文件夹ID, 相对路径, updated_at) 列表，list_dir 收到文件夹ID与 updated_at
+    # 每列出一个文件夹产出一次 (文件夹相对路径, 深度, 文件夹条目, 文件夹内的条目)，根文件夹深度为 1、条目为 None；
+    # 子文件夹在产出的同时加入共享的待遍历队列，空闲的 worker 随时取走，宽而深的目录树也能并行遍历
+    pending: asyncio.Queue = asyncio.Queue()
+    # 调用方处理不过来时 worker 在这里等待，已列出但未取走的文件夹不会无限堆积
+    output: asyncio.Queue = asyncio.Queue(maxsize=workers * 2)
+    unfinished = 0
+
+    def enqueue(fid: str, path: str, depth: int, updated_at: Union[int, None],
+                folder: Union[Dict[str, Any], None]) -> None:
+        nonlocal unfinished
+        unfinished += 1
+        pending.put_nowait((fid, path, depth, updated_at, folder))
+
+    async def worker() -> None:
+        nonlocal unfinished
+        while True:
+            fid, path, depth, updated_at, folder = await pending.get()
+            try:
+                entries = await list_dir(fid, updated_at)
+                if (max_depth is None or depth < max_depth) and (expand is None or expand(path, folder, entries)):
+                    for entry in entries:
+                        if entry['dir']:
+                            enqueue(entry['fid'], posixpath.join(path, entry['file_name']), depth + 1,
+                                    entry.get('updated_at'), entry)
+                await output.put((path, depth, folder, entries))
+            except Exception as e:
+                await output.put(_WalkError(e))
+            unfinished -= 1
+            if unfinished == 0:
+                await output.put(_DONE)
+
+    for fid, path, updated_at in roots:
+        enqueue(fid, path, 1, updated_at, None)
+    if not unfinished:
+        return
+
+    tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+    try:
+        while True:
+            item = await output.get()
+            if item is _DONE:
+                break
+            if isinstance(item, _WalkError):
+                raise item.error
+            yield item
+    finally:
+        # list_dir 内部的 gather 在子任务恰好同时完成时会吞掉取消，worker 随后阻塞在队列上，需要再次取消
+        remaining = set(tasks)
+        while remaining:
+            for task in remaining:
+                task.cancel()
+            _, remaining = await asyncio.wait(remaining, timeout=0.1)
+
+
+async def walk_tree(list_dir: ListDir, roots: List[Tuple[str, str, Union[int, None]]], workers: int = 8,
+                    max_depth: Union[int, None] = None) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    # 依次产出 (所在目录的相对路径, 条目)，遍历方式同 walk_folders
+    folders = walk_folders(list_dir, roots, workers=workers, max_depth=max_depth)
+    try:
+        async for path, _, _, entries in folders:
+            for entry in entries:
+                yield path, entry
+    finally:
+        await folders.aclose()